@@ -19,9 +19,23 @@
 __all__ = ['ListBox']
 
 import types
+import time
+import threading
+import Queue
+from bisect import bisect_left
+from heapq import heappush, heapreplace
 
+import util
 from core import Drawable
-from events import SelectionChanged, HighlightChanged
+from events import SelectionChanged, HighlightChanged, FilterResults
+from index import PrefixIndex
+from models import RingBuffer, RowModel
+
+# per-item flags kept while a batch is in progress (see ListBox.batch)
+_SELECTED = 1
+_HIGHLIGHTED = 2
+_FIRST = 4
+_SHOWN = 8
 
 class ListBox(Drawable):
     """
@@ -36,20 +50,45 @@ class ListBox(Drawable):
     Basically, whatever you do to that list (inserting, appending
     or deleting items, say) you should also do to the ListBox that
     views the list.
+
+    ListBox can also show a filtered view of its items (see
+    setFilter()). The highlight, firstVisible and the navigation
+    methods work in terms of rows of that view, while selected
+    always holds indices into items. Without a filter every item
+    is a row, and row and item indices are the same.
     """
 
-    def __init__(self, selection = 'multiple', vimlike = False, **kwargs):
+    # seconds after which a type-to-jump search starts over
+    searchTimeout = 1.0
+
+    # a background fuzzy filter reports its progress after scoring
+    # each fuzzyChunkSize items, sending the best fuzzyPreviewSize
+    # matches found so far
+    fuzzyChunkSize = 10000
+    fuzzyPreviewSize = 500
+
+    def __init__(self, selection = 'multiple', vimlike = False, search = None, **kwargs):
         """
-        ListBox takes optional parameters 'selection' and 'vimlike':
+        ListBox takes optional parameters 'selection', 'vimlike'
+        and 'search':
 
          * selection controls the selection style - 'multiple', 'single'
            or 'none'
          * vimlike: when True enables bindings for vim-like navigation:
            j/k for up/down
+         * search: 'jump' moves the highlight to the matching item
+           as the user types; 'filter' narrows the list to the items
+           beginning with what has been typed (backspace widens it
+           again); 'fuzzy' narrows it to the items containing the
+           typed characters in order, best match first (see
+           setFuzzyFilter()). in each case, typed characters take
+           precedence over the vimlike bindings, and space only
+           toggles the selection when no search is in progress
 
         Events:
          * SelectionChanged
          * HighlightChanged
+         * FilterResults
         """
         super(ListBox, self).__init__(**kwargs)
 
@@ -70,6 +109,51 @@ class ListBox(Drawable):
         # sensible defaults 
         self.firstVisible = 0
 
+        # rows which need to be redrawn (see touchRow), unless the
+        # whole ListBox does
+        self._dirtyRows = set()
+        self._fullRepaint = True
+        self._drawnFirst = None
+
+        # the rows of the filtered view, as indices into items, or
+        # None when every item is shown. filterMode is 'prefix' or
+        # 'fuzzy' while a filter is applied. subclasses may add other
+        # filters whose views are in item order, which _refilter()
+        # recomputes when the items change
+        self.view = None
+        self.filterMode = None
+        self.filterText = ''
+        self._filterRange = None
+
+        # prefix filter views are in item order; fuzzy filter views
+        # are not, and map item indices back to rows with a dict
+        self._viewOrdered = True
+        self._viewRows = None
+
+        # fuzzy filter runs: the generation of the current run, and
+        # the query and matches of the last complete one
+        self._fuzzyGeneration = 0
+        self._fuzzyThread = None
+        self._fuzzyMatches = None
+        self._fuzzyBound = False
+
+        # when maxItems is set, items is a RingBuffer which drops
+        # the oldest items to make room for new ones (see follow())
+        self.maxItems = None
+        self._follow = None
+
+        # while a batch is in progress, _marks holds the flags above
+        # for each item, and is changed along with items
+        self._marks = None
+        self._batchDepth = 0
+        self._batchChanged = False
+
+        # the type-ahead search index is built on first use
+        self._index = None
+        self.search = search
+        self.searchText = ''
+        self._searchTime = 0
+
         # set up the usual keybindings
         self.bindKey('down', self.moveDown)
         self.bindKey('up', self.moveUp)
@@ -84,6 +168,35 @@ class ListBox(Drawable):
             self.bindKey('j', self.moveDown)
             self.bindKey('k', self.moveUp)
 
+        if search is not None:
+            if search not in ('jump', 'filter', 'fuzzy'):
+                raise ValueError("search must be one of jump, filter or fuzzy")
+            self.bindPrintable(self.searchTyping)
+            self.bindKey('backspace', self.searchBackspace)
+
+    def touch(self):
+        """
+        mark the whole ListBox as needing a redraw
+        """
+        self._fullRepaint = True
+        super(ListBox, self).touch()
+
+    def touchRow(self, row):
+        """
+        mark just the given row as needing a redraw; rows which are
+        not visible are ignored
+        """
+        if self.firstVisible <= row < self.firstVisible + self.h:
+            self._dirtyRows.add(row)
+            super(ListBox, self).touch()
+
+    def touchFooter(self):
+        """
+        mark just the footer, if there is one, as needing a redraw
+        """
+        if self._footerRows():
+            super(ListBox, self).touch()
+
     def __len__(self):
         return len(self.items)
     len = property(__len__)
@@ -94,6 +207,17 @@ class ListBox(Drawable):
     def __getitem__(self, *args, **kwargs):
         return self.items.__getitem__(*args, **kwargs)
 
+    def __setitem__(self, index, item):
+        """
+        replace the item at the given index
+        """
+        if index < 0:
+            index += len(self.items)
+
+        old = self.items[index]
+        self.items[index] = item
+        self._spliced(index, [old], 1)
+
     def __contains__(self, *args, **kwargs):
         return self.items.__contains__(*args, **kwargs)
     
@@ -111,16 +235,195 @@ class ListBox(Drawable):
             str_rep = str(item)
         return str_rep
 
-    def append(self, item):
-        self.items.append(item)
+    def _searchKey(self, item):
+        """
+        the key under which item is found by type-ahead search
+        """
+        return self._get_repr(item).lower()
+
+    def _getIndex(self):
+        """
+        return the search index, building it if necessary
+        """
+        if self._index is None:
+            self._index = PrefixIndex([self._searchKey(item) for item in self.items])
+        return self._index
+
+    def _rowCount(self):
+        """
+        the number of rows in the (possibly filtered) view
+        """
+        if self.view is None:
+            return len(self.items)
+        return len(self.view)
+
+    def _itemIndex(self, row):
+        """
+        the index into items of the item shown at the given row
+        """
+        if self.view is None:
+            return row
+        return self.view[row]
+
+    def _rowOf(self, index):
+        """
+        the row at which items[index] is shown, or None if the
+        current filter hides it
+        """
+        if self.view is None:
+            return index
+
+        if self._viewOrdered:
+            row = bisect_left(self.view, index)
+            if row < len(self.view) and self.view[row] == index:
+                return row
+            return None
+
+        if self._viewRows is None:
+            self._viewRows = dict([(i, row) for (row, i) in enumerate(self.view)])
+        return self._viewRows.get(index)
+
+    def _setView(self, view, ordered = True):
+        """
+        replace the view. ordered says whether its rows are in
+        item order
+        """
+        self.view = view
+        self._viewOrdered = ordered
+        self._viewRows = None
+
+    def _spliced(self, start, removed, count):
+        """
+        bring the selection, the search index, the view and the
+        highlight up to date after the items removed from position
+        start were replaced by the count items now beginning there.
+        every method which changes items goes through here.
+
+        the highlight stays on the same item if it is still there,
+        and so does the first visible row. the ListBox is only
+        touched if the change shows on screen.
+        """
+        end = start + len(removed)
+        delta = count - len(removed)
+
+        if self._marks is not None:
+            # everything is brought up to date when the batch ends
+            self._marks[start:end] = [0] * count
+            self._batchChanged = True
+            return
+
+        # items has already changed, but the view has not
+        oldView = self.view
+        oldFirst = self.firstVisible
+        if oldView is not None:
+            current = self._highlightedIndex()
+        elif 0 <= self.highlighted < len(self.items) - delta:
+            current = self.highlighted
+        else:
+            current = None
+
+        selected = []
+        for elm in self.selected:
+            if elm is None or elm < start:
+                selected.append(elm)
+            elif elm >= end:
+                selected.append(elm + delta)
+        self.selected = selected
+
+        index = self._index
+        if index is not None and len(removed) + count > len(index) / 8 + 1:
+            # cheaper to build it again when it is next needed
+            self._index = None
+
+        elif index is not None:
+            for (offset, item) in enumerate(removed):
+                index.discard(self._searchKey(item), start + offset)
+            if start == 0:
+                # every remaining entry moves
+                index.shift(0, delta)
+            elif delta and end < len(self.items) - delta:
+                index.shift(end, delta)
+            for pos in xrange(start, start + count):
+                index.add(self._searchKey(self.items[pos]), pos)
+
+        self._fuzzyMatches = None
+
+        # whether rows came or went from the view
+        reflowed = True
+
+        if self.filterMode not in (None, 'fuzzy'):
+            if delta == 0:
+                reflowed = self._refilterItems(start, end)
+            else:
+                self._spliceView(start, end, count)
+
+        elif self.filterMode == 'fuzzy':
+            # remap the rows we have; new items are picked up by
+            # scoring everything again in the background
+            view = []
+            for i in self.view:
+                if i < start:
+                    view.append(i)
+                elif i >= end:
+                    view.append(i + delta)
+            self._setView(view, False)
+
+            if count or self._fuzzyThread is not None:
+                self._startFuzzy(self.filterText, None)
+
+        # follow the highlighted item
+        if current is not None and (current >= end or delta == 0):
+            row = self._rowOf(current + delta)
+            if row is not None:
+                self.highlighted = row
+        elif current is not None and current >= start and start < len(self.items):
+            # the highlighted item went away; highlight what replaced it
+            row = self._rowOf(start)
+            if row is not None:
+                self.highlighted = row
+
+        rows = self._rowCount()
+        if self.highlighted >= rows:
+            self.highlighted = max(0, rows - 1)
+
+        if self.view is None and oldView is None:
+            # keep the same items on screen
+            if oldFirst >= end:
+                self.firstVisible = oldFirst + delta
+            elif oldFirst > start:
+                self.firstVisible = start
+
+            if start >= oldFirst + self.h:
+                # the change is below the visible rows
+                return
+            if end <= oldFirst and current is not None and current >= end:
+                # the change is above them, and they only moved
+                return
+            if delta == 0:
+                # items were replaced in place
+                for row in xrange(start, end):
+                    self.touchRow(row)
+                return
+
+        elif delta == 0 and not reflowed and self.filterMode != 'fuzzy':
+            # items were replaced in place, and the rows which show
+            # them stayed put
+            for i in xrange(start, end):
+                row = self._rowOf(i)
+                if row is not None:
+                    self.touchRow(row)
+            return
+
         self.touch()
 
+    def append(self, item):
+        self.extend([item])
+
     def count(self, item):
         return self.items.count(item)
 
     def extend(self, other):
-        self.items.extend(other)
-        self.touch()
+        self.insertMany(len(self.items), other)
 
     def index(self, item, *args):
         """
@@ -130,51 +433,450 @@ class ListBox(Drawable):
         return self.items.index(item, *args)
 
     def insert(self, index, item):
+        self.insertMany(index, [item])
+
+    def _makeRoom(self, index, items, replacing = 0):
+        """
+        when maxItems is set, drop the oldest items so that items
+        fit when they go in at index in place of replacing items
+        already there. the new items themselves are the oldest if
+        they go in first. returns the index, which moves down by the
+        number of items dropped before it, and those of the new
+        items which fit.
+        """
+        if self.maxItems is None:
+            return index, items
+
+        overflow = len(self.items) - replacing + len(items) - self.maxItems
+        if overflow <= 0:
+            return index, items
+
+        dropped = min(overflow, index)
+        if dropped:
+            evicted = list(self.items[:dropped])
+            for i in xrange(dropped):
+                self.items.popleft()
+            self._spliced(0, evicted, 0)
+
+        return index - dropped, items[overflow - dropped:]
+
+    def insertMany(self, index, items):
+        """
+        insert all of items before the given index at once. the
+        selection, filter and highlight are brought up to date once,
+        rather than once per item as repeated insert() calls would.
+        """
+        # normalize the index the way list.insert does
+        if index < 0:
+            index = max(0, index + len(self.items))
+        elif index > len(self.items):
+            index = len(self.items)
+
+        index, items = self._makeRoom(index, list(items))
+        if not items:
+            return
+
+        if index == len(self.items):
+            self.items.extend(items)
+        else:
+            self.items[index:index] = items
+        self._spliced(index, [], len(items))
+
+    def removeMany(self, indices = None, predicate = None):
+        """
+        remove the items at the given indices, or those for which
+        predicate(item) is true, in a single pass over the items,
+        and return them in order. exactly one of indices and
+        predicate must be given.
+        """
+        if (indices is None) == (predicate is None):
+            raise ValueError("removeMany takes either indices or a predicate")
+
+        size = len(self.items)
+        if indices is not None:
+            doomed = set()
+            for i in indices:
+                if i < 0:
+                    i += size
+                if not 0 <= i < size:
+                    raise IndexError("removeMany index out of range")
+                doomed.add(i)
+            if not doomed:
+                return []
+            predicate = None
+
+        self._beginBatch()
+        try:
+            items = self.items
+            marks = self._marks
+            kept = []
+            removed = []
+            for i in xrange(size):
+                item = items[i]
+                if predicate is not None:
+                    gone = predicate(item)
+                else:
+                    gone = i in doomed
+                if gone:
+                    removed.append(item)
+                else:
+                    kept.append(i)
+
+            if removed:
+                self._takeItems(kept)
+                marks[:] = [marks[i] for i in kept]
+                self._batchChanged = True
+        finally:
+            self._endBatch()
+
+        return removed
+
+    def replaceRange(self, start, stop, items):
+        """
+        replace items[start:stop] with the given items, which need
+        not be the same in number
+        """
+        start, stop, step = slice(start, stop).indices(len(self.items))
+        stop = max(start, stop)
+
+        items = list(items)
+        moved, items = self._makeRoom(start, items, stop - start)
+        stop -= start - moved
+        start = moved
+
+        removed = list(self.items[start:stop])
+        if not removed and not items:
+            return
+
+        self.items[start:stop] = items
+        self._spliced(start, removed, len(items))
+
+    def replaceMany(self, replacements):
+        """
+        replace the items at many indices at once, given as a dict or
+        a sequence of (index, item) pairs. replaced items stay
+        selected. the filter and highlight are brought up to date
+        once, and only the rows showing those items are redrawn.
+        """
+        if isinstance(replacements, dict):
+            replacements = replacements.items()
+
+        size = len(self.items)
+        new = {}
+        for (i, item) in replacements:
+            if i < 0:
+                i += size
+            if not 0 <= i < size:
+                raise IndexError("replaceMany index out of range")
+            new[i] = item
+        if not new:
+            return
+
+        positions = sorted(new)
+        removed = []
+        for i in positions:
+            removed.append(self.items[i])
+            self.items[i] = new[i]
+        self._replaced(positions, removed)
+
+    def _replaced(self, positions, removed):
+        """
+        bring the selection, the search index, the view and the
+        highlight up to date after the items at positions (in order)
+        were replaced in place; removed are the items which were
+        there. like _spliced(), but for many scattered items at once.
+        """
+        if self._marks is not None:
+            # a replaced item stays selected and highlighted, but may
+            # no longer be shown
+            for i in positions:
+                self._marks[i] &= _SELECTED | _HIGHLIGHTED | _FIRST
+            self._batchChanged = True
+            return
+
+        current = self._highlightedIndex()
+        oldView = self.view
+
+        index = self._index
+        if index is not None and 2 * len(positions) > len(index) / 8 + 1:
+            self._index = None
+        elif index is not None:
+            for (i, item) in zip(positions, removed):
+                index.discard(self._searchKey(item), i)
+                index.add(self._searchKey(self.items[i]), i)
+
+        self._fuzzyMatches = None
+
+        reflowed = False
+        if self.filterMode not in (None, 'fuzzy'):
+            for i in positions:
+                if self._refilterItems(i, i + 1):
+                    reflowed = True
+        elif self.filterMode == 'fuzzy':
+            self._startFuzzy(self.filterText, None)
+
+        if current is not None:
+            row = self._rowOf(current)
+            if row is not None:
+                self.highlighted = row
+        rows = self._rowCount()
+        if self.highlighted >= rows:
+            self.highlighted = max(0, rows - 1)
+
+        if (self.view is None and oldView is None) or \
+               (not reflowed and self.filterMode != 'fuzzy'):
+            for i in positions:
+                row = self._rowOf(i)
+                if row is not None:
+                    self.touchRow(row)
+            return
+
+        self.touch()
+
+    def batch(self):
+        """
+        return a context manager for making many changes at once:
+
+            with listbox.batch():
+                listbox.removeMany(predicate = stale)
+                listbox.extend(fresh)
+
+        within it, each change to the items only records which items
+        are selected and highlighted. the selection, search index,
+        filter and highlight are brought up to date, and the ListBox
+        touched, once when the outermost batch ends. until then they
+        do not reflect the changes.
+        """
+        return ListBox.Batch(self)
+
+    class Batch(object):
+        """
+        context manager returned by ListBox.batch()
+        """
+        def __init__(self, listbox):
+            self.listbox = listbox
+
+        def __enter__(self):
+            self.listbox._beginBatch()
+            return self.listbox
+
+        def __exit__(self, *exc_info):
+            self.listbox._endBatch()
+            return False
+
+    def _markItems(self):
+        """
+        flag the selected, highlighted, first visible and shown items
+        """
+        marks = [0] * len(self.items)
+        for i in self.selected:
+            if i is not None and 0 <= i < len(marks):
+                marks[i] |= _SELECTED
+
+        current = self._highlightedIndex()
+        if current is not None:
+            marks[current] |= _HIGHLIGHTED
+        if self.view is None:
+            if self.firstVisible < len(marks):
+                marks[self.firstVisible] |= _FIRST
+        else:
+            for i in self.view:
+                marks[i] |= _SHOWN
+
+        return marks
+
+    def _beginBatch(self):
+        if self._batchDepth == 0:
+            self._marks = self._markItems()
+            self._batchChanged = False
+        self._batchDepth += 1
+
+    def _endBatch(self):
+        self._batchDepth -= 1
+        if self._batchDepth:
+            return
+
+        marks = self._marks
+        self._marks = None
+        if not self._batchChanged:
+            return
+
         selected = []
-        for elm in self.selected:
-            if elm >= index:
-                selected.append(elm + 1)
-            else:
-                selected.append(elm)
+        current = None
+        first = None
+        shown = []
+        for (i, m) in enumerate(marks):
+            if m:
+                if m & _SELECTED:
+                    selected.append(i)
+                if m & _HIGHLIGHTED:
+                    current = i
+                if m & _FIRST:
+                    first = i
+                if m & _SHOWN:
+                    shown.append(i)
+
+        if None in self.selected:
+            # keep the single selection placeholder
+            selected.insert(0, None)
         self.selected = selected
-        self.items.insert(index, item)
+
+        self._index = None
+        self._fuzzyMatches = None
+        if self.filterMode not in (None, 'fuzzy'):
+            self._refilter()
+        elif self.filterMode == 'fuzzy':
+            # show the surviving matches in item order until the
+            # new scores arrive
+            self._setView(shown)
+            self._startFuzzy(self.filterText, None)
+
+        row = None
+        if current is not None:
+            row = self._rowOf(current)
+        if row is None:
+            row = min(self.highlighted, max(0, self._rowCount() - 1))
+        self.highlighted = row
+
+        if self.view is None and first is not None:
+            self.firstVisible = first
 
         self.touch()
 
     def pop(self, index = None):
         """
-        pops the end of the list by default
-        todo this should return the popped item
+        pops the end of the list by default, and returns
+        the popped item
         """
         if index is None:
             index = len(self.items) - 1
-
-        if index in self.selected:
-            self.selected.remove(index)
+        elif index < 0:
+            index += len(self.items)
 
         out = self.items.pop(index)
-        self.touch()
+        self._spliced(index, [out], 0)
 
         return out
 
     def remove(self, item):
-        if self.items.index(item) in self.selected:
-            self.selected.remove(self.items.index(item))
-        self.items.remove(item)
-        self.touch()
+        self.pop(self.items.index(item))
 
     def reverse(self):
-        self.selected = [(len(self.items) - ix - 1) for ix in self.selected]
+        if self._marks is not None:
+            self.items.reverse()
+            self._marks.reverse()
+            self._batchChanged = True
+            return
+
+        last = len(self.items) - 1
+        selected = []
+        for ix in self.selected:
+            if ix is not None:
+                ix = last - ix
+            selected.append(ix)
+        self.selected = selected
         self.items.reverse()
+        self._index = None
+        self._fuzzyMatches = None
+
+        if self.filterMode not in (None, 'fuzzy'):
+            self._refilter()
+        elif self.filterMode == 'fuzzy':
+            self._setView([last - i for i in self.view], False)
+            if self._fuzzyThread is not None:
+                self._startFuzzy(self.filterText, None)
+
+        self.touch()
+
+    def _takeItems(self, indices):
+        """
+        replace items with the items at the given indices, keeping
+        the kind of sequence they are held in
+        """
+        items = self.items
+        if isinstance(items, RowModel):
+            self.items = items.take(indices)
+        elif self.maxItems is None:
+            self.items = [items[i] for i in indices]
+        else:
+            self.items = RingBuffer(self.maxItems, [items[i] for i in indices])
+
+    def _snapshot(self):
+        """
+        a copy of the items for a background thread to work on
+        """
+        if isinstance(self.items, RowModel):
+            return self.items.copy()
+        return list(self.items)
+
+    def _permute(self, order):
+        """
+        rearrange the items so that the one at order[i] moves to
+        position i. the selection and highlight stay on the same
+        items, and the highlight stays at the same place on screen.
+        """
+        self._takeItems(order)
+
+        if self._marks is not None:
+            marks = self._marks
+            self._marks = [marks[i] for i in order]
+            self._batchChanged = True
+            return
+
+        # where[i] is the new position of the item which was at i
+        where = [0] * len(order)
+        for (new, old) in enumerate(order):
+            where[old] = new
+
+        current = self._highlightedIndex()
+
+        selected = []
+        for elm in self.selected:
+            if elm is not None:
+                elm = where[elm]
+            selected.append(elm)
+        self.selected = selected
+
+        self._index = None
+        self._fuzzyMatches = None
+        if self.filterMode not in (None, 'fuzzy'):
+            self._refilter()
+        elif self.filterMode == 'fuzzy':
+            # the rows keep their order, which is by score
+            self._setView([where[i] for i in self.view], False)
+            if self._fuzzyThread is not None:
+                self._startFuzzy(self.filterText, None)
+
+        if current is not None:
+            row = self._rowOf(where[current])
+            if row is not None:
+                self.firstVisible = max(0, self.firstVisible + row - self.highlighted)
+                self.highlighted = row
+
         self.touch()
 
     def setItems(self, items, highlighted = 0, selected = None):
         """
         sets the items list and currently highlighted item. touches
-        the ListBox (forces redraw next time through drawing loop)
+        the ListBox (forces redraw next time through drawing loop).
+        any filter or search in progress is cleared. a RowModel
+        (such as a ColumnStore) is used as it is; other sequences
+        are copied.
         """
 
-        self.items = list(items)
+        if isinstance(items, RowModel) and self.maxItems is None:
+            self.items = items
+        elif self.maxItems is None:
+            self.items = list(items)
+        else:
+            self.items = RingBuffer(self.maxItems, items)
+        self._index = None
+        self._cancelFuzzy()
+        self._setView(None)
+        self.filterMode = None
+        self.filterText = ''
+        self._filterRange = None
+        self.searchText = ''
 
         self.highlighted = highlighted
         if selected is not None:
@@ -185,27 +887,119 @@ class ListBox(Drawable):
         self.firstVisible = 0
         self.touch()
 
+        if self._marks is not None:
+            self._marks = self._markItems()
+            self._batchChanged = True
+
+    def setMaxItems(self, maxItems):
+        """
+        keep at most maxItems items, dropping the oldest to make room
+        for new ones as they are appended. the items are then held in
+        a RingBuffer, so appending and dropping cost the same however
+        many items there are. None removes the limit.
+        """
+        self.maxItems = maxItems
+        if maxItems is None:
+            self.items = list(self.items)
+            return
+
+        overflow = len(self.items) - maxItems
+        evicted = list(self.items[:max(0, overflow)])
+        self.items = RingBuffer(maxItems, self.items[max(0, overflow):])
+        if evicted:
+            self._spliced(0, evicted, 0)
+
+    def follow(self, source, maxItems = None, batchSize = 1000):
+        """
+        append items from source as they become available, like
+        tail -f. source may be a Queue.Queue, which other threads
+        put items into, or an iterable; either way it is read from
+        the Engine's main loop (see Engine.addTask), at most
+        batchSize items each time around. an iterable must not
+        block, and following stops when it is exhausted. if
+        maxItems is given, it is passed to setMaxItems().
+
+        while the last row is highlighted, the highlight moves down
+        to each new last item, keeping the end of the list in view.
+        """
+        self.unfollow()
+
+        if maxItems is not None:
+            self.setMaxItems(maxItems)
+
+        if isinstance(source, Queue.Queue):
+            def read():
+                return source.get_nowait()
+        else:
+            read = iter(source).next
+
+        def pump():
+            batch = []
+            done = False
+            try:
+                while len(batch) < batchSize:
+                    batch.append(read())
+            except Queue.Empty:
+                pass
+            except StopIteration:
+                done = True
+
+            if batch:
+                self._streamed(batch)
+
+            if done:
+                self._follow = None
+                return False
+
+        self._follow = pump
+        self.engine.addTask(pump)
+
+    def unfollow(self):
+        """
+        stop following the source given to follow()
+        """
+        if self._follow is not None:
+            self.engine.removeTask(self._follow)
+            self._follow = None
+
+    def _streamed(self, batch):
+        """
+        append a batch of items read by follow()
+        """
+        pinned = self.highlighted >= self._rowCount() - 1
+        self.extend(batch)
+        if pinned:
+            self.moveToBottom()
+
     def move(self, index):
         """
-        move the highlight to the item at given index
+        move the highlight to the item at given row
         """
         # since the keybinding won't know all the time how long the
         # list is, and it makes a copy of the int self.len if we were
         # to give that as the userdata
+        rows = self._rowCount()
         if index == 'end':
-            index = len(self.items)
+            index = rows
             
+        old = self.highlighted
         self.highlighted = index
         if self.highlighted < 0:
             self.highlighted = 0
-        elif self.highlighted >= len(self.items):
-            self.highlighted = len(self.items) - 1
+        elif self.highlighted >= rows:
+            self.highlighted = rows - 1
             if self.highlighted < 0:
                 self.highlighted = 0
 
-        self.touch()
+        # only the rows losing and gaining the highlight change,
+        # unless the ListBox has to scroll (see render)
+        self.touchRow(old)
+        self.touchRow(self.highlighted)
+        if not self.firstVisible <= self.highlighted < self.firstVisible + self.h:
+            self.touch()
 
-        self.fireEvent(HighlightChanged(self, self.items[self.highlighted]))
+        if rows:
+            self.fireEvent(HighlightChanged(self, self.getHighlightedItem()))
 
 
     def moveToTop(self):
@@ -218,7 +1012,7 @@ class ListBox(Drawable):
         """
         move the highlight to the last item
         """
-        self.move(len(self.items))
+        self.move(self._rowCount())
 
     def moveUp(self):
         """
@@ -254,8 +1048,9 @@ class ListBox(Drawable):
         """
         return the highlighted item
         """
-        if len(self.items):
-            return self.items[self.highlighted]
+        index = self._highlightedIndex()
+        if index is not None:
+            return self.items[index]
 
     # alias of getHighlightedItem
     item = getHighlightedItem
@@ -341,55 +1136,439 @@ class ListBox(Drawable):
         if the highlighted item is not selected, select it,
         and vice-versa
         """
-        if not self.allowSelection:
+        if not self.allowSelection or not self._rowCount():
             return
 
-        if self.highlighted in self.selected:
-            self.selected.remove(self.highlighted)
+        index = self._itemIndex(self.highlighted)
+        if index in self.selected:
+            self.selected.remove(index)
 
         elif self.multipleSelection:
-            self.selected.append(self.highlighted)
+            self.selected.append(index)
 
         else:
-            self.selected = [self.highlighted]
+            # the previously selected row loses its selection
+            for elm in self.selected:
+                if elm is not None and self._rowOf(elm) is not None:
+                    self.touchRow(self._rowOf(elm))
+            self.selected = [index]
 
-        self.touch()
+        self.touchRow(self.highlighted)
 
         self.fireEvent(SelectionChanged(self, self.selected))
 
+    def setFilter(self, text):
+        """
+        show only the items whose printable representation begins
+        with text (ignoring case). an empty text shows every item
+        again. when text extends the current filter, only the items
+        which matched the current filter are searched.
+        """
+        text = text.lower()
+        if not text:
+            self.clearFilter()
+            return
+
+        current = self._highlightedIndex()
+        if self.filterMode == 'prefix' and text.startswith(self.filterText):
+            lo, hi = self._filterRange
+        else:
+            lo, hi = 0, None
+
+        self._cancelFuzzy()
+        self.filterMode = 'prefix'
+        self.filterText = text
+        self._filterRange = self._getIndex().range(text, lo, hi)
+        self._setView(self._getIndex().positions(*self._filterRange))
+
+        self._keepHighlight(current)
+
+    def setFuzzyFilter(self, query):
+        """
+        show only the items whose printable representation contains
+        the characters of query in order (ignoring case), best match
+        first; see util.fuzzyScore(). an empty query shows every
+        item again.
+
+        the items are scored on a background thread, so this returns
+        at once. the thread reports the best matches found so far
+        after every fuzzyChunkSize items, and all of them once it is
+        done, by firing FilterResults events, which update the view
+        as they arrive. calling this again abandons the search in
+        progress; when the new query extends the last one to finish,
+        only the items which matched it are scored.
+        """
+        query = query.lower()
+        if not query:
+            self.clearFilter()
+            return
+
+        candidates = None
+        if self._fuzzyMatches is not None and query.startswith(self._fuzzyMatches[0]):
+            candidates = self._fuzzyMatches[1]
+
+        self.filterMode = 'fuzzy'
+        self.filterText = query
+        self._filterRange = None
+        self._startFuzzy(query, candidates)
+
+    def clearFilter(self):
+        """
+        remove the filter, showing every item
+        """
+        self._cancelFuzzy()
+        self.filterMode = None
+        self.filterText = ''
+        self._filterRange = None
+
+        if self.view is None:
+            return
+
+        current = self._highlightedIndex()
+        self._setView(None)
+
+        self._keepHighlight(current)
+
+    def _refilter(self):
+        """
+        recompute the view of the current filter (other than a fuzzy
+        one) after the items have changed
+        """
+        self._filterRange = self._getIndex().range(self.filterText)
+        self._setView(self._getIndex().positions(*self._filterRange))
+
+    def _matchesFilter(self, item):
+        """
+        whether the current filter (other than a fuzzy one) shows item
+        """
+        return self._searchKey(item).startswith(self.filterText)
+
+    def _refilterItems(self, start, end):
+        """
+        bring the view of the current filter (other than a fuzzy one)
+        up to date after items[start:end] were replaced by the same
+        number of items. returns True if rows came or went.
+        """
+        if self.filterMode == 'prefix':
+            self._filterRange = self._getIndex().range(self.filterText)
+
+        view = self.view
+        reflowed = False
+        for i in xrange(start, end):
+            row = bisect_left(view, i)
+            shown = row < len(view) and view[row] == i
+            if self._matchesFilter(self.items[i]):
+                if not shown:
+                    view.insert(row, i)
+                    reflowed = True
+            elif shown:
+                del view[row]
+                reflowed = True
+        return reflowed
+
+    def _spliceView(self, start, end, count):
+        """
+        bring the view of the current filter (other than a fuzzy one)
+        up to date after items[start:end] were replaced by the count
+        items now beginning at start. only those items are tested;
+        the rows after them just move.
+        """
+        if self.filterMode == 'prefix':
+            self._filterRange = self._getIndex().range(self.filterText)
+
+        view = self.view
+        delta = count - (end - start)
+        lo = bisect_left(view, start)
+        hi = bisect_left(view, end, lo)
+        matched = [i for i in xrange(start, start + count)
+                   if self._matchesFilter(self.items[i])]
+        if delta and hi < len(view):
+            view[hi:] = [i + delta for i in view[hi:]]
+        view[lo:hi] = matched
+        self._viewRows = None
+
+    def _startFuzzy(self, query, candidates):
+        """
+        start scoring items against query on a new background thread;
+        candidates, if given, are the indices of the items to score
+        """
+        if not self._fuzzyBound:
+            self.bindEvent(FilterResults, self._fuzzyResults)
+            self._fuzzyBound = True
+
+        self._fuzzyGeneration += 1
+
+        # the thread works on its own copy of the list, and any
+        # change to the items starts a new run
+        thread = threading.Thread(target = self._fuzzyWorker,
+                                  args = (query, self._fuzzyGeneration,
+                                          self._snapshot(), candidates))
+        thread.setDaemon(True)
+        self._fuzzyThread = thread
+        thread.start()
+
+    def _cancelFuzzy(self):
+        """
+        abandon the background fuzzy filter run, if any
+        """
+        self._fuzzyGeneration += 1
+        self._fuzzyThread = None
+        self._fuzzyMatches = None
+
+    def _fuzzyWorker(self, query, generation, items, candidates):
+        """
+        body of the background fuzzy filter thread. it stops as soon
+        as it notices that its run has been superseded.
+        """
+        if candidates is None:
+            candidates = xrange(len(items))
+
+        score = util.fuzzyScore
+        key = self._searchKey
+        chunk = self.fuzzyChunkSize
+        previewSize = self.fuzzyPreviewSize
+
+        # matches as (-score, index), so that sorting puts the best
+        # first and breaks ties in item order, and a min-heap of the
+        # best few as (score, -index)
+        matches = []
+        best = []
+
+        for (n, i) in enumerate(candidates):
+            s = score(query, key(items[i]))
+            if s is not None:
+                matches.append((-s, i))
+                if len(best) < previewSize:
+                    heappush(best, (s, -i))
+                elif (s, -i) > best[0]:
+                    heapreplace(best, (s, -i))
+
+            if (n + 1) % chunk == 0:
+                if generation != self._fuzzyGeneration:
+                    return
+                best.sort(reverse = True)
+                rows = [-i for (s, i) in best]
+                self.fireEvent(FilterResults(self, query, generation, rows, False))
+
+        matches.sort()
+        if generation == self._fuzzyGeneration:
+            rows = [i for (s, i) in matches]
+            self.fireEvent(FilterResults(self, query, generation, rows, True))
+
+    def _fuzzyResults(self, event):
+        """
+        show the results of the current fuzzy filter run
+        """
+        if event.generation != self._fuzzyGeneration:
+            return
+
+        current = self._highlightedIndex()
+        self._setView(event.rows, False)
+
+        if event.done:
+            self._fuzzyThread = None
+            candidates = list(event.rows)
+            candidates.sort()
+            self._fuzzyMatches = (event.query, candidates)
+
+        self._keepHighlight(current)
+
+    def _highlightedIndex(self):
+        """
+        the index into items of the highlighted item, or None
+        """
+        if 0 <= self.highlighted < self._rowCount():
+            return self._itemIndex(self.highlighted)
+        return None
+
+    def _keepHighlight(self, index):
+        """
+        after the view changes, keep the highlight on items[index]
+        if it is still shown, otherwise move it to the first row
+        """
+        row = None
+        if index is not None:
+            row = self._rowOf(index)
+        if row is None:
+            row = 0
+
+        self.firstVisible = 0
+        self.touch()
+        if self._rowCount():
+            self.move(row)
+        else:
+            self.highlighted = 0
+
+    def jumpTo(self, prefix):
+        """
+        move the highlight to an item beginning with prefix
+        (ignoring case), staying put if the highlighted item
+        already matches. matches are visited in the sorted order of
+        their printable representations, so this costs O(log n)
+        regardless of the number of items. returns True if a
+        matching item was found.
+        """
+        return self._jump(prefix, False)
+
+    def jumpNext(self):
+        """
+        move the highlight to the next item matching the current
+        type-ahead search, wrapping around after the last one
+        """
+        return self._jump(self.searchText, True)
+
+    def _jump(self, prefix, skipCurrent):
+        index = self._getIndex()
+        lo, hi = index.range(prefix.lower())
+        if lo == hi:
+            return False
+
+        current = self._highlightedIndex()
+        if current is not None:
+            key = self._searchKey(self.items[current])
+            if skipCurrent:
+                i = index.findAfter(key, current, lo, hi)
+            else:
+                i = index.find(key, current, lo, hi)
+            if i == hi:
+                i = lo
+        else:
+            i = lo
+
+        row = self._rowOf(index[i][1])
+        if row is None:
+            return False
+
+        self.move(row)
+        return True
+
+    def searchTyping(self, _input_key):
+        """
+        handles printable input when type-ahead search is enabled
+        """
+        if _input_key == ' ' and not self.searchText and self.allowSelection:
+            self.toggleSelect()
+            return
+
+        if self.search == 'jump':
+            now = time.time()
+            if now - self._searchTime > self.searchTimeout:
+                self.searchText = ''
+            self._searchTime = now
+
+            self.searchText += _input_key
+            self.jumpTo(self.searchText)
+
+        elif self.search == 'fuzzy':
+            self.searchText += _input_key
+            self.setFuzzyFilter(self.searchText)
+
+        else:
+            self.searchText += _input_key
+            self.setFilter(self.searchText)
+
+    def searchBackspace(self):
+        """
+        remove the last character of the type-ahead search
+        """
+        self.searchText = self.searchText[:-1]
+        if self.search == 'filter':
+            self.setFilter(self.searchText)
+        elif self.search == 'fuzzy':
+            self.setFuzzyFilter(self.searchText)
+
+    def _headerRows(self):
+        """
+        the number of rows at the top used by a header rather than
+        by items
+        """
+        return 0
+
+    def _renderHeader(self):
+        """
+        draw the header rows, if any
+        """
+        pass
+
+    def _footerRows(self):
+        """
+        the number of rows at the bottom used by a footer rather
+        than by items
+        """
+        return 0
+
+    def _renderFooter(self):
+        """
+        draw the footer rows, if any. unlike the header, the footer
+        is drawn every time the ListBox is
+        """
+        pass
+
+    def _renderRow(self, row, y):
+        """
+        draw the given row of the view at line y, filling the
+        whole width
+        """
+        i = self._itemIndex(row)
+        item = self._get_repr(self.items[i])
+
+        if i in self.selected:
+            attr = self.sstyle.copy()
+            prefix = self.scheck
+        else:
+            attr = self.ustyle.copy()
+            prefix = self.ucheck
+
+        if self.prefixlen:
+            item = prefix + item 
+
+        if len(item) < self.w:
+            item += ' ' * (self.w - len(item))
+
+        if self.focused and row == self.highlighted:
+            attr.update(self.hstyle)
+
+        self.draw(item, y, 0, **attr);
+
     def render(self):
         """
         if this gets called, then one of our functions has indicated
-        that it's time for a redraw (through self.touch()), so we're
-        going to re-draw what's in the visible range, based on our
-        size and what is currently firstVisible
+        that it's time for a redraw (through self.touch() or
+        self.touchRow()), so we're going to re-draw what's in the
+        visible range, based on our size and what is currently
+        firstVisible. when only some rows were touched and the
+        ListBox has not scrolled, only those rows are drawn.
         """
-        self.clear()
+        top = self._headerRows()
+        height = self.h - top - self._footerRows()
 
         # update firstVisible to so that currently highligted item
         # is visible
-        if self.highlighted >= self.firstVisible + self.h:
-            self.firstVisible = self.highlighted - self.h + 1
+        if self.highlighted >= self.firstVisible + height:
+            self.firstVisible = self.highlighted - height + 1
         elif self.highlighted < self.firstVisible:
             self.firstVisible = self.highlighted
 
-        for i in range(self.firstVisible, min(len(self.items), self.firstVisible + self.h)):
-            item = self._get_repr(self.items[i])
-
-            if i in self.selected:
-                attr = self.sstyle.copy()
-                prefix = self.scheck
+        if self._fullRepaint or self.firstVisible != self._drawnFirst:
+            self._renderHeader()
+            rows = range(self.firstVisible, self.firstVisible + height)
+        else:
+            rows = [row for row in self._dirtyRows
+                    if self.firstVisible <= row < self.firstVisible + height]
+            rows.sort()
+
+        count = self._rowCount()
+        for row in rows:
+            y = row - self.firstVisible + top
+            if row < count:
+                self._renderRow(row, y)
             else:
-                attr = self.ustyle.copy()
-                prefix = self.ucheck
-
-            if self.prefixlen:
-                item = prefix + item 
-
-            if len(item) < self.w:
-                item += ' ' * (self.w - len(item))
+                # rows past the end are blanked rather than clearing
+                # the whole drawable first
+                self.draw(' ' * self.w, y, 0)
 
-            if self.focused and i == self.highlighted:
-                attr.update(self.hstyle)
+        self._renderFooter()
 
-            self.draw(item, i - self.firstVisible, 0, **attr);
+        self._dirtyRows = set()
+        self._fullRepaint = False
+        self._drawnFirst = self.firstVisible
@@ -19,30 +19,51 @@
 __all__ = ['Pager']
 
 import types
+import re
 
-import util
 from core import Drawable
+from events import SearchProgress
+from textbuffer import LineBuffer, WrapIndex, SearchIndex
+from highlight import StateIndex, rowRuns
 
 class Pager(Drawable):
     """
     A simple drawable that displays a scrollable, optionally
     line-wrapped piece of text, similar to the less program.
     No editing features are provided.
+
+    Events:
+     * SearchProgress (see find())
     """
 
+    # how many lines a search looks at each time through the main loop
+    searchChunk = 2000
+
+    # how many lines are highlighted at a time to reach those in view
+    highlightChunk = 2000
 
     def __init__(self, vimlike = False, **kwargs):
         """
         Pager takes an optional parameter 'vimlike': when
         True enables bindings for vim-like navigation (j/k
-        for up/down)
+        for up/down, n/N for the next and previous match)
         """
         super(Pager, self).__init__(**kwargs)
 
         self.firstVisible = 0
 
         self.text = ''
-        self.lines = None
+        self.buffer = LineBuffer()
+        self.wrapped = WrapIndex(self.buffer)
+
+        # the search started with find(), the match last moved to,
+        # and how matches are drawn
+        self.search = None
+        self.match = None
+        self.matchStyle = dict(highlight=True)
+
+        # the states of the Highlighter given to setHighlighter()
+        self.states = None
 
         self.bindKey('down', self.moveDown)
         self.bindKey('up', self.moveUp)
@@ -54,6 +75,8 @@ class Pager(Drawable):
         if vimlike:
             self.bindKey('j', self.moveDown)
             self.bindKey('k', self.moveUp)
+            self.bindKey('n', self.findNext)
+            self.bindKey('N', self.findPrevious)
 
     
     def setText(self, text):
@@ -65,8 +88,13 @@ class Pager(Drawable):
         @type  text: string
         """
         self.firstVisible = 0
-        self.lines = None
         self.text = str(text)
+        self.buffer.setLines(self.text.split('\n'))
+        self.wrapped.reset()
+        self.search = None
+        self.match = None
+        if self.states is not None:
+            self.states = StateIndex(self.buffer, self.states.highlighter)
         self.touch()
 
     
@@ -92,7 +120,7 @@ class Pager(Drawable):
         """
         move the highlight to the last item
         """
-        self.firstVisible = max(0, len(self.lines) - self.h)
+        self.firstVisible = max(0, self.wrapped.rows() - self.h)
         self.touch()
 
 
@@ -111,8 +139,8 @@ class Pager(Drawable):
         move the highlight down one item
         """
         self.firstVisible += 1
-        if self.firstVisible > len(self.lines) - 1:
-            self.firstVisible = len(self.lines) - 1
+        if self.firstVisible > self.wrapped.rows() - 1:
+            self.firstVisible = self.wrapped.rows() - 1
         self.touch()
 
 
@@ -121,8 +149,8 @@ class Pager(Drawable):
         move down by self.height rows
         """
         self.firstVisible += self.h
-        if self.firstVisible > len(self.lines) - 1:
-            self.firstVisible = len(self.lines) - 1
+        if self.firstVisible > self.wrapped.rows() - 1:
+            self.firstVisible = self.wrapped.rows() - 1
         self.touch()
 
 
@@ -136,22 +164,158 @@ class Pager(Drawable):
         self.touch()
 
 
-    def setSize(self, y, x, h, w):
-        self.lines = None
-        super(Pager, self).setSize(y, x, h, w)
+    def find(self, pattern, flags = 0):
+        """
+        search the text for a regular expression (a string, which
+        is compiled with the given flags, or a compiled one), and
+        return the SearchIndex holding its matches. the text is
+        searched a searchChunk of lines at a time from the Engine's
+        main loop (see Engine.addTask), firing a SearchProgress event
+        each time; matches in view are drawn in matchStyle, and
+        findNext() and findPrevious() scroll between them.
+        """
+        if type(pattern) in types.StringTypes:
+            pattern = re.compile(pattern, flags)
+        self.search = SearchIndex(self.buffer, pattern)
+        self.match = None
+        self.engine.addTask(self._stepSearch)
+        self.touch()
+        return self.search
+
+
+    def clearSearch(self):
+        """
+        stop searching, and stop showing the matches
+        """
+        self.search = None
+        self.match = None
+        self.touch()
+
+
+    def _stepSearch(self):
+        """
+        the task which searches the next lines
+        """
+        search = self.search
+        if search is None:
+            return False
+        done = search.step(self.searchChunk)
+        self.touch()
+        self.fireEvent(SearchProgress(self, search.count(), search.progress(), done))
+        if done:
+            return False
+
+
+    def _where(self):
+        """
+        the position searches go on from: the match last moved to,
+        or the start of the top row
+        """
+        if self.match is not None:
+            return self.match[:2]
+        line, skip = self.wrapped.lineAt(self.firstVisible)
+        return line, self.wrapped.wrap(line)[0][skip]
+
+
+    def _moveToMatch(self, match):
+        """
+        scroll the match into view, if it is not already
+        """
+        if match is None:
+            return False
+        self.match = match
+        row = self.wrapped.visual(match[0], match[1])[0]
+        if not self.firstVisible <= row < self.firstVisible + self.h:
+            self.firstVisible = row
+        self.touch()
+        return True
+
+
+    def findNext(self):
+        """
+        scroll to the next match found, and return whether there
+        was one
+        """
+        if self.search is None:
+            return False
+        line, col = self._where()
+        if self.match is None:
+            # a match at the very top counts as the next
+            col -= 1
+        return self._moveToMatch(self.search.next(line, col))
+
+
+    def findPrevious(self):
+        """
+        scroll to the previous match found, and return whether
+        there was one
+        """
+        if self.search is None:
+            return False
+        return self._moveToMatch(self.search.previous(*self._where()))
+
+
+    def setHighlighter(self, highlighter):
+        """
+        highlight the text with the given Highlighter, or stop
+        highlighting it if highlighter is None. only the lines in
+        view are drawn highlighted.
+        """
+        if highlighter is None:
+            self.states = None
+        else:
+            self.states = StateIndex(self.buffer, highlighter)
         self.touch()
 
 
+    def _stepHighlight(self):
+        """
+        the task which highlights lines on the way to those in view,
+        when there were too many to do while drawing
+        """
+        if self.states is None:
+            return False
+        if self.states.advance(self._highlightTo, self.highlightChunk):
+            self.touch()
+            return False
+
+
     def render(self):
         """
         redraw what's in the visible range, based on our
         size and firstVisible
         """
 
-        if self.lines is None:
-            self.lines = util.wrap(self.text, self.w)
+        self.wrapped.setWidth(self.w)
 
         self.clear()
 
-        for i in range(self.firstVisible, min(len(self.lines), self.firstVisible + self.h)):
-            self.draw(self.lines[i], i - self.firstVisible, 0);
+        line, skip = self.wrapped.lineAt(self.firstVisible)
+
+        # the lines in view can be highlighted once the states before
+        # them are known, which may take a while for a long text
+        states = self.states
+        if states is not None:
+            self._highlightTo = min(line + self.h, len(self.buffer))
+            if not states.advance(self._highlightTo, self.highlightChunk):
+                self.engine.addTask(self._stepHighlight)
+
+        y = 0
+        while y < self.h and line < len(self.buffer):
+            starts, texts = self.wrapped.wrap(line)
+            if states is not None and line <= states.valid:
+                runs = states.runs(line)
+            else:
+                runs = None
+            for r in xrange(skip, min(len(texts), skip + self.h - y)):
+                if runs is None:
+                    self.draw(texts[r], y, 0)
+                else:
+                    for a, b, style in rowRuns(runs, starts[r], len(texts[r])):
+                        self.draw(texts[r][a:b], y, a, **style)
+                if self.search is not None:
+                    for a, b in self.search.inRow(line, starts[r], len(texts[r])):
+                        self.draw(texts[r][a:b], y, a, **self.matchStyle)
+                y += 1
+            line += 1
+            skip = 0
@@ -19,9 +19,12 @@
 __all__ = ['TextEditor']
 
 from core import Drawable
-from events import TextChanged
-import util
+from events import TextChanged, LoadProgress, SearchProgress
+from textbuffer import LineBuffer, WrapIndex, SearchIndex, UndoLog, MappedFile
+from highlight import StateIndex, rowRuns
 
+import os
+import stat
 import types
 import re
 
@@ -30,19 +33,49 @@ import re
 class TextEditor(Drawable):
     """
     A simple multi-line text edtor/viewer that does smart things.
+    Edits can be undone with ctrl-z and redone with ctrl-y.
 
     Events:
      * TextChanged
+     * LoadProgress (see loadFile())
+     * SearchProgress (see find())
     """
 
-    def __init__(self, editable = True, **kwargs):
+    # how many lines a search looks at each time through the main loop
+    searchChunk = 2000
+
+    # how many lines are highlighted at a time to reach those in view
+    highlightChunk = 2000
+
+    def __init__(self, editable = True, undoLimit = 1 << 20, **kwargs):
+        """
+        TextEditor takes optional parameters 'editable', which
+        when False makes it a viewer, and 'undoLimit', about how
+        many characters of edits to keep for undo.
+        """
         super(TextEditor, self).__init__(**kwargs)
 
         # the buffer of lines
-        self.buffer = ['']
+        self.buffer = LineBuffer()
+        self.wrapped = WrapIndex(self.buffer)
+        self.mapped = None
+        # the task adding the lines of a file still being loaded
+        self._loading = None
         self.cy = 0
         self.cx = 0
 
+        # the first (wrapped) row on screen
+        self.firstVisible = 0
+
+        self.undoLog = UndoLog(undoLimit)
+
+        # the search started with find(), and how its matches are drawn
+        self.search = None
+        self.matchStyle = dict(highlight=True)
+
+        # the states of the Highlighter given to setHighlighter()
+        self.states = None
+
         # key bindings
         self.editable = editable
         if self.editable:
@@ -50,6 +83,8 @@ class TextEditor(Drawable):
             self.bindKey('enter', self.typing)
             self.bindKey('backspace', self.backspace)
             self.bindKey('delete', self.delete)
+            self.bindKey('ctrl z', self.undo)
+            self.bindKey('ctrl y', self.redo)
 
         self.bindKey('up',        self.moveUp)
         self.bindKey('down',      self.moveDown)
@@ -67,25 +102,18 @@ class TextEditor(Drawable):
         for normal typing
         """
         input = _input_key
-        input = _input_key
         # if the input is 'enter', then insert a new line into the 
         # buffer and move the cursor to it
         if input == 'enter':
-            self.cy += 1
-            self.cx = 0
-            self.buffer.insert(self.cy, '')
-
-            self.touch()
-            return
-
-        line = self.buffer[self.cy]
-        self.buffer[self.cy] = line[:self.cx] + input + line[self.cx:]
+            input = '\n'
 
-        self.cx += 1
+        line, col = self.cy, self.cx
+        self.cy, self.cx = self.buffer.insert(line, col, input)
+        self._linesChanged(line, line + 1, self.cy - line + 1)
 
         self.touch()
 
-        self.fireEvent(TextChanged(self, '\n'.join(self.buffer)))
+        self.textChanged(line, col, '', input)
 
 
     def backspace(self):
@@ -95,35 +123,96 @@ class TextEditor(Drawable):
 
         if self.cx == 0 and self.cy > 0:
             # if we're at the beginning of a line
-            self.cx = len(self.buffer[self.cy - 1])
-            self.buffer[self.cy - 1] = self.buffer[self.cy - 1] + self.buffer[self.cy]
-            del self.buffer[self.cy]
+            cx = len(self.buffer[self.cy - 1])
+            removed = self.buffer.delete(self.cy - 1, cx, self.cy, 0)
+            self._linesChanged(self.cy - 1, self.cy + 1, 1)
             self.cy -= 1
+            self.cx = cx
         
         elif self.cx > 0:
             # else just delete the char before us
-            line = self.buffer[self.cy]
-            self.buffer[self.cy] = line[:self.cx - 1] + line[self.cx:]
+            removed = self.buffer.delete(self.cy, self.cx - 1, self.cy, self.cx)
+            self._linesChanged(self.cy, self.cy + 1, 1)
             self.cx -= 1
 
+        else:
+            return
+
         self.touch()
 
-        self.fireEvent(TextChanged(self, '\n'.join(self.buffer)))
+        self.textChanged(self.cy, self.cx, removed, '')
     
 
     def delete(self):
         if self.cx == len(self.buffer[self.cy]) and self.cy < len(self.buffer) - 1:
             # if we hit delete at the end of a line
-            self.buffer[self.cy] += self.buffer[self.cy + 1]
-            del self.buffer[self.cy + 1]
+            removed = self.buffer.delete(self.cy, self.cx, self.cy + 1, 0)
 
         else:
-            line = self.buffer[self.cy]
-            self.buffer[self.cy] = line[:self.cx] + line[self.cx + 1:]
+            removed = self.buffer.delete(self.cy, self.cx, self.cy, self.cx + 1)
+
+        if not removed:
+            return
+
+        self._linesChanged(self.cy, self.cy + 1 + removed.count('\n'), 1)
+
+        self.touch()
+
+        self.textChanged(self.cy, self.cx, removed, '')
+
+
+    def textChanged(self, line, col, removed, inserted, undoable = True):
+        """
+        record an edit at the given position, which replaced the
+        text removed with inserted, in the undo log (if undoable)
+        and fire a TextChanged event for it. the full text is only
+        joined if a listener asks for it
+        """
+        position = self.buffer.offset(line, col)
+        if undoable:
+            self.undoLog.record(position, removed, inserted)
+
+        self.fireEvent(TextChanged(self,
+                                   position = position,
+                                   removed = len(removed),
+                                   inserted = inserted,
+                                   getText = self.buffer.text))
+
+
+    def replace(self, position, length, text, undoable = True):
+        """
+        replace length characters at the given offset in the text
+        with text, and move the cursor to the end of it
+        """
+        line, col = self.buffer.position(position)
+        endLine, endCol = self.buffer.position(position + length)
+        removed = self.buffer.delete(line, col, endLine, endCol)
+        self.cy, self.cx = self.buffer.insert(line, col, text)
+        self._linesChanged(line, endLine + 1, self.cy - line + 1)
 
         self.touch()
 
-        self.fireEvent(TextChanged(self, '\n'.join(self.buffer)))
+        self.textChanged(line, col, removed, text, undoable)
+
+
+    def undo(self):
+        """
+        undo the last edit (or run of typing)
+        """
+        record = self.undoLog.undo()
+        if record is not None:
+            position, removed, inserted = record
+            self.replace(position, len(inserted), removed, False)
+
+
+    def redo(self):
+        """
+        redo the last edit undone
+        """
+        record = self.undoLog.redo()
+        if record is not None:
+            position, removed, inserted = record
+            self.replace(position, len(removed), inserted, False)
 
 
     def moveHome(self):
@@ -223,14 +312,268 @@ class TextEditor(Drawable):
         editor) or a single string, which is split by newline
         characters ('\n').
         """
+        removed = self.buffer.chars()
+        self._closeFile()
         if type(text) in types.StringTypes:
-            self.buffer = text.split('\n')
+            self.buffer.setLines(text.split('\n'))
         elif type(text) in [types.ListType, types.TupleType]:
-            self.buffer = list(text)
+            self.buffer.setLines(text)
+            text = '\n'.join(text)
+        self._textReplaced()
+
+        self.fireEvent(TextChanged(self, text, 0, removed, text))
+
+
+    def loadFile(self, path, cacheBlocks = 64):
+        """
+        show the text of the file at path, through a MappedFile,
+        which is returned. the file is scanned for lines in the
+        background, and they are added from the Engine's main loop
+        (see Engine.addTask) as they are found, firing a LoadProgress
+        event each time, so the start of a large file is shown long
+        before it has all been read. lines are split out of the file
+        only when they are shown or edited.
+        """
+        removed = self.buffer.chars()
+        self._closeFile()
+        mapped = MappedFile(path, self.buffer.blockSize, cacheBlocks)
+        self.mapped = mapped
+        self.buffer.setBlocks(mapped.update())
+        self._textReplaced()
+
+        self.fireEvent(TextChanged(self, position = 0, removed = removed,
+                                   inserted = '', getText = self.buffer.text))
+
+        def poll():
+            if self.mapped is not mapped:
+                return False
+            done = mapped.done
+            blocks = mapped.update()
+            if blocks:
+                count = len(self.buffer)
+                self.buffer.appendBlocks(blocks)
+                self._linesAdded(len(self.buffer) - count)
+            self.fireEvent(LoadProgress(self, len(self.buffer), mapped.progress, done))
+            if done:
+                self._loading = None
+                return False
+
+        self._loading = poll
+        self.engine.addTask(poll)
+        return mapped
+
+
+    def saveFile(self, path = None):
+        """
+        write the text to the file at path, or to the file it was
+        loaded from. the text is written a block of lines at a
+        time, to a temporary file which then replaces the file at
+        path, so a file being shown through loadFile() can be saved
+        over, keeping its permissions. a file still being loaded is
+        first scanned to the end, and the rest of its lines added.
+        raises ValueError if there is no path to save to.
+        """
+        if path is None:
+            if self.mapped is None:
+                raise ValueError('no path to save to')
+            path = self.mapped.path
+
+        if self._loading is not None:
+            poll = self._loading
+            self.mapped.finish()
+            poll()
+            self.engine.removeTask(poll)
+
+        temp = path + '.tmp'
+        out = open(temp, 'wb')
+        try:
+            self.buffer.write(out)
+        finally:
+            out.close()
+        if os.path.exists(path):
+            os.chmod(temp, stat.S_IMODE(os.stat(path).st_mode))
+        os.rename(temp, path)
+
+
+    def _textReplaced(self):
+        """
+        start afresh after all of the text was replaced
+        """
+        self.wrapped.reset()
+        self.undoLog.clear()
+        self.search = None
+        if self.states is not None:
+            self.states = StateIndex(self.buffer, self.states.highlighter)
+        self.cy, self.cx = (0, 0)
+        self.firstVisible = 0
+        self.touch()
+
+
+    def _linesChanged(self, start, stop, count):
+        """
+        note that lines start to stop were replaced by count lines
+        """
+        self.wrapped.update(start, stop, count)
+        if self.search is not None:
+            self.search.update(start, stop, count)
+        if self.states is not None:
+            self.states.update(start, stop, count)
+
+
+    def _linesAdded(self, count):
+        """
+        note that count lines were added to the end
+        """
+        self.wrapped.extend(count)
+        if self.search is not None:
+            self.search.extend(count)
+            self.engine.addTask(self._stepSearch)
+        if self.states is not None:
+            self.states.extend(count)
+        self.touch()
+
+
+    def _closeFile(self):
+        """
+        close the file opened with loadFile(), if any, before the
+        text shown from it is replaced
+        """
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+            self._loading = None
 
+
+    def find(self, pattern, flags = 0):
+        """
+        search the text for a regular expression (a string, which
+        is compiled with the given flags, or a compiled one), and
+        return the SearchIndex holding its matches. the text is
+        searched a searchChunk of lines at a time from the Engine's
+        main loop (see Engine.addTask), firing a SearchProgress event
+        each time; matches in view are drawn in matchStyle, and
+        findNext() and findPrevious() move the cursor between them.
+        the search is forgotten when the whole text is replaced.
+        """
+        if type(pattern) in types.StringTypes:
+            pattern = re.compile(pattern, flags)
+        self.search = SearchIndex(self.buffer, pattern)
+        self.engine.addTask(self._stepSearch)
         self.touch()
+        return self.search
+
+
+    def clearSearch(self):
+        """
+        stop searching, and stop showing the matches
+        """
+        self.search = None
+        self.touch()
+
+
+    def _stepSearch(self):
+        """
+        the task which searches the next lines
+        """
+        search = self.search
+        if search is None:
+            return False
+        done = search.step(self.searchChunk)
+        self.touch()
+        self.fireEvent(SearchProgress(self, search.count(), search.progress(), done))
+        if done:
+            return False
+
+
+    def _moveToMatch(self, match):
+        if match is None:
+            return False
+        self.cy, self.cx = match[:2]
+        self.touch()
+        return True
+
+
+    def findNext(self):
+        """
+        move the cursor to the next match found, and return whether
+        there was one
+        """
+        if self.search is None:
+            return False
+        return self._moveToMatch(self.search.next(self.cy, self.cx))
+
+
+    def findPrevious(self):
+        """
+        move the cursor to the previous match found, and return
+        whether there was one
+        """
+        if self.search is None:
+            return False
+        return self._moveToMatch(self.search.previous(self.cy, self.cx))
+
+
+    def _replaceMatch(self, line, start, template):
+        match = self.search.regex.match(self.buffer[line], start)
+        if match is None:
+            return False
+        self.replace(self.buffer.offset(line, start), match.end() - start,
+                     match.expand(template))
+        return True
+
 
-        self.fireEvent(TextChanged(self, '\n'.join(self.buffer)))
+    def replaceMatch(self, template):
+        """
+        replace the match at the cursor, if there is one, with the
+        template (which may refer to groups of the match, as for
+        re.sub()), and return whether there was one
+        """
+        if self.search is None or self.search.at(self.cy, self.cx) is None:
+            return False
+        return self._replaceMatch(self.cy, self.cx, template)
+
+
+    def replaceAll(self, template):
+        """
+        finish the search, replace every match with the template,
+        and return how many were replaced. the text from the first
+        match to the last is replaced in one edit, which is undone
+        as one.
+        """
+        if self.search is None:
+            return 0
+        self.search.finish()
+        count = self.search.count()
+        if not count:
+            return 0
+
+        # take every match before changing anything, since an edit
+        # searches the lines it changes again
+        spans = [self.search.nth(n) for n in xrange(count)]
+        regex = self.search.regex
+
+        firstLine, firstStart = spans[0][:2]
+        lastLine, lastEnd = spans[-1][0], spans[-1][2]
+        pieces = []
+        line, pos = firstLine, firstStart
+        text = self.buffer[line]
+        for matchLine, start, end in spans:
+            while line < matchLine:
+                pieces.append(text[pos:])
+                pieces.append('\n')
+                line += 1
+                text = self.buffer[line]
+                pos = 0
+            pieces.append(text[pos:start])
+            pieces.append(regex.match(text, start).expand(template))
+            pos = end
+
+        position = self.buffer.offset(firstLine, firstStart)
+        self.undoLog.seal()
+        self.replace(position, self.buffer.offset(lastLine, lastEnd) - position,
+                     ''.join(pieces))
+        self.undoLog.seal()
+        return count
 
 
     def getText(self):
@@ -238,32 +581,101 @@ class TextEditor(Drawable):
         returns the list of strings currently in the TextEditor's
         buffer
         """
-        return self.buffer
+        return self.buffer.lines()
 
 
-    def render(self):
-        wrapped = []
-        for line in self.buffer:
-            wrapped.extend(util.wrap(line, self.w))
+    def setHighlighter(self, highlighter):
+        """
+        highlight the text with the given Highlighter, or stop
+        highlighting it if highlighter is None. only the lines in
+        view are drawn highlighted; the state at the end of each
+        line is kept, so that after an edit only the lines from it
+        down to where the state is the same as before are looked at
+        again.
+        """
+        if highlighter is None:
+            self.states = None
+        else:
+            self.states = StateIndex(self.buffer, highlighter)
+        self.touch()
 
 
+    def _stepHighlight(self):
+        """
+        the task which highlights lines on the way to those in view,
+        when there were too many to do while drawing
+        """
+        if self.states is None:
+            return False
+        if self.states.advance(self._highlightTo, self.highlightChunk):
+            self.touch()
+            return False
+
+
+    def rowsInView(self):
+        """
+        return the wrapped rows from firstVisible down to the bottom
+        of the TextEditor, as (line, start column, text)
+        """
+        rows = []
+        line, skip = self.wrapped.lineAt(self.firstVisible)
+        while len(rows) < self.h and line < len(self.buffer):
+            starts, texts = self.wrapped.wrap(line)
+            for r in xrange(skip, min(len(texts), skip + self.h - len(rows))):
+                rows.append((line, starts[r], texts[r]))
+            line += 1
+            skip = 0
+        return rows
+
+
+    def render(self):
+        """
+        draws the rows in view, scrolling first if necessary to keep
+        the cursor in view
+        """
+        self.wrapped.setWidth(self.w)
+
+        # lines are only wrapped when first shown, and may turn out
+        # to take more rows than was estimated, moving the cursor;
+        # so the view is settled before anything is drawn
+        while True:
+            row, col = self.wrapped.visual(self.cy, self.cx)
+            if row < self.firstVisible:
+                self.firstVisible = row
+            elif row >= self.firstVisible + self.h:
+                self.firstVisible = row - self.h + 1
+
+            rows = self.rowsInView()
+            if self.wrapped.visual(self.cy, self.cx)[0] == row:
+                break
+
         self.clear()
 
-        y = 0
-        for line in wrapped:
-            self.draw(line, y, 0)
-            y += 1
+        # the lines in view can be highlighted once the states before
+        # them are known, which may take a while after a big change
+        states = self.states
+        if states is not None and rows:
+            self._highlightTo = rows[-1][0]
+            if not states.advance(self._highlightTo, self.highlightChunk):
+                self.engine.addTask(self._stepHighlight)
+
+        runs = {}
+        for y, (line, start, text) in enumerate(rows):
+            if states is not None and line <= states.valid:
+                if line not in runs:
+                    runs[line] = states.runs(line)
+                for a, b, style in rowRuns(runs[line], start, len(text)):
+                    self.draw(text[a:b], y, a, **style)
+            else:
+                self.draw(text, y, 0)
+            if self.search is not None:
+                for a, b in self.search.inRow(line, start, len(text)):
+                    self.draw(text[a:b], y, a, **self.matchStyle)
 
-        # TODO
-        # have to have a more intelligent calculation (taking into
-        # account line wrapping) of where the cursor is... that might
-        # take some work, or really we'll just need to move the wrapping
-        # into this class
         if self.focused:
-            if self.editable and self.cx == self.w:
-                self.showCursor(self.cy + 1, 0)
-            elif self.editable:
-                self.showCursor(self.cy, self.cx)
+            if self.editable:
+                # the cursor may be in whitespace dangling past the edge
+                self.showCursor(row - self.firstVisible, min(col, self.w - 1))
             else:
                 self.hideCursor()
         else:
@@ -20,6 +20,8 @@ __all__ = ['TextField']
 
 from core import Drawable
 from events import TextChanged
+from textbuffer import UndoLog, GapBuffer
+from index import CompletionIndex, PrefixSearch
 
 class TextField(Drawable):
     """
@@ -30,6 +32,13 @@ class TextField(Drawable):
     home, end: move cursor to start or end, respectively
     backspace: delete the character just behind the cursor
     delete: delete the character just ahead of the cursor
+    ctrl-z, ctrl-y: undo or redo the last edit, respectively
+
+    while completions are shown (see setCompletions()):
+
+    up arrow, down arrow: choose the previous or next completion
+    tab: replace the text before the cursor with the chosen completion
+    escape: hide the completions
     
     to have a certain key be the "end" of the input (eg, 'enter' or
     'escape' you must bind it yourself from outside the TextField
@@ -39,13 +48,26 @@ class TextField(Drawable):
      * TextChanged
     """
 
-    def __init__(self, **kwargs):
+    def __init__(self, undoLimit = 1 << 16, **kwargs):
+        """
+        TextField takes an optional parameter 'undoLimit', about
+        how many characters of edits to keep for undo.
+        """
         super(TextField, self).__init__(**kwargs)
 
-        self.buffer = ''
+        self.buffer = GapBuffer()
         self.cursor = 0
         self.start = 0
 
+        self.undoLog = UndoLog(undoLimit)
+
+        # see setCompletions()
+        self.completions = None
+        self.suggestions = []
+        self.chosen = 0
+        self._popup = None
+        self._popupBindings = None
+
         # keybindings
         self.bindPrintable(self.typing)
         self.bindKey('left', self.moveLeft)
@@ -54,16 +76,20 @@ class TextField(Drawable):
         self.bindKey('end', self.moveToEnd)
         self.bindKey('backspace', self.backspace)
         self.bindKey('delete', self.delete)
+        self.bindKey('ctrl z', self.undo)
+        self.bindKey('ctrl y', self.redo)
 
     def setText(self, text):
-        self.buffer = text
+        removed = len(self.buffer)
+        self.buffer.setText(text)
+        self.undoLog.clear()
         self.moveToStart()
         self.touch()
 
-        self.fireEvent(TextChanged(self, self.buffer))
+        self.fireEvent(TextChanged(self, text, 0, removed, text))
 
     def getText(self):
-        return self.buffer
+        return self.buffer.text()
 
     def moveLeft(self):
         self.cursor -= 1
@@ -102,26 +128,200 @@ class TextField(Drawable):
         self.touch()
 
     def backspace(self):
-        # the max(0, self.cursor - 1) is necessary to avoid having [:-1] as our slice
-        self.buffer = self.buffer[:max(0, self.cursor-1)] + self.buffer[self.cursor:]
+        if self.cursor == 0:
+            return
+
+        removed = self.buffer.delete(self.cursor - 1, 1)
         self.moveLeft()
 
-        self.fireEvent(TextChanged(self, self.buffer))
+        self.textChanged(self.cursor, removed, '')
 
     def delete(self):
-        self.buffer = self.buffer[:self.cursor] + self.buffer[self.cursor+1:]
+        if self.cursor == len(self.buffer):
+            return
+
+        removed = self.buffer.delete(self.cursor, 1)
 
         self.touch()
 
-        self.fireEvent(TextChanged(self, self.buffer))
+        self.textChanged(self.cursor, removed, '')
 
     def typing(self, _input_key):
-        self.buffer = self.buffer[:self.cursor] + _input_key + self.buffer[self.cursor:]
+        position = self.cursor
+        self.buffer.insert(self.cursor, _input_key)
         self.moveRight()
 
         self.touch()
 
-        self.fireEvent(TextChanged(self, self.buffer))
+        self.textChanged(position, '', _input_key)
+
+    def textChanged(self, position, removed, inserted, undoable = True):
+        """
+        record an edit at position, which replaced the text removed
+        with inserted, in the undo log (if undoable) and fire a
+        TextChanged event for it
+        """
+        if undoable:
+            self.undoLog.record(position, removed, inserted)
+
+        if self.completions is not None:
+            self.complete()
+
+        self.fireEvent(TextChanged(self,
+                                   position = position,
+                                   removed = len(removed),
+                                   inserted = inserted,
+                                   getText = self.getText))
+
+    def replace(self, position, length, text, undoable = True):
+        """
+        replace length characters at position with text, and move
+        the cursor to the end of it
+        """
+        removed = self.buffer.delete(position, length)
+        self.buffer.insert(position, text)
+
+        self.cursor = position + len(text)
+        if self.cursor < self.start:
+            self.start = self.cursor
+        elif self.cursor >= self.start + self.w:
+            self.start = self.cursor - self.w + 1
+
+        self.touch()
+
+        self.textChanged(position, removed, text, undoable)
+
+    def undo(self):
+        """
+        undo the last edit (or run of typing)
+        """
+        record = self.undoLog.undo()
+        if record is not None:
+            position, removed, inserted = record
+            self.replace(position, len(inserted), removed, False)
+
+    def redo(self):
+        """
+        redo the last edit undone
+        """
+        record = self.undoLog.redo()
+        if record is not None:
+            position, removed, inserted = record
+            self.replace(position, len(removed), inserted, False)
+
+    def setCompletions(self, candidates, count = 5, weights = None,
+                       style = None, hstyle = None):
+        """
+        complete the text before the cursor from candidates, which
+        is either a CompletionIndex or a sequence of strings to build
+        one from (with weights, if given, for the order in which they
+        are offered; see CompletionIndex). as the text is edited, up
+        to count completions are shown in a popup list below the
+        field, in style, with the one chosen in hstyle. None turns
+        completion off.
+        """
+        self.hideCompletions()
+        if candidates is None:
+            self.completions = None
+            self._popup = None
+            return
+
+        if not isinstance(candidates, CompletionIndex):
+            candidates = CompletionIndex(candidates, weights)
+        self.completions = PrefixSearch(candidates)
+        self.completionCount = count
+        self._popup = _CompletionPopup(style or dict(highlight=True),
+                                       hstyle or dict(bold=True))
+
+    def complete(self):
+        """
+        look up the completions of the text before the cursor, and
+        show them, or hide the popup if there are none. typing
+        another character only searches among the completions
+        already found (see PrefixSearch).
+        """
+        prefix = self.buffer.get(0, self.cursor)
+        suggestions = []
+        if prefix:
+            suggestions = self.completions.top(prefix, self.completionCount)
+            if suggestions == [prefix]:
+                suggestions = []
+
+        if not suggestions:
+            self.hideCompletions()
+            return
+
+        shrunk = len(suggestions) < len(self.suggestions)
+        self.suggestions = suggestions
+        self.chosen = 0
+        self._showPopup(shrunk)
+
+    def _showPopup(self, shrunk):
+        popup = self._popup
+        popup.items = self.suggestions
+        popup.chosen = self.chosen
+
+        # below the field, or above it if there is no room
+        h = len(self.suggestions)
+        y = self.y + 1
+        if y + h > self.engine.h and self.y >= h:
+            y = self.y - h
+        popup.setSize(y, self.x, h, self.w)
+        popup.touch()
+
+        if self._popupBindings is None:
+            self._popupBindings = {}
+            for key, method in (('up', self.choosePrevious),
+                                ('down', self.chooseNext),
+                                ('tab', self.acceptCompletion),
+                                ('esc', self.hideCompletions)):
+                self._popupBindings[key] = self.keybindings.get(key)
+                self.bindKey(key, method)
+            self.engine.addOverlay(popup)
+        elif shrunk:
+            # show again what the popup no longer covers
+            self.engine.touchAll()
+
+    def hideCompletions(self):
+        """
+        hide the popup list of completions, if it is shown
+        """
+        self.suggestions = []
+        self.chosen = 0
+        if self._popupBindings is None:
+            return
+
+        for key, binding in self._popupBindings.items():
+            if binding is None:
+                self.unbindKey(key)
+            else:
+                self.keybindings[key] = binding
+        self._popupBindings = None
+        self.engine.removeOverlay(self._popup)
+
+    def chooseNext(self):
+        if self.chosen < len(self.suggestions) - 1:
+            self.chosen += 1
+            self._popup.chosen = self.chosen
+
+    def choosePrevious(self):
+        if self.chosen > 0:
+            self.chosen -= 1
+            self._popup.chosen = self.chosen
+
+    def acceptCompletion(self):
+        """
+        replace the text the completions were looked up for with
+        the chosen completion, and hide the popup
+        """
+        if not self.suggestions:
+            return
+
+        completion = self.suggestions[self.chosen]
+        self.undoLog.seal()
+        self.replace(0, len(self.completions.prefix), completion)
+        self.undoLog.seal()
+        self.hideCompletions()
 
     def render(self):
         """
@@ -130,8 +330,30 @@ class TextField(Drawable):
 
         self.clear()
 
-        self.draw(self.buffer[self.start:], 0, 0)
+        self.draw(self.buffer.get(self.start, self.start + self.w), 0, 0)
         if self.focused:
             self.showCursor(0, self.cursor - self.start)
         else:
             self.hideCursor()
+
+
+class _CompletionPopup(Drawable):
+    """
+    the popup list of completions shown by a TextField, drawn as an
+    overlay (see Engine.addOverlay())
+    """
+
+    def __init__(self, style, hstyle, **kwargs):
+        super(_CompletionPopup, self).__init__(**kwargs)
+        self.style = style
+        self.hstyle = hstyle
+        self.items = []
+        self.chosen = 0
+
+    def render(self):
+        for row, item in enumerate(self.items[:self.h]):
+            if row == self.chosen:
+                style = self.hstyle
+            else:
+                style = self.style
+            self.draw(item[:self.w].ljust(self.w), row, 0, **style)
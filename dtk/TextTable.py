@@ -19,9 +19,116 @@
 __all__ = ['TextTable']
 
 import types
+import random
+import threading
+from array import array
+from bisect import bisect_left, insort
+
 import util
 
 from ListBox import ListBox
+from events import SortResults, LoadProgress
+from models import RowModel, CSVModel
+from index import PrefixIndex, HashIndex
+from formatters import numberFormatter
+
+
+class Summary(object):
+    """
+    Summary keeps the count, sum and extremes of a collection of
+    values as they are added and removed, without going over the
+    whole collection again. None is not counted, and only numbers
+    count towards the sum and mean. the extremes are kept only if
+    ordered is True, in a sorted list of the values; otherwise the
+    values are not copied at all. summaries of parts of a
+    collection merge into a summary of the whole.
+    """
+
+    def __init__(self, values = (), ordered = False):
+        self.ordered = ordered
+        self.values = []
+
+        if isinstance(values, array):
+            # a column of a ColumnStore, all numbers
+            self.count = self.numbers = len(values)
+            self.total = sum(values)
+            if ordered:
+                self.values = sorted(values)
+            return
+
+        if ordered:
+            values = [v for v in values if v is not None]
+            values.sort()
+            self.values = values
+
+        count = numbers = total = 0
+        number = (int, long, float)
+        for value in values:
+            if value is not None:
+                count += 1
+                if isinstance(value, number):
+                    numbers += 1
+                    total += value
+        self.count = count
+        self.numbers = numbers
+        self.total = total
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        if isinstance(value, (int, long, float)):
+            self.numbers += 1
+            self.total += value
+        if self.ordered:
+            insort(self.values, value)
+
+    def remove(self, value):
+        if value is None:
+            return
+        self.count -= 1
+        if isinstance(value, (int, long, float)):
+            self.numbers -= 1
+            self.total -= value
+        if self.ordered:
+            i = bisect_left(self.values, value)
+            if i < len(self.values) and self.values[i] == value:
+                del self.values[i]
+
+    def merge(self, other):
+        """
+        add the values summarized by other
+        """
+        self.count += other.count
+        self.numbers += other.numbers
+        self.total += other.total
+        if self.ordered and len(other.values) < 64:
+            # a few binary searches cost less than comparing every value
+            for value in other.values:
+                insort(self.values, value)
+        elif self.ordered:
+            # sorting two sorted runs takes linear time
+            self.values.extend(other.values)
+            self.values.sort()
+
+    def value(self, kind):
+        """
+        the 'sum', 'count', 'min', 'max' or 'mean' of the values, or
+        None if there are none to take it of
+        """
+        if kind == 'count':
+            return self.count
+        elif kind == 'sum':
+            return self.total
+        elif kind == 'mean':
+            if self.numbers:
+                return float(self.total) / self.numbers
+        elif self.values:
+            if kind == 'min':
+                return self.values[0]
+            return self.values[-1]
+        return None
+
 
 class TextTable(ListBox):
     """
@@ -31,115 +138,1331 @@ class TextTable(ListBox):
     appear in its own column, subject to layout rules, etc).
     """
 
+    # sorts of more rows than this run on a background thread
+    sortThreshold = 50000
+
+    # the most formatted cells kept for redrawing
+    cellCacheSize = 20000
+
+    # the number of rows measured to size an automatic width column
+    autoSampleSize = 300
+
+    # the width of flexible columns when the table scrolls sideways
+    minColumnWidth = 10
+
     class TextColumn:
-        def __init__(self, fixedsize, weight, alignment):
+        def __init__(self, fixedsize, weight, alignment, sortkey = None,
+                     formatter = None, ellipsis = False):
             self.fixedsize = fixedsize
             self.weight = weight
             self.alignment = alignment
+            self.sortkey = sortkey
+            self.formatter = formatter
+            self.ellipsis = ellipsis
             self.width = None
 
-    def __init__(self, spacing = 1, **kwargs):
+            # the widest text seen in a column sized to its contents
+            self.auto = fixedsize == 'auto'
+            self.measured = None
+
+        def text(self, cell):
+            """
+            the text shown for cell, before it is fit to the column
+            """
+            if cell is None:
+                return ''
+            elif self.formatter is not None:
+                return self.formatter(cell)
+            elif isinstance(cell, basestring):
+                return cell
+            return str(cell)
+
+    def __init__(self, spacing = 1, sortable = False, frozenColumns = 0, key = None,
+                 **kwargs):
+        """
+        TextTable takes the ListBox parameters, and also:
+
+         * spacing: the number of spaces between columns
+         * sortable: when True, the function keys sort the table by
+           the corresponding column (F1 for the first column, and
+           so on); pressing the same key again reverses the order.
+           see toggleSort()
+         * frozenColumns: when the columns do not all fit, the table
+           scrolls sideways with the left and right keys, keeping
+           this many columns at the left in view
+         * key: identifies rows for upsert() and delete(); see setKey()
+
+        Events:
+         * SortResults and LoadProgress, besides those fired by
+           ListBox
+        """
         super(TextTable, self).__init__(**kwargs)
 
         self.colnames = []
 
         self.spacing = spacing
 
-        self.format = None
         self.cols = []
 
+        # for each column, a function turning a cell into exactly
+        # the text drawn for it, compiled whenever the layout changes
+        # (see _compileColumn), and the text of each cell drawn so
+        # far, by (item index, column)
+        self._fitters = None
+        self._cells = {}
+
+        # the columns shown, by number, which are all of them unless
+        # the table is too wide and scrolls sideways, in which case
+        # firstColumn is the first column shown after the frozen ones
+        self._visibleCols = []
+        self._scrolling = False
+        self._clipped = False
+        self.frozenColumns = frozenColumns
+        self.firstColumn = frozenColumns
+
+        self.bindKey('left', self.scrollLeft)
+        self.bindKey('right', self.scrollRight)
+
+        # the current sort as (column, descending) pairs, most
+        # significant first, and the sort keys of each column which
+        # has been sorted on, one per item
+        self.sortable = sortable
+        self.sortColumns = []
+        self._sortKeys = {}
+
+        # the generation of the latest sort, and the version of the
+        # items, which any change to them bumps
+        self._sortGeneration = 0
+        self._sortVersion = 0
+        self._sortThread = None
+        self._sortBound = False
+
+        # the CSVModel being loaded by loadCSV(), until it all has been
+        self._loading = None
+
+        # the conditions of the column filter (see filterBy), and
+        # the indexes of columns built to answer them, by (column,
+        # 'hash') or (column, 'sorted')
+        self.filterConditions = []
+        self._colIndexes = {}
+
+        # the position of each row by its key, less _keyOffset, built
+        # when first needed
+        self.key = None
+        self._keyPositions = None
+        self._keyOffset = 0
+        self.setKey(key)
+
+        # the aggregate shown in the footer for each column (see
+        # setAggregates), and the summaries they are taken from, of
+        # every row and of the rows in the view, built when needed
+        self.aggregates = {}
+        self._summaries = None
+        self._viewSummaries = None
+
+    def _get_repr(self, item):
+        """
+        the cells of the row separated by spaces, so that type-ahead
+        search matches on the leftmost column. unicode cells are
+        kept as they are, rather than encoded.
+        """
+        cells = []
+        for cell in item:
+            if not isinstance(cell, basestring):
+                cell = str(cell)
+            cells.append(cell)
+        try:
+            return ' '.join(cells)
+        except UnicodeDecodeError:
+            # encoded text alongside unicode
+            for (i, cell) in enumerate(cells):
+                if isinstance(cell, str):
+                    cells[i] = cell.decode('utf-8', 'replace')
+            return u' '.join(cells)
+
     def setSize(self, y, x, h, w):
         """
         clear the column cache, then call ListBox.setSize()
         """
-        self.format = None
+        self._fitters = None
 
         ListBox.setSize(self, y, x, h, w)
 
-    def addColumn(self, fixedsize = None, weight = 1, alignment = 'left', name = None):
+    def addColumn(self, fixedsize = None, weight = 1, alignment = 'left', name = None,
+                  sortkey = None, formatter = None, ellipsis = False):
         """
         add a column (will become the rightmost column) containing
         the given drawable (its parent should be this ColumnLayout),
         which will be drawn with the appropriate minimum and
         maximum width, as space allows. weight is used to calculate
         how to distribute remaining space after minimum and maximum
-        are taken into account. alignment may be one of 'left' or 'right'
+        are taken into account. alignment may be one of 'left' or 'right'.
+        a fixedsize of 'auto' sizes the column to fit its contents,
+        as measured on a sample of the rows (see autoSampleSize).
+        sortkey, if given, is called with each cell of the column to
+        get the value it is sorted by; otherwise cells are sorted by
+        their own value.
+
+        formatter, if given, is called with each cell of the column
+        to get the text shown for it (see numberFormatter() and
+        dateFormatter()); otherwise str() is used. text too wide
+        for the column is cut off, ending in '...' if ellipsis is
+        True.
         """
         if alignment != 'left' and alignment != 'right':
             raise ValueError, "'alignment' argument must be 'left' or 'right'"
 
-        self.cols.append(self.TextColumn(fixedsize, weight, alignment))
+        self.cols.append(self.TextColumn(fixedsize, weight, alignment, sortkey,
+                                         formatter, ellipsis))
         self.colnames.append(name)
+        self._fitters = None
+
+        if self.sortable and len(self.cols) <= 12:
+            self.bindKey('F%d' % len(self.cols), self.toggleSort, len(self.cols) - 1)
 
         self.touch()
 
+    def _itemsChanged(self):
+        """
+        any sort in progress no longer applies to the items
+        """
+        self._sortVersion += 1
 
-    def render(self):
+    def _forgetCells(self, start = 0, end = None):
         """
-        if this gets called, then one of our functions has indicated
-        that it's time for a redraw (through self.touch()), so we're
-        going to update and return the window object for the Engine to
-        draw.
+        drop the formatted cells of items[start:end]
         """
+        if start == 0 and end is None:
+            self._cells = {}
+            return
 
-        # figure out column widths
-        if self.format is None:
-            self.format = ''
+        cells = self._cells
+        if end is not None and end - start < len(cells):
+            for i in xrange(start, end):
+                cells.pop(i, None)
+            return
 
-            availwidth = self.w - ((len(self.cols) - 1) * self.spacing)
+        for i in cells.keys():
+            if i >= start and (end is None or i < end):
+                del cells[i]
 
-            sizeitems = [(c.fixedsize, c.weight) for c in self.cols]
-            sizes = util.flexSize(sizeitems, availwidth)
+    def invalidate(self, index = None):
+        """
+        format the cells of items[index] again, or of every item if
+        index is None, and redraw them. call this after changing an
+        item in place, rather than replacing it.
+        """
+        if index is None:
+            self._forgetCells()
+            self.touch()
+        else:
+            self._forgetCells(index, index + 1)
+            if self._measure([index]):
+                self.touch()
+            row = self._rowOf(index)
+            if row is not None:
+                self.touchRow(row)
+
+    def _spliced(self, start, removed, count):
+        """
+        keep the cached sort keys in step with the items, then call
+        ListBox._spliced()
+        """
+        self._itemsChanged()
+        end = start + len(removed)
+        if count and self._measure(self._sample(start, start + count)):
+            self.touch()
+        if count == len(removed):
+            self._forgetCells(start, end)
+        else:
+            self._forgetCells(start, None)
+        for (col, keys) in self._sortKeys.items():
+            if not isinstance(keys, list):
+                # a copy of a whole column, cheaper to copy again
+                del self._sortKeys[col]
+                continue
+            key = self._columnKey(col)
+            keys[start:end] = [key(self.items[i]) for i in xrange(start, start + count)]
+
+        if len(removed) + count > len(self.items) / 8 + 1:
+            # cheaper to build them again when they are next needed
+            self._colIndexes = {}
+
+        delta = count - len(removed)
+        for ((col, kind), index) in self._colIndexes.items():
+            for (offset, row) in enumerate(removed):
+                index.discard(self._cell(row, col), start + offset)
+            if start == 0:
+                index.shift(0, delta)
+            elif delta and end < len(self.items) - delta:
+                index.shift(end, delta)
+            for pos in xrange(start, start + count):
+                index.add(self._cell(self.items[pos], col), pos)
+
+        if self._summaries is not None:
+            added = self.items[start:start + count]
+            for (col, summary) in self._summaries.items():
+                for row in removed:
+                    summary.remove(self._cell(row, col))
+                summary.merge(Summary([self._cell(row, col) for row in added],
+                                      summary.ordered))
+
+        # the removed rows which were shown, to take out of the
+        # view summaries; a view out of item order is summarized again
+        shown = None
+        if self._viewSummaries is not None and self.view is not None and \
+               self._viewOrdered and self._marks is None:
+            shown = [row for (offset, row) in enumerate(removed)
+                     if self._rowOf(start + offset) is not None]
+
+        positions = self._keyPositions
+        if positions is not None:
+            keyOf = self._keyOf
+            for (offset, row) in enumerate(removed):
+                k = keyOf(row)
+                if positions.get(k) == start + offset - self._keyOffset:
+                    del positions[k]
+            if start == 0:
+                self._keyOffset += delta
+            elif delta and end < len(self.items) - delta:
+                for (k, pos) in positions.items():
+                    if pos >= end - self._keyOffset:
+                        positions[k] = pos + delta
+            for pos in xrange(start, start + count):
+                positions[keyOf(self.items[pos])] = pos - self._keyOffset
+
+        super(TextTable, self)._spliced(start, removed, count)
+
+        if shown is not None and self._viewSummaries is not None and \
+               self.view is not None and self._viewOrdered:
+            added = [self.items[i] for i in xrange(start, start + count)
+                     if self._rowOf(i) is not None]
+            for (col, summary) in self._viewSummaries.items():
+                for row in shown:
+                    summary.remove(self._cell(row, col))
+                summary.merge(Summary([self._cell(row, col) for row in added],
+                                      summary.ordered))
+        elif self.view is not None:
+            self._viewSummaries = None
+
+        # the aggregates change even when no shown row does
+        self.touchFooter()
+
+    def _replaced(self, positions, removed):
+        """
+        keep the cached cells, sort keys, indexes and summaries in
+        step with rows replaced in place, all at once, then call
+        ListBox._replaced()
+        """
+        self._itemsChanged()
+        items = self.items
+        added = [items[i] for i in positions]
+        if self._measure(positions[:self.autoSampleSize]):
+            self.touch()
+
+        cells = self._cells
+        for i in positions:
+            cells.pop(i, None)
+
+        for (col, keys) in self._sortKeys.items():
+            if not isinstance(keys, list):
+                del self._sortKeys[col]
+                continue
+            key = self._columnKey(col)
+            for (i, row) in zip(positions, added):
+                keys[i] = key(row)
+
+        if 2 * len(positions) > len(items) / 8 + 1:
+            self._colIndexes = {}
+        for ((col, kind), index) in self._colIndexes.items():
+            for (i, old, row) in zip(positions, removed, added):
+                index.discard(self._cell(old, col), i)
+                index.add(self._cell(row, col), i)
+
+        if self._summaries is not None:
+            for (col, summary) in self._summaries.items():
+                for row in removed:
+                    summary.remove(self._cell(row, col))
+                summary.merge(Summary([self._cell(row, col) for row in added],
+                                      summary.ordered))
+
+        shown = None
+        if self._viewSummaries is not None and self.view is not None and \
+               self._viewOrdered and self._marks is None:
+            shown = [old for (i, old) in zip(positions, removed)
+                     if self._rowOf(i) is not None]
+
+        keyPositions = self._keyPositions
+        if keyPositions is not None:
+            keyOf = self._keyOf
+            for (i, old, row) in zip(positions, removed, added):
+                k = keyOf(old)
+                if keyOf(row) == k:
+                    continue
+                if keyPositions.get(k) == i - self._keyOffset:
+                    del keyPositions[k]
+                keyPositions[keyOf(row)] = i - self._keyOffset
+
+        super(TextTable, self)._replaced(positions, removed)
+
+        if shown is not None and self._viewSummaries is not None and \
+               self.view is not None and self._viewOrdered:
+            now = [row for (i, row) in zip(positions, added) if self._rowOf(i) is not None]
+            for (col, summary) in self._viewSummaries.items():
+                for row in shown:
+                    summary.remove(self._cell(row, col))
+                summary.merge(Summary([self._cell(row, col) for row in now],
+                                      summary.ordered))
+        elif self.view is not None:
+            self._viewSummaries = None
+
+        # the aggregates change even when no shown row does
+        self.touchFooter()
+
+    def _permute(self, order):
+        self._itemsChanged()
+        self._forgetCells()
+        for (col, keys) in self._sortKeys.items():
+            if isinstance(keys, list):
+                self._sortKeys[col] = [keys[i] for i in order]
+            else:
+                del self._sortKeys[col]
+
+        super(TextTable, self)._permute(order)
+
+    def _takeItems(self, indices):
+        self._colIndexes = {}
+        self._keyPositions = None
+        super(TextTable, self)._takeItems(indices)
+
+    def reverse(self):
+        self._itemsChanged()
+        self._forgetCells()
+        self._colIndexes = {}
+        self._keyPositions = None
+        for keys in self._sortKeys.values():
+            keys.reverse()
+
+        super(TextTable, self).reverse()
+
+    def removeMany(self, indices = None, predicate = None):
+        """
+        see ListBox.removeMany(). rows cannot be removed from a file
+        which loadCSV() is still loading, since that would copy the
+        rows loaded so far and stop the rest from being added; this
+        raises ValueError.
+        """
+        if self._loading is not None:
+            raise ValueError("rows cannot be removed while the file is loading")
+
+        viewSummaries = self._viewSummaries
+        removed = super(TextTable, self).removeMany(indices, predicate)
+        if removed:
+            self._itemsChanged()
+            self._forgetCells()
+            self._sortKeys = {}
+            if self._summaries is not None:
+                for (col, summary) in self._summaries.items():
+                    for row in removed:
+                        summary.remove(self._cell(row, col))
+
+            # the filter was applied again, but only the rows it
+            # showed which were removed change its summaries
+            if viewSummaries is not None and self.filterMode not in (None, 'fuzzy'):
+                shown = [row for row in removed if self._matchesFilter(row)]
+                for (col, summary) in viewSummaries.items():
+                    for row in shown:
+                        summary.remove(self._cell(row, col))
+                self._viewSummaries = viewSummaries
+        return removed
+
+    def setItems(self, items, highlighted = 0, selected = None):
+        """
+        sets the items, forgetting any sort; see ListBox.setItems()
+        """
+        self._itemsChanged()
+        self._forgetCells()
+        self._colIndexes = {}
+        self._keyPositions = None
+        self._summaries = None
+        self._sortKeys = {}
+        self.sortColumns = []
+        for col in self.cols:
+            col.measured = None
+        self._fitters = None
+        self._sortGeneration += 1
+        self._sortThread = None
+        self._loading = None
+
+        super(TextTable, self).setItems(items, highlighted, selected)
+
+    def loadCSV(self, path, delimiter = None, header = True, cacheBlocks = 200):
+        """
+        show the rows of a CSV or TSV file, in a CSVModel, which is
+        returned. the file is scanned in the background, and rows
+        are added from the Engine's main loop (see Engine.addTask)
+        as they are found, firing a LoadProgress event each time, so
+        the first screen is shown long before a large file has been
+        read. the parameters are those of CSVModel; if the table has
+        no columns yet, one is added for each column of the file,
+        named from its header row if it has one.
+
+        a sort asked for while the file is loading is made once it
+        has all been read, and rows cannot be removed until then.
+        """
+        model = CSVModel(path, delimiter, header, cacheBlocks)
+        if not self.cols:
+            for name in (model.header or [None] * model.width):
+                self.addColumn(name = name)
+        self.setItems(model)
+
+        def poll():
+            if self.items is not model:
+                return False
+            done = model.done
+            count = len(model)
+            added = model.update()
+            if added:
+                self._spliced(count, [], added)
+            self.fireEvent(LoadProgress(self, len(model), model.progress, done))
+            if done:
+                self._loading = None
+                if self.sortColumns:
+                    self.sortBy(self.sortColumns)
+                return False
+
+        self._loading = model
+        self.engine.addTask(poll)
+        return model
+
+    def _cell(self, row, col):
+        """
+        the value in column col of row, or None if it is too short
+        """
+        if col < len(row):
+            return row[col]
+        return None
+
+    def _reloaded(self):
+        """
+        start afresh after the RowModel holding the items sorted or
+        filtered itself, so that every row may have changed
+        """
+        self._itemsChanged()
+        self._forgetCells()
+        self._colIndexes = {}
+        self._keyPositions = None
+        self._summaries = None
+        self._viewSummaries = None
+        self._sortKeys = {}
+        self._index = None
+
+        self.selected = [elm for elm in self.selected if elm is None]
+        self.highlighted = 0
+        self.firstVisible = 0
+        self.touch()
+
+    def _setView(self, view, ordered = True):
+        self._viewSummaries = None
+        super(TextTable, self)._setView(view, ordered)
+
+    def setAggregates(self, aggregates):
+        """
+        show a footer with an aggregate of each of the given columns,
+        which is a dict mapping column numbers to one of 'sum',
+        'count', 'min', 'max' or 'mean'. the aggregates are of the
+        rows the filter shows, formatted like the column. they are
+        kept up to date as rows change without going over all the
+        rows again. an empty dict removes the footer.
+        """
+        for (col, kind) in aggregates.items():
+            if not 0 <= col < len(self.cols):
+                raise ValueError("no such column: %r" % (col,))
+            if kind not in ('sum', 'count', 'min', 'max', 'mean'):
+                raise ValueError("unknown aggregate: %r" % (kind,))
+
+        self.aggregates = dict(aggregates)
+        self._summaries = None
+        self._viewSummaries = None
+        self.touch()
+
+    def _summarize(self, indices):
+        """
+        summarize the aggregated columns of the rows at indices
+        """
+        summaries = {}
+        for (col, kind) in self.aggregates.items():
+            ordered = kind in ('min', 'max')
+            if indices is None and isinstance(self.items, RowModel):
+                values = self.items.column(col)
+            elif indices is None:
+                values = [self._cell(row, col) for row in self.items]
+            else:
+                values = [self._cell(self.items[i], col) for i in indices]
+            summaries[col] = Summary(values, ordered)
+        return summaries
+
+    def getAggregates(self):
+        """
+        return a dict of the aggregates shown in the footer, by column
+        """
+        if self._summaries is None:
+            self._summaries = self._summarize(None)
+
+        if self.view is None:
+            summaries = self._summaries
+        else:
+            if self._viewSummaries is None:
+                self._viewSummaries = self._summarize(self.view)
+            summaries = self._viewSummaries
+
+        out = {}
+        for (col, kind) in self.aggregates.items():
+            out[col] = summaries[col].value(kind)
+        return out
+
+    def _footerRows(self):
+        """
+        a line and the aggregates, when there are any
+        """
+        if self.aggregates:
+            return 2
+        return 0
+
+    def _renderFooter(self):
+        if not self.aggregates:
+            return
+
+        values = self.getAggregates()
+        cells = []
+        for (col, fit) in zip(self._visibleCols, self._fitters):
+            value = values.get(col)
+            if self.aggregates.get(col) in ('count', 'mean') and value is not None:
+                # not a value of the column, so not formatted like one
+                cells.append(fit(None, self._aggregateText(value)))
+            else:
+                cells.append(fit(value))
+
+        self.line(self.h - 2, 0, self.w)
+        self.draw(self._joinCells(cells), self.h - 1, 0, bold = True)
+
+    def _aggregateText(self, value):
+        """
+        the text shown for a count or mean in the footer
+        """
+        if value == int(value):
+            return numberFormatter()(value)
+        return numberFormatter(2)(value)
+
+    def setKey(self, key):
+        """
+        set what identifies a row for upsert() and delete(): either
+        a column number, or a function returning the key of a row.
+        keys must be hashable, and should be unique.
+        """
+        if key is None:
+            self._keyOf = None
+        elif callable(key):
+            self._keyOf = key
+        else:
+            self._keyOf = lambda row: row[key]
+
+        self.key = key
+        self._keyPositions = None
+
+    def _positions(self):
+        """
+        return the map from key to position (less _keyOffset),
+        building it if necessary
+        """
+        if self._keyOf is None:
+            raise ValueError("TextTable has no key; see setKey()")
+
+        if self._keyPositions is None:
+            keyOf = self._keyOf
+            self._keyPositions = dict([(keyOf(row), i) for (i, row) in enumerate(self.items)])
+            self._keyOffset = 0
+        return self._keyPositions
+
+    def indexOfKey(self, key):
+        """
+        return the index of the row with the given key, or None
+        """
+        pos = self._positions().get(key)
+        if pos is not None:
+            return pos + self._keyOffset
+        return None
+
+    def upsert(self, rows):
+        """
+        replace the rows with the same keys as the given rows, and
+        append those whose keys are new. rows replaced in place are
+        the only ones redrawn, and the highlight and scroll position
+        stay where they are.
+        """
+        positions = self._positions()
+        keyOf = self._keyOf
+
+        replaced = {}
+        appended = []
+        new = {}
+        for row in rows:
+            k = keyOf(row)
+            pos = positions.get(k)
+            if pos is not None:
+                replaced[pos + self._keyOffset] = row
+            elif k in new:
+                appended[new[k]] = row
+            else:
+                new[k] = len(appended)
+                appended.append(row)
+
+        if replaced:
+            self.replaceMany(replaced)
+        if appended:
+            self.extend(appended)
+
+    def delete(self, keys):
+        """
+        remove the rows with the given keys, ignoring keys which are
+        not in the table. returns the rows removed.
+        """
+        indices = []
+        for k in keys:
+            i = self.indexOfKey(k)
+            if i is not None:
+                indices.append(i)
+
+        if len(indices) == 1:
+            return [self.pop(indices[0])]
+        elif indices:
+            return self.removeMany(indices)
+        return []
+
+    def filterBy(self, *conditions):
+        """
+        show only the rows meeting all of the given conditions, each
+        a tuple (column, op, value):
+
+         * (column, '==', value): the cell equals value
+         * (column, 'in', values): the cell is one of values
+         * (column, 'range', (low, high)): low <= cell < high;
+           either bound may be None
+         * (column, 'contains', text): the text shown for the cell
+           contains text, ignoring case
+
+        a RowModel which can filter itself, such as an SQLiteModel,
+        is left to do so. otherwise, equality and range conditions
+        are answered from indexes of the column, built when first
+        needed and kept up to date as the rows change; the other
+        conditions are then checked only against the rows those
+        indexes find. when the conditions narrow the current filter,
+        only the rows it shows are checked. with no conditions,
+        every row is shown again.
+        """
+        normalized = []
+        for (col, op, value) in conditions:
+            if not 0 <= col < len(self.cols):
+                raise ValueError("no such column: %r" % (col,))
+            if op == 'in':
+                value = frozenset(value)
+            elif op == 'range':
+                value = tuple(value)
+            elif op == 'contains':
+                value = value.lower()
+            elif op != '==':
+                raise ValueError("unknown filter operation: %r" % (op,))
+            normalized.append((col, op, value))
+
+        if isinstance(self.items, RowModel) and self.items.filter(normalized):
+            # the model filtered itself
+            self.filterConditions = normalized
+            self._reloaded()
+            return
+
+        if not normalized:
+            self.filterConditions = []
+            self.clearFilter()
+            return
+
+        candidates = None
+        if self.filterMode == 'columns' and self._narrows(normalized, self.filterConditions):
+            candidates = self.view
+
+        current = self._highlightedIndex()
+
+        self._cancelFuzzy()
+        self.filterMode = 'columns'
+        self.filterText = ''
+        self._filterRange = None
+        self.filterConditions = normalized
+        self._setView(self._matchRows(normalized, candidates))
+
+        self._keepHighlight(current)
+
+    def _refilter(self):
+        if self.filterMode == 'columns':
+            self._setView(self._matchRows(self.filterConditions, None))
+        else:
+            super(TextTable, self)._refilter()
+
+    def _matchesFilter(self, row):
+        if self.filterMode == 'columns':
+            for condition in self.filterConditions:
+                if not self._test(condition)(self._cell(row, condition[0])):
+                    return False
+            return True
+        return super(TextTable, self)._matchesFilter(row)
+
+    def _narrows(self, conditions, previous):
+        """
+        True if every row meeting conditions also meets previous
+        """
+        for (col, op, value) in previous:
+            for (c, o, v) in conditions:
+                if c != col:
+                    continue
+                if (o, v) == (op, value):
+                    break
+                if o == op == 'contains' and value in v:
+                    break
+                if o == op == 'range' and \
+                       (value[0] is None or (v[0] is not None and v[0] >= value[0])) and \
+                       (value[1] is None or (v[1] is not None and v[1] <= value[1])):
+                    break
+            else:
+                return False
+        return True
+
+    def _columnIndex(self, col, kind):
+        """
+        return the 'hash' or 'sorted' index of column col, building
+        it if necessary
+        """
+        index = self._colIndexes.get((col, kind))
+        if index is None:
+            if isinstance(self.items, RowModel):
+                values = self.items.column(col)
+            else:
+                values = [self._cell(row, col) for row in self.items]
+
+            if kind == 'hash':
+                index = HashIndex(values)
+            else:
+                index = PrefixIndex(values)
+            self._colIndexes[col, kind] = index
+        return index
+
+    def _indexedRows(self, condition):
+        """
+        the rows meeting an equality or range condition, in order,
+        looked up in the column's index
+        """
+        col, op, value = condition
+        if op == '==':
+            return self._columnIndex(col, 'hash').positions(value)
+        elif op == 'in':
+            index = self._columnIndex(col, 'hash')
+            rows = []
+            for v in value:
+                rows.extend(index.positions(v))
+            rows.sort()
+            return rows
+        index = self._columnIndex(col, 'sorted')
+        return index.positions(*index.span(*value))
+
+    def _estimate(self, condition):
+        """
+        the number of rows an indexed condition will find
+        """
+        col, op, value = condition
+        if op == '==':
+            return self._columnIndex(col, 'hash').count(value)
+        elif op == 'in':
+            index = self._columnIndex(col, 'hash')
+            return sum([index.count(v) for v in value])
+        lo, hi = self._columnIndex(col, 'sorted').span(*value)
+        return hi - lo
+
+    def _test(self, condition):
+        """
+        return a function telling whether a cell meets condition
+        """
+        col, op, value = condition
+        if op == '==':
+            return lambda cell: cell == value
+        elif op == 'in':
+            return lambda cell: cell in value
+        elif op == 'range':
+            low, high = value
+            return lambda cell: (low is None or cell >= low) and (high is None or cell < high)
+        textOf = self.cols[col].text
+        return lambda cell: value in textOf(cell).lower()
+
+    def _matchRows(self, conditions, candidates):
+        """
+        return the indices, in order, of the rows meeting all of
+        conditions, among candidates (a sorted list of indices) or
+        all the rows
+        """
+        rest = list(conditions)
+        if candidates is None:
+            # start from the most selective indexed condition
+            indexed = [(self._estimate(c), c) for c in conditions if c[1] != 'contains']
+            if indexed:
+                indexed.sort()
+                best = indexed[0][1]
+                candidates = self._indexedRows(best)
+                rest.remove(best)
+
+        tests = [(c[0], self._test(c)) for c in rest]
+        if not tests:
+            return list(candidates)
+
+        items = self.items
+        if candidates is None and len(tests) == 1 and isinstance(items, RowModel):
+            # a single condition on the whole of one column
+            col, test = tests[0]
+            return [i for (i, cell) in enumerate(items.column(col)) if test(cell)]
+
+        if candidates is None:
+            candidates = xrange(len(items))
+
+        cell = self._cell
+        out = []
+        for i in candidates:
+            row = items[i]
+            for (col, test) in tests:
+                if not test(cell(row, col)):
+                    break
+            else:
+                out.append(i)
+        return out
+
+    def _columnKey(self, col):
+        """
+        return a function giving the sort key of column col of a row
+        """
+        sortkey = self.cols[col].sortkey
+        def key(row):
+            if col < len(row):
+                cell = row[col]
+            else:
+                cell = None
+            if sortkey is not None:
+                return sortkey(cell)
+            return cell
+        return key
+
+    def sortBy(self, columns):
+        """
+        sort the rows by the given columns, most significant first.
+        each is a column number, or a (column, descending) pair.
+        the sort is stable, so rows which tie keep their order; the
+        selection and highlight stay on the same rows.
+
+        the sort keys of each column are computed once and cached
+        until the items are replaced. a RowModel which can sort
+        itself, such as an SQLiteModel, is left to do so (and the
+        highlight goes back to the top). tables of more than
+        sortThreshold rows are sorted on a background thread, and
+        the new order is swapped in all at once, when it is ready,
+        by a SortResults event. a file which loadCSV() is still
+        loading is sorted once it has all been read.
+        """
+        sortColumns = []
+        for col in columns:
+            if isinstance(col, tuple):
+                col, descending = col
+            else:
+                descending = False
+            if not 0 <= col < len(self.cols):
+                raise ValueError("no such column: %r" % (col,))
+            sortColumns.append((col, bool(descending)))
+
+        if isinstance(self.items, RowModel) and self.items.sort(sortColumns):
+            # the model sorted itself
+            self.sortColumns = sortColumns
+            self._sortGeneration += 1
+            self._sortThread = None
+            self._reloaded()
+            return
+
+        self.sortColumns = sortColumns
+        self._sortGeneration += 1
+        self.touch()
+
+        if self._loading is not None:
+            # sorting would copy the rows loaded so far and stop the
+            # rest from being added; loadCSV() sorts when it is done
+            self._sortThread = None
+            return
+
+        # a background sort gets its own copy of the cached keys,
+        # which change along with the items
+        keys = {}
+        for (col, descending) in sortColumns:
+            if col in self._sortKeys:
+                keys[col] = list(self._sortKeys[col])
+        missing = [(col, self.cols[col].sortkey) for (col, descending) in sortColumns
+                   if col not in keys]
+
+        if len(self.items) <= self.sortThreshold:
+            self._sortThread = None
+            order = self._sortWorker(None, None, self.items, sortColumns,
+                                     keys, missing)
+            self._sorted(order, keys)
+            return
+
+        if not self._sortBound:
+            self.bindEvent(SortResults, self._sortResults)
+            self._sortBound = True
+
+        thread = threading.Thread(target = self._sortWorker,
+                                  args = (self._sortGeneration, self._sortVersion,
+                                          self._snapshot(), sortColumns, keys, missing))
+        thread.setDaemon(True)
+        self._sortThread = thread
+        thread.start()
+
+    def toggleSort(self, column):
+        """
+        sort by column, ascending, keeping the previous sort for rows
+        which tie; if the table is already sorted by column, reverse
+        its order instead
+        """
+        if self.sortColumns and self.sortColumns[0][0] == column:
+            sortColumns = [(column, not self.sortColumns[0][1])] + self.sortColumns[1:]
+        else:
+            sortColumns = [(column, False)]
+            sortColumns.extend([c for c in self.sortColumns if c[0] != column])
+
+        self.sortBy(sortColumns)
+
+    def _sortWorker(self, generation, version, items, sortColumns, keys, missing):
+        """
+        compute the missing sort keys and the sorted order of items.
+        when run on a background thread (generation is not None) the
+        results are fired in a SortResults event, otherwise returned.
+        """
+        for (col, sortkey) in missing:
+            if isinstance(items, RowModel):
+                # a whole column at once
+                values = items.column(col)
+            else:
+                key = self._columnKey(col)
+                values = [key(row) for row in items]
+                sortkey = None
+            if sortkey is not None:
+                values = map(sortkey, values)
+            keys[col] = values
 
-            for (col, size) in zip(self.cols, sizes):
-                col.width = size
+        # sorting by the least significant column first, relying on
+        # the sort being stable, lets each column have its own order
+        order = range(len(items))
+        for (col, descending) in reversed(sortColumns):
+            order.sort(key = keys[col].__getitem__, reverse = descending)
 
-                self.format += '%'
-                if col.alignment == 'left':
-                    self.format += '-'
-                self.format += ('%d' % col.width) + ('.%d' % col.width) + 's'
-                self.format += ' ' * self.spacing
+        if generation is None:
+            return order
 
-            # trim off trailing space
-            if self.spacing:
-                self.format = self.format[:len(self.format) - self.spacing]
+        self.fireEvent(SortResults(self, generation, version, order, keys))
 
-        offset = 0
-        
+    def _sortResults(self, event):
+        """
+        swap in the order found by a background sort, or sort again
+        if the items changed in the meantime
+        """
+        if event.generation != self._sortGeneration:
+            return
+
+        self._sortThread = None
+        if event.version != self._sortVersion:
+            self.sortBy(self.sortColumns)
+            return
+
+        self._sorted(event.order, event.keys)
+
+    def _sorted(self, order, keys):
+        """
+        apply a finished sort
+        """
+        self._sortKeys = keys
+        self._permute(order)
+
+
+    def _headerRows(self):
+        """
+        two rows (names and a line) when any column is named
+        """
         # max([None, None, ...]) will evaluate False
-        if max(self.colnames):
-            # then we must render the header
-            self.draw(self.format % tuple(map(lambda x: x or '', self.colnames)), 0, 0, bold = True)
+        if self.colnames and max(self.colnames):
+            return 2
+        return 0
+
+    def _compileColumn(self, col):
+        """
+        return a function turning a cell of the given column into
+        text exactly as wide as the column; it may instead be given
+        the text to fit, shown in place of the cell's
+        """
+        width = col.width
+        textOf = col.text
+        left = col.alignment == 'left'
+        if col.ellipsis and width > 3:
+            ellipsis = '...'
+        else:
+            ellipsis = ''
+
+        def fit(cell, text = None):
+            if text is None:
+                text = textOf(cell)
+            if len(text) > width:
+                text = text[:width - len(ellipsis)] + ellipsis
+            elif left:
+                text = text.ljust(width)
+            else:
+                text = text.rjust(width)
+            return text
+
+        return fit
+
+    def _layout(self):
+        """
+        work out which columns are shown and how wide they are, and
+        compile the function which formats each of them. when the
+        columns do not all fit, flexible columns get minColumnWidth,
+        and the frozen columns are followed by as many as fit
+        starting from firstColumn.
+        """
+        fixed = []
+        for (col, c) in enumerate(self.cols):
+            if c.auto:
+                if c.measured is None:
+                    self._measure(self._sample(0, len(self.items)), [col])
+                fixed.append(c.measured)
+            else:
+                fixed.append(c.fixedsize)
+
+        spacing = self.spacing
+        natural = [size is None and self.minColumnWidth or size for size in fixed]
+        needed = sum(natural) + (len(self.cols) - 1) * spacing
+
+        if needed <= self.w:
+            # everything fits; pad the last column if nothing else
+            # takes up the slack
+            self._scrolling = False
+            self._visibleCols = range(len(self.cols))
+
+            availwidth = self.w - ((len(self.cols) - 1) * spacing)
+            if self.cols and None not in fixed:
+                fixed[-1] += availwidth - sum(fixed)
+
+            sizeitems = [(size, c.weight) for (size, c) in zip(fixed, self.cols)]
+            sizes = util.flexSize(sizeitems, availwidth)
+
+        else:
+            self._scrolling = True
+            frozen = min(self.frozenColumns, len(self.cols))
+            self.firstColumn = max(frozen, min(self.firstColumn, len(self.cols) - 1))
+
+            self._visibleCols = []
+            sizes = []
+            x = 0
+            for col in range(frozen) + range(self.firstColumn, len(self.cols)):
+                if x >= self.w:
+                    break
+                self._visibleCols.append(col)
+                sizes.append(min(natural[col], self.w - x))
+                x += natural[col] + spacing
+
+            # whether there is more to see to the right
+            last = self._visibleCols[-1]
+            self._clipped = last < len(self.cols) - 1 or sizes[-1] < natural[last]
+
+        for col in self.cols:
+            col.width = None
+        for (col, size) in zip(self._visibleCols, sizes):
+            self.cols[col].width = size
+
+        self._fitters = [self._compileColumn(self.cols[col]) for col in self._visibleCols]
+        self._cells = {}
+
+    def scrollLeft(self):
+        """
+        scroll the columns after the frozen ones left by one
+        """
+        if self._scrolling and self.firstColumn > self.frozenColumns:
+            self.firstColumn -= 1
+            self._fitters = None
+            self.touch()
+
+    def scrollRight(self):
+        """
+        scroll the columns after the frozen ones right by one, if
+        there are more columns to see
+        """
+        if self._fitters is None:
+            self._layout()
+
+        if self._scrolling and self._clipped:
+            self.firstColumn += 1
+            self._fitters = None
+            self.touch()
+
+    def setFrozenColumns(self, count):
+        """
+        keep the first count columns in view when scrolling
+        horizontally
+        """
+        self.frozenColumns = count
+        self.firstColumn = max(self.firstColumn, count)
+        self._fitters = None
+        self.touch()
+
+    def _sample(self, start, stop):
+        """
+        return the indices of up to autoSampleSize of the rows from
+        start to stop: some from each end, and the rest at random
+        """
+        size = self.autoSampleSize
+        if stop - start <= size:
+            return xrange(start, stop)
+
+        ends = size / 3
+        sample = range(start, start + ends) + range(stop - ends, stop)
+        sample.extend(random.sample(xrange(start + ends, stop - ends), size - 2 * ends))
+        return sample
+
+    def _measure(self, indices, columns = None):
+        """
+        widen the automatic width columns (or the given columns) to
+        fit the text of the rows at indices. columns never narrow,
+        so that the layout stays put as rows come and go. returns
+        True if any column was widened, in which case the layout is
+        worked out again on the next redraw.
+        """
+        if columns is None:
+            # columns not yet measured are, in full, at the next layout
+            columns = [col for (col, c) in enumerate(self.cols)
+                       if c.auto and c.measured is not None]
+
+        widened = False
+        for col in columns:
+            c = self.cols[col]
+            width = c.measured
+            if width is None:
+                width = len(self.colnames[col] or '')
+                if self.sortable:
+                    # room for the sort marker
+                    width += 2
+
+            for i in indices:
+                row = self.items[i]
+                if col < len(row):
+                    width = max(width, len(c.text(row[col])))
+
+            if width != c.measured:
+                c.measured = width
+                widened = True
+
+        if widened:
+            self._fitters = None
+        return widened
+
+    def _renderHeader(self):
+        if self._headerRows():
+            names = map(lambda x: x or '', self.colnames)
+            if self.sortColumns:
+                # mark the column the table is sorted by
+                col, descending = self.sortColumns[0]
+                names[col] += descending and ' v' or ' ^'
+
+            cells = []
+            for col in self._visibleCols:
+                c = self.cols[col]
+                if c.alignment == 'left':
+                    cells.append(names[col][:c.width].ljust(c.width))
+                else:
+                    cells.append(names[col][:c.width].rjust(c.width))
+
+            self.draw(self._joinCells(cells), 0, 0, bold = True)
             self.line(1, 0, self.w)
 
-            offset = 2
-        
-        # the effective height, less the offset (if there's a header)
-        height = self.h - offset
+    def _formatRows(self, start, stop):
+        """
+        fill the cell cache for items[start:stop] of a RowModel,
+        fetching each column's values for those rows all at once
+        """
+        cache = self._cells
+        for (col, fit) in zip(self._visibleCols, self._fitters):
+            for (offset, value) in enumerate(self.items.column(col, start, stop)):
+                cells = cache.get(start + offset)
+                if cells is None:
+                    cells = cache[start + offset] = {}
+                cells[col] = fit(value)
 
-        # update firstVisible to so that currently highligted item
-        # is visible
-        if self.highlighted >= self.firstVisible + height:
-            self.firstVisible = self.highlighted - height + 1
-        elif self.highlighted < self.firstVisible:
-            self.firstVisible = self.highlighted
+    def _renderRow(self, row, y):
+        i = self._itemIndex(row)
+        columns = self._visibleCols
 
-        for i in range(self.firstVisible, min(len(self.items), self.firstVisible + height)):
-            item = self.items[i]
+        cache = self._cells
+        if len(cache) * max(1, len(columns)) > self.cellCacheSize:
+            cache.clear()
 
-            if len(item) < len(self.cols):
-                item = list(item)
-                item.extend([''] * (len(self.cols) - len(item)))
+        if columns and columns[0] not in cache.get(i, ()) and self.view is None \
+               and isinstance(self.items, RowModel):
+            # format the rest of the screen a column at a time
+            self._formatRows(i, min(len(self.items), i + self.h))
 
-            elif len(item) > len(self.cols):
-                item = item[:len(self.cols)]
+        # only the columns in view are formatted
+        rowCells = cache.get(i)
+        if rowCells is None:
+            rowCells = cache[i] = {}
+        item = None
+        cells = []
+        for (col, fit) in zip(columns, self._fitters):
+            text = rowCells.get(col)
+            if text is None:
+                if item is None:
+                    item = self.items[i]
+                if col < len(item):
+                    text = fit(item[col])
+                else:
+                    text = fit(None)
+                rowCells[col] = text
+            cells.append(text)
 
-            attr = {}
-            if i in self.selected:
-                attr['bold'] = True
-            if self.focused and i == self.highlighted:
-                attr['highlight'] = True
+        attr = {}
+        if i in self.selected:
+            attr['bold'] = True
+        if self.focused and row == self.highlighted:
+            attr['highlight'] = True
+
+        self.draw(self._joinCells(cells), y, 0, **attr)
+
+    def _joinCells(self, cells):
+        """
+        the line showing the given cells of the visible columns,
+        exactly as wide as the table
+        """
+        line = (' ' * self.spacing).join(cells)
+        if self._scrolling:
+            line = line[:self.w].ljust(self.w)
+        return line
+
+    def render(self):
+        """
+        if this gets called, then one of our functions has indicated
+        that it's time for a redraw (through self.touch()), so we're
+        going to update and return the window object for the Engine to
+        draw.
+        """
+        if self._fitters is None:
+            self._layout()
 
-            formatted = self.format % tuple(item)
+            # every row depends on the layout
+            self._fullRepaint = True
 
-            self.draw(formatted, i - self.firstVisible + offset, 0, **attr);
+        # draws the header and the rows which need it
+        super(TextTable, self).render()
@@ -22,6 +22,9 @@
 # first get the core classes
 from core import *
 from events import *
+from models import *
+from formatters import *
+from highlight import *
 
 # import the widgets
 from Button import *
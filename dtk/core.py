@@ -754,6 +754,9 @@ class Engine(InputHandler):
                curses.KEY_IC    : "insert",
                curses.KEY_DC    : "delete",
 
+               curses.ascii.SUB : "ctrl z",
+               curses.ascii.EM  : "ctrl y",
+
                curses.KEY_F1  : "F1",
                curses.KEY_F2  : "F2",
                curses.KEY_F3  : "F3",
@@ -812,6 +815,14 @@ class Engine(InputHandler):
             self.cursesInitialized = False
             self.doWhenCursesInitialized = []
 
+            # callables run once each time through the main loop
+            # (see addTask)
+            self.tasks = []
+
+            # drawables drawn over the root each time through the
+            # main loop (see addOverlay)
+            self.overlays = []
+
             self.name = kwargs.get('name', 'dtk Application')
             self.title = self.name
 
@@ -932,9 +943,9 @@ class Engine(InputHandler):
         if len(self.eventQueue) > 0:
             self.log.debug('processing event queue with %d items', len(self.eventQueue))
 
-        # make a local copy
-        localEventQueue = list(self.eventQueue)
-        self.eventQueue = []
+        # swap in a fresh queue in a single assignment, so that
+        # events enqueued by other threads meanwhile are not lost
+        localEventQueue, self.eventQueue = self.eventQueue, []
 
         # FIXME: do we need this line? i think this had something
         # to do with InputContext
@@ -960,6 +971,56 @@ class Engine(InputHandler):
                 # this means the source or event was not bound anywhere
                 pass
 
+    def addTask(self, task):
+        """
+        add a task to be run once each time through the main loop,
+        before drawing. a task is a callable taking no arguments;
+        it stays scheduled until it returns False or is removed with
+        removeTask(). tasks must not block, and should do a bounded
+        amount of work each time they are called, since input is not
+        handled while they run. while any task is scheduled, the main
+        loop goes around every 1/10 second rather than every 1/2.
+        """
+        if task not in self.tasks:
+            self.tasks.append(task)
+
+    def removeTask(self, task):
+        """
+        remove a task added with addTask()
+        """
+        if task in self.tasks:
+            self.tasks.remove(task)
+
+    def runTasks(self):
+        """
+        call each scheduled task once, removing those that are done
+        """
+        for task in list(self.tasks):
+            if task() is False:
+                self.removeTask(task)
+
+    def addOverlay(self, drawable):
+        """
+        add a drawable to be drawn over the root, at the position
+        and size it has been given with setSize(), such as a popup
+        list. overlays are redrawn each time through the main loop,
+        after the root, so they should be small; they do not get
+        input unless it is passed to them.
+        """
+        if drawable not in self.overlays:
+            self.overlays.append(drawable)
+            drawable.touch()
+
+    def removeOverlay(self, drawable):
+        """
+        remove an overlay added with addOverlay(), and redraw
+        everything so that what it covered is shown again
+        """
+        if drawable in self.overlays:
+            self.overlays.remove(drawable)
+            if self.root is not None:
+                self.touchAll()
+
     def beginLogging(self, file = None, level = logging.ERROR, formatter = None, handler = None):
         """
         configure the logging subsystem and begin logging
@@ -1077,6 +1138,7 @@ class Engine(InputHandler):
         # this is necessary to handle input of (possibly
         # among others) 'esc'
         curses.halfdelay(5)
+        busy = False
 
 
         # NOTE: don't put any logging in the loop that will happen
@@ -1109,8 +1171,18 @@ class Engine(InputHandler):
             # wait to update the screen state
             self.scr.noutrefresh()
 
+            # go around faster while there are tasks to run
+            self.runTasks()
+            if busy != bool(self.tasks):
+                busy = bool(self.tasks)
+                if busy:
+                    curses.halfdelay(1)
+                else:
+                    curses.halfdelay(5)
 
             self.root.drawContents()
+            for overlay in self.overlays:
+                overlay.render()
             self.processEvents()
 
 
@@ -19,7 +19,7 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with DTK. If not, see <http://www.gnu.org/licenses/>.
 
-__all__ = ['Event', 'SelectionChanged', 'HighlightChanged', 'Clicked', 'TextChanged', 'Resized', 'event_bound']
+__all__ = ['Event', 'SelectionChanged', 'HighlightChanged', 'Clicked', 'TextChanged', 'Resized', 'FilterResults', 'SortResults', 'LoadProgress', 'SearchProgress', 'event_bound']
 
 def event_bound(event_type, **kwargs):
     def wrapper(target_function):
@@ -84,13 +84,31 @@ class TextChanged(Event):
     """
     Fired by a text-holding Widget when its text changes due
     to user input (ie, not if the program code calls setText()
-    or similar on the widget). The public attribute `text`
-    contains the current text of the widget, as a string
-    (possibly with newline characters).
+    or similar on the widget). The change is described by the
+    public attributes `position`, the offset in the text where
+    it happened, `removed`, the number of characters removed
+    there, and `inserted`, the text put in their place.
+
+    The public attribute `text` contains the current text of the
+    widget, as a string (possibly with newline characters). It
+    is only built the first time it is asked for, so listeners
+    which need just the change do not pay for a copy of the text.
     """
-    def __init__(self, source, text):
+    def __init__(self, source, text = None, position = 0, removed = 0, inserted = '', getText = None):
         Event.__init__(self, source)
-        self.text = text
+        self._text = text
+        self._getText = getText
+        self.position = position
+        self.removed = removed
+        self.inserted = inserted
+
+    def _gettext(self):
+        if self._text is None and self._getText is not None:
+            self._text = self._getText()
+            self._getText = None
+        return self._text
+
+    text = property(fget=_gettext)
 
 class Resized(Event):
     """
@@ -102,3 +120,62 @@ class Resized(Event):
         Event.__init__(self, source)
         self.width = width
         self.height = height
+
+class FilterResults(Event):
+    """
+    Fired by a ListBox as a background filter makes progress. The
+    public attribute `rows` holds the indices of the matching items
+    found so far, best match first, and `done` is True once the
+    whole list has been searched. `query` is the text being matched
+    and `generation` identifies the filter run, so that results of
+    a run which has since been superseded can be ignored.
+    """
+    def __init__(self, source, query, generation, rows, done):
+        Event.__init__(self, source)
+        self.query = query
+        self.generation = generation
+        self.rows = rows
+        self.done = done
+
+class SortResults(Event):
+    """
+    Fired by a TextTable when a sort running on a background thread
+    finishes. The public attribute `order` holds the indices of the
+    items in their sorted order, and `keys` the sort keys computed
+    for each column, by column number. `generation` identifies the
+    sort, and `version` the state of the items it sorted, so that
+    stale results can be ignored.
+    """
+    def __init__(self, source, generation, version, order, keys):
+        Event.__init__(self, source)
+        self.generation = generation
+        self.version = version
+        self.order = order
+        self.keys = keys
+
+class LoadProgress(Event):
+    """
+    Fired by a TextTable as a file opened with loadCSV() is scanned,
+    or by a TextEditor as one opened with loadFile() is. The public
+    attribute `rows` is the number of rows (or lines) available so
+    far, `progress` the fraction of the file scanned, and `done` is
+    True once it all has been.
+    """
+    def __init__(self, source, rows, progress, done):
+        Event.__init__(self, source)
+        self.rows = rows
+        self.progress = progress
+        self.done = done
+
+class SearchProgress(Event):
+    """
+    Fired by a TextEditor or Pager as a search started with find()
+    makes progress. The public attribute `matches` is the number of
+    matches found so far, `progress` the fraction of the text
+    searched, and `done` is True once it all has been.
+    """
+    def __init__(self, source, matches, progress, done):
+        Event.__init__(self, source)
+        self.matches = matches
+        self.progress = progress
+        self.done = done
@@ -0,0 +1,76 @@
+# DTK, a curses "GUI" toolkit for Python programs.
+# 
+# Copyright (C) 2006-2007 Dan Crosta
+# Copyright (C) 2006-2007 Ethan Jucovy
+# 
+# DTK is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# 
+# DTK is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+# 
+# You should have received a copy of the GNU Lesser General Public
+# License along with Foobar. If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['numberFormatter', 'dateFormatter']
+
+import time
+import datetime
+
+
+def numberFormatter(decimals = 0, grouping = False):
+    """
+    return a function which formats a number with the given number
+    of decimal places, and with commas between groups of thousands
+    if grouping is True. cells which are not numbers are shown as
+    they are.
+    """
+    format = '%%.%df' % decimals
+
+    def formatter(value):
+        if not isinstance(value, (int, long, float)):
+            return str(value)
+
+        text = format % value
+        if not grouping:
+            return text
+
+        if '.' in text:
+            whole, fraction = text.split('.')
+            fraction = '.' + fraction
+        else:
+            whole, fraction = text, ''
+
+        sign = ''
+        if whole.startswith('-'):
+            sign, whole = '-', whole[1:]
+
+        groups = []
+        while len(whole) > 3:
+            groups.insert(0, whole[-3:])
+            whole = whole[:-3]
+        groups.insert(0, whole)
+
+        return sign + ','.join(groups) + fraction
+
+    return formatter
+
+
+def dateFormatter(format = '%Y-%m-%d %H:%M'):
+    """
+    return a function which formats dates, datetimes and times,
+    and numbers of seconds since the epoch (as local time), with
+    the given strftime() format. other cells are shown as they are.
+    """
+    def formatter(value):
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.strftime(format)
+        if isinstance(value, (int, long, float)):
+            return time.strftime(format, time.localtime(value))
+        return str(value)
+
+    return formatter
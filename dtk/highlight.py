@@ -0,0 +1,272 @@
+# DTK, a curses "GUI" toolkit for Python programs.
+# 
+# Copyright (C) 2006-2007 Dan Crosta
+# Copyright (C) 2006-2007 Ethan Jucovy
+# 
+# DTK is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# 
+# DTK is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+# 
+# You should have received a copy of the GNU Lesser General Public
+# License along with Foobar. If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['Highlighter', 'RegexHighlighter', 'jsonHighlighter', 'yamlHighlighter']
+
+import re
+from bisect import bisect_right
+
+from textbuffer import BlockList, LazyBlock
+
+
+class Highlighter(object):
+    """
+    A Highlighter splits lines of text into styled runs, for a
+    TextEditor or Pager (see setHighlighter()). it is given one line
+    at a time, along with the state it returned at the end of the
+    line before (initial for the first line), so that it can carry
+    things like open comments from one line to the next. states must
+    compare equal when they mean the same, since highlighting after
+    an edit stops once they agree with the states from before it.
+    """
+
+    initial = None
+
+    def highlight(self, line, state):
+        """
+        return (runs, state): the runs of line to be styled, as
+        (start, end, style) where style is a dict of drawing
+        attributes as for draw(), in order and not overlapping, and
+        the state at the end of the line
+        """
+        return [], state
+
+
+class RegexHighlighter(Highlighter):
+    """
+    A Highlighter driven by regular expressions. rules maps the name
+    of each state to a list of (pattern, style, next) rules; at each
+    position in a line, the first rule of the current state whose
+    pattern matches (and is not empty) there applies: the text it
+    matches is drawn in style, unless that is None, and the state
+    becomes next, unless that is None. text which no rule matches
+    is not styled. the initial state is 'root'.
+    """
+
+    initial = 'root'
+
+    def __init__(self, rules):
+        self.rules = {}
+        for state, stateRules in rules.items():
+            self.rules[state] = [(re.compile(pattern), style, next)
+                                 for pattern, style, next in stateRules]
+
+    def highlight(self, line, state):
+        runs = []
+        pos = 0
+        while pos < len(line):
+            for regex, style, next in self.rules[state]:
+                match = regex.match(line, pos)
+                if match is not None and match.end() > pos:
+                    if style is not None:
+                        runs.append((pos, match.end(), style))
+                    if next is not None:
+                        state = next
+                    pos = match.end()
+                    break
+            else:
+                pos += 1
+        return runs, state
+
+
+def jsonHighlighter(key = None, string = None, number = None,
+                    keyword = None, comment = None):
+    """
+    return a RegexHighlighter for JSON, which also allows comments
+    (// to the end of the line, and /* */ over several lines). each
+    parameter is the style for that kind of text.
+    """
+    key = key or dict(bold=True)
+    string = string or dict(fg='green')
+    number = number or dict(fg='cyan')
+    keyword = keyword or dict(fg='magenta')
+    comment = comment or dict(fg='blue')
+
+    return RegexHighlighter({
+        'root': [
+            (r'"(\\.|[^"\\])*"(?=\s*:)', key, None),
+            (r'"(\\.|[^"\\])*"?', string, None),
+            (r'-?\d+(\.\d+)?([eE][-+]?\d+)?', number, None),
+            (r'\b(true|false|null)\b', keyword, None),
+            (r'//.*', comment, None),
+            (r'/\*', comment, 'comment'),
+            ],
+        'comment': [
+            (r'.*?\*/', comment, 'root'),
+            (r'.+', comment, None),
+            ],
+        })
+
+
+def yamlHighlighter(key = None, string = None, number = None,
+                    keyword = None, comment = None):
+    """
+    return a RegexHighlighter for YAML. keys, quoted strings,
+    numbers, true/false/null and comments are styled. each
+    parameter is the style for that kind of text.
+    """
+    key = key or dict(bold=True)
+    string = string or dict(fg='green')
+    number = number or dict(fg='cyan')
+    keyword = keyword or dict(fg='magenta')
+    comment = comment or dict(fg='blue')
+
+    return RegexHighlighter({
+        'root': [
+            (r'#.*', comment, None),
+            (r'(?<![^\s\-])[^\s#:\'"\-][^#:]*(?=:(\s|$))', key, None),
+            (r'"(\\.|[^"\\])*"?', string, None),
+            (r"'([^']|'')*'?", string, None),
+            (r'(?<![\w.])-?\d+(\.\d+)?(?![\w.])', number, None),
+            (r'\b(true|false|null|yes|no|on|off|~)\b', keyword, None),
+            (r'[^\s#\'"]+', None, None),
+            ],
+        })
+
+
+class _Unknown(object):
+    """
+    the state of a line which has not been highlighted since it
+    changed, which is equal to no other
+    """
+    pass
+
+_unknown = _Unknown()
+
+
+class StateIndex(BlockList):
+    """
+    StateIndex holds the state a Highlighter reached at the end of
+    each line of a LineBuffer, so that any line can be highlighted
+    on its own. the states are right for the first valid lines;
+    advance() highlights more lines to make it so for more of them.
+
+    after lines change (see update()), highlighting starts again
+    from the first changed line, and goes on only until the state
+    at the end of a line is the same as it was before; the lines
+    after that are right as they are, up to the next line changed
+    (or the first line never highlighted).
+    """
+
+    def __init__(self, buffer, highlighter):
+        self.buffer = buffer
+        self.highlighter = highlighter
+        self.valid = 0
+
+        # the lines after the first known have never been highlighted
+        self.known = 0
+
+        # the first line of each change since valid was last past it
+        self._changes = []
+
+        BlockList.__init__(self)
+        self.setBlocks(self._unknown(len(buffer)))
+
+    def _unknown(self, count):
+        size = self.blockSize
+        return [LazyBlock(min(size, count - i), min(size, count - i),
+                          lambda n = min(size, count - i): [_unknown] * n)
+                for i in xrange(0, count, size)]
+
+    def stateBefore(self, line):
+        """
+        return the state at the start of line, which must be no
+        more than valid
+        """
+        if line == 0:
+            return self.highlighter.initial
+        return self[line - 1]
+
+    def advance(self, stop, limit = None):
+        """
+        highlight lines until the states of the first stop lines are
+        right, or limit lines have been highlighted, and return
+        whether they are
+        """
+        stop = min(stop, len(self.buffer))
+        while self.valid < stop and limit != 0:
+            line = self.valid
+            state = self.highlighter.highlight(self.buffer[line], self.stateBefore(line))[1]
+            if self[line] == state:
+                # the rest are as they were, up to the next change
+                next = bisect_right(self._changes, line)
+                if next < len(self._changes):
+                    self.valid = min(self._changes[next], self.known)
+                else:
+                    self.valid = self.known
+                del self._changes[:next]
+            else:
+                self[line] = state
+                self.valid = line + 1
+                self.known = max(self.known, self.valid)
+            if limit is not None:
+                limit -= 1
+        return self.valid >= stop
+
+    def runs(self, line):
+        """
+        return the styled runs of line, whose state must be known
+        """
+        return self.highlighter.highlight(self.buffer[line], self.stateBefore(line))[0]
+
+    def update(self, start, stop, count):
+        """
+        note that lines start to stop of the buffer were replaced by
+        count lines
+        """
+        self.replaceItems(start, stop, [_unknown] * count)
+
+        delta = count - (stop - start)
+        changes = [c for c in self._changes if c < start]
+        changes.append(start)
+        changes.extend([c + delta for c in self._changes if c >= stop])
+        self._changes = changes
+        self.valid = min(self.valid, start)
+        if stop <= self.known:
+            self.known += delta
+        else:
+            self.known = min(self.known, start)
+
+    def extend(self, count):
+        """
+        note that count lines were added to the end of the buffer
+        """
+        self.appendBlocks(self._unknown(count))
+
+
+def rowRuns(runs, start, length):
+    """
+    split the length columns from start into pieces, as (start,
+    end, style) relative to start, by the runs which fall in them;
+    pieces between runs have an empty style
+    """
+    stop = start + length
+    pieces = []
+    pos = start
+    for s, e, style in runs:
+        if e <= pos or s >= stop:
+            continue
+        s = max(s, pos)
+        if s > pos:
+            pieces.append((pos - start, s - start, {}))
+        e = min(e, stop)
+        pieces.append((s - start, e - start, style))
+        pos = e
+    if pos < stop:
+        pieces.append((pos - start, stop - start, {}))
+    return pieces
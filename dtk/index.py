@@ -0,0 +1,357 @@
+# DTK, a curses "GUI" toolkit for Python programs.
+# 
+# Copyright (C) 2006-2007 Dan Crosta
+# Copyright (C) 2006-2007 Ethan Jucovy
+# 
+# DTK is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# 
+# DTK is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+# 
+# You should have received a copy of the GNU Lesser General Public
+# License along with Foobar. If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['PrefixIndex', 'HashIndex', 'CompletionIndex', 'PrefixSearch']
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappush, heappop
+
+
+def successor(prefix):
+    """
+    return the smallest string which sorts after every string
+    beginning with prefix, or None if there is no such string
+    """
+    while prefix:
+        last = ord(prefix[-1])
+        if isinstance(prefix, unicode) and last < 0x10ffff:
+            return prefix[:-1] + unichr(last + 1)
+        elif last < 255:
+            return prefix[:-1] + chr(last + 1)
+        prefix = prefix[:-1]
+    return None
+
+
+class PrefixIndex(object):
+    """
+    PrefixIndex keeps a sorted list of (key, position) pairs, so
+    that all the keys beginning with some prefix form a contiguous
+    range of the list which can be found with two binary searches.
+
+    ranges are returned as (lo, hi) slice bounds into the entries
+    list. passing a previous range back in to range() searches only
+    within it, which is how a lookup for a longer prefix narrows the
+    result of a shorter one rather than starting over.
+
+    positions are stored less the offset attribute, so that moving
+    every position at once (as dropping the first item of a list
+    does) is just a change to the offset.
+    """
+
+    def __init__(self, keys = ()):
+        self.entries = [(key, pos) for (pos, key) in enumerate(keys)]
+        self.entries.sort()
+        self.offset = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, i):
+        key, pos = self.entries[i]
+        return (key, pos + self.offset)
+
+    def range(self, prefix, lo = 0, hi = None):
+        """
+        return (lo, hi) such that entries[lo:hi] are exactly the
+        entries within the given bounds whose keys begin with prefix
+        """
+        if hi is None:
+            hi = len(self.entries)
+
+        start = bisect_left(self.entries, (prefix,), lo, hi)
+        after = successor(prefix)
+        if after is None:
+            return (start, hi)
+
+        return (start, bisect_left(self.entries, (after,), start, hi))
+
+    def span(self, low = None, high = None):
+        """
+        return (lo, hi) such that entries[lo:hi] are exactly the
+        entries whose keys k satisfy low <= k < high; either bound
+        may be None, for no bound
+        """
+        lo = 0
+        hi = len(self.entries)
+        if low is not None:
+            lo = bisect_left(self.entries, (low,))
+        if high is not None:
+            hi = bisect_left(self.entries, (high,), lo)
+        return (lo, hi)
+
+    def positions(self, lo, hi):
+        """
+        return the positions of entries[lo:hi] in ascending order
+        """
+        offset = self.offset
+        out = [pos + offset for (key, pos) in self.entries[lo:hi]]
+        out.sort()
+        return out
+
+    def find(self, key, pos, lo = 0, hi = None):
+        """
+        return the index of the first entry not less than (key, pos)
+        within the given bounds
+        """
+        if hi is None:
+            hi = len(self.entries)
+        return bisect_left(self.entries, (key, pos - self.offset), lo, hi)
+
+    def findAfter(self, key, pos, lo = 0, hi = None):
+        """
+        return the index of the first entry greater than (key, pos)
+        within the given bounds
+        """
+        if hi is None:
+            hi = len(self.entries)
+        return bisect_right(self.entries, (key, pos - self.offset), lo, hi)
+
+    def add(self, key, pos):
+        insort(self.entries, (key, pos - self.offset))
+
+    def discard(self, key, pos):
+        entry = (key, pos - self.offset)
+        i = bisect_left(self.entries, entry)
+        if i < len(self.entries) and self.entries[i] == entry:
+            del self.entries[i]
+
+    def shift(self, start, delta):
+        """
+        add delta to every position at or after start. this keeps
+        the index in step with an insertion or removal in the middle
+        of the list it indexes, and costs O(n) just like the list
+        operation itself does, unless start is 0
+        """
+        if start <= 0:
+            self.offset += delta
+            return
+
+        start -= self.offset
+        entries = self.entries
+        for i in xrange(len(entries)):
+            key, pos = entries[i]
+            if pos >= start:
+                entries[i] = (key, pos + delta)
+
+
+class HashIndex(object):
+    """
+    HashIndex maps each key to the sorted list of positions at which
+    it occurs, so that all the positions holding a key are found
+    with a single lookup. like PrefixIndex, positions are stored
+    less the offset attribute.
+    """
+
+    def __init__(self, keys = ()):
+        self.table = {}
+        self.offset = 0
+        for (pos, key) in enumerate(keys):
+            self.table.setdefault(key, []).append(pos)
+
+    def __len__(self):
+        return sum([len(positions) for positions in self.table.values()])
+
+    def count(self, key):
+        return len(self.table.get(key, ()))
+
+    def positions(self, key):
+        """
+        return the positions holding key in ascending order
+        """
+        offset = self.offset
+        return [pos + offset for pos in self.table.get(key, ())]
+
+    def add(self, key, pos):
+        insort(self.table.setdefault(key, []), pos - self.offset)
+
+    def discard(self, key, pos):
+        positions = self.table.get(key)
+        if positions is None:
+            return
+
+        pos -= self.offset
+        i = bisect_left(positions, pos)
+        if i < len(positions) and positions[i] == pos:
+            del positions[i]
+            if not positions:
+                del self.table[key]
+
+    def shift(self, start, delta):
+        """
+        add delta to every position at or after start; see
+        PrefixIndex.shift()
+        """
+        if start <= 0:
+            self.offset += delta
+            return
+
+        start -= self.offset
+        for positions in self.table.values():
+            for i in xrange(bisect_left(positions, start), len(positions)):
+                positions[i] += delta
+
+
+class CompletionIndex(object):
+    """
+    CompletionIndex holds a fixed set of candidate strings for
+    completion, sorted in a single list, so that the candidates
+    beginning with a prefix form a contiguous range of it (the list
+    is a trie laid flat: each node is a range, and a child is found
+    by searching only within its parent's range). this costs no
+    more memory than the strings themselves.
+
+    candidates may be given weights, higher being better, in which
+    case top() returns the best of a range in order of weight, by
+    way of a tree of the best candidate of each power-of-two span
+    (one array of 2n integers). without weights, the candidates of
+    a range are returned in sorted order.
+    """
+
+    def __init__(self, candidates, weights = None):
+        if weights is None:
+            self.keys = sorted(set(candidates))
+            self.weights = None
+            return
+
+        best = {}
+        for key, weight in zip(candidates, weights):
+            if key not in best or weight > best[key]:
+                best[key] = weight
+        self.keys = sorted(best)
+        self.weights = array('d', [best[key] for key in self.keys])
+
+        # tree[n + i] is candidate i; tree[j] is the better of
+        # tree[2j] and tree[2j + 1]
+        n = len(self.keys)
+        tree = array('l', [0]) * n + array('l', xrange(n))
+        w = self.weights
+        for j in xrange(n - 1, 0, -1):
+            a, b = tree[2 * j], tree[2 * j + 1]
+            if w[b] > w[a]:
+                a = b
+            tree[j] = a
+        self._tree = tree
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        return self.keys[i]
+
+    def range(self, prefix, lo = 0, hi = None):
+        """
+        return (lo, hi) such that keys[lo:hi] are exactly the keys
+        within the given bounds which begin with prefix
+        """
+        if hi is None:
+            hi = len(self.keys)
+
+        start = bisect_left(self.keys, prefix, lo, hi)
+        after = successor(prefix)
+        if after is None:
+            return (start, hi)
+
+        return (start, bisect_left(self.keys, after, start, hi))
+
+    def _best(self, lo, hi):
+        """
+        return the index of the best weighted key in keys[lo:hi],
+        which must not be empty
+        """
+        tree = self._tree
+        w = self.weights
+        n = len(self.keys)
+        best = None
+        lo += n
+        hi += n
+        while lo < hi:
+            if lo & 1:
+                if best is None or w[tree[lo]] > w[best] or \
+                        (w[tree[lo]] == w[best] and tree[lo] < best):
+                    best = tree[lo]
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                if best is None or w[tree[hi]] > w[best] or \
+                        (w[tree[hi]] == w[best] and tree[hi] < best):
+                    best = tree[hi]
+            lo >>= 1
+            hi >>= 1
+        return best
+
+    def top(self, lo, hi, count):
+        """
+        return up to count of keys[lo:hi], best first
+        """
+        if self.weights is None:
+            return self.keys[lo:min(hi, lo + count)]
+
+        out = []
+        heap = []
+        if lo < hi:
+            best = self._best(lo, hi)
+            heap.append((-self.weights[best], best, lo, hi))
+        while heap and len(out) < count:
+            weight, i, lo, hi = heappop(heap)
+            out.append(self.keys[i])
+            for lo, hi in ((lo, i), (i + 1, hi)):
+                if lo < hi:
+                    best = self._best(lo, hi)
+                    heappush(heap, (-self.weights[best], best, lo, hi))
+        return out
+
+
+class PrefixSearch(object):
+    """
+    PrefixSearch looks up a prefix which changes a little at a time,
+    as it is typed, in a CompletionIndex. it keeps the range found
+    for each prefix looked up since the last which did not extend
+    it, so that typing another character searches only within the
+    range already found, and deleting one goes back to the range
+    found before.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.prefix = ''
+        self._ranges = [('', 0, len(index))]
+
+    def search(self, prefix):
+        """
+        return (lo, hi) such that index.keys[lo:hi] are exactly the
+        keys which begin with prefix
+        """
+        ranges = self._ranges
+        while not prefix.startswith(ranges[-1][0]):
+            ranges.pop()
+
+        last, lo, hi = ranges[-1]
+        if prefix != last:
+            lo, hi = self.index.range(prefix, lo, hi)
+            ranges.append((prefix, lo, hi))
+
+        self.prefix = prefix
+        return (lo, hi)
+
+    def top(self, prefix, count):
+        """
+        return up to count keys which begin with prefix, best first
+        """
+        lo, hi = self.search(prefix)
+        return self.index.top(lo, hi, count)
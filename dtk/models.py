@@ -0,0 +1,1008 @@
+# DTK, a curses "GUI" toolkit for Python programs.
+# 
+# Copyright (C) 2006-2007 Dan Crosta
+# Copyright (C) 2006-2007 Ethan Jucovy
+# 
+# DTK is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+# 
+# DTK is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+# 
+# You should have received a copy of the GNU Lesser General Public
+# License along with Foobar. If not, see <http://www.gnu.org/licenses/>.
+
+
+__all__ = ['RingBuffer', 'RowModel', 'ColumnStore', 'SQLiteModel', 'CSVModel']
+
+import os
+import csv
+import mmap
+import threading
+import Queue
+from cStringIO import StringIO
+from array import array
+
+from util import LRUCache
+
+
+class RingBuffer(object):
+    """
+    RingBuffer is a list-like sequence holding at most maxlen items.
+    appending to a full RingBuffer drops the oldest item, and both
+    appending and dropping take constant time, as does indexing.
+
+    insertions and removals anywhere but the ends are supported so
+    that a RingBuffer can stand in for a list, but they copy the
+    contents, like they would for a list.
+    """
+
+    def __init__(self, maxlen, items = ()):
+        if maxlen < 1:
+            raise ValueError("maxlen must be at least 1")
+
+        self.maxlen = maxlen
+        self._reset(items)
+
+    def _reset(self, items):
+        items = list(items)[-self.maxlen:]
+        self._size = len(items)
+        self._data = items + [None] * (self.maxlen - len(items))
+        self._head = 0
+
+    def __len__(self):
+        return self._size
+
+    def _pos(self, i):
+        """
+        the position in _data of the item at index i
+        """
+        if i < 0:
+            i += self._size
+        if i < 0 or i >= self._size:
+            raise IndexError("RingBuffer index out of range")
+        return (self._head + i) % self.maxlen
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self._size))]
+        return self._data[self._pos(i)]
+
+    def __setitem__(self, i, item):
+        if isinstance(i, slice):
+            items = list(self)
+            items[i] = item
+            self._reset(items)
+        else:
+            self._data[self._pos(i)] = item
+
+    def __delitem__(self, i):
+        if i == 0 or i == -self._size:
+            self.popleft()
+        else:
+            items = list(self)
+            del items[i]
+            self._reset(items)
+
+    def __iter__(self):
+        data = self._data
+        for i in xrange(self._head, self._head + self._size):
+            yield data[i % self.maxlen]
+
+    def __contains__(self, item):
+        for elm in self:
+            if elm == item:
+                return True
+        return False
+
+    def append(self, item):
+        """
+        append item, dropping the oldest item if the RingBuffer
+        is full
+        """
+        if self._size < self.maxlen:
+            self._data[(self._head + self._size) % self.maxlen] = item
+            self._size += 1
+        else:
+            self._data[self._head] = item
+            self._head = (self._head + 1) % self.maxlen
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def popleft(self):
+        """
+        remove and return the oldest item
+        """
+        item = self._data[self._pos(0)]
+        self._data[self._head] = None
+        self._head = (self._head + 1) % self.maxlen
+        self._size -= 1
+        return item
+
+    def pop(self, i = -1):
+        if i == 0 or i == -self._size:
+            return self.popleft()
+
+        pos = self._pos(i)
+        if pos == self._pos(-1):
+            item = self._data[pos]
+            self._data[pos] = None
+            self._size -= 1
+            return item
+
+        items = list(self)
+        item = items.pop(i)
+        self._reset(items)
+        return item
+
+    def insert(self, i, item):
+        items = list(self)
+        items.insert(i, item)
+        self._reset(items)
+
+    def remove(self, item):
+        del self[self.index(item)]
+
+    def index(self, item, *args):
+        return list(self).index(item, *args)
+
+    def count(self, item):
+        return list(self).count(item)
+
+    def reverse(self):
+        items = list(self)
+        items.reverse()
+        self._reset(items)
+
+
+class RowModel(object):
+    """
+    RowModel is the base class of models which hold the rows of a
+    TextTable (or the items of a ListBox) some other way than as a
+    list of Python objects. ListBox.setItems() keeps a RowModel as
+    it is, rather than copying it into a list.
+
+    subclasses must provide __len__() and __getitem__(), which for
+    an index returns the row there as a tuple, and for a slice
+    returns a list of rows. the other methods here work in terms of
+    those, and subclasses override them where they can do better.
+    models which can be changed also provide the list methods
+    which change a list, including slice assignment.
+    """
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def __contains__(self, row):
+        for elm in self:
+            if elm == row:
+                return True
+        return False
+
+    def index(self, row, start = 0, stop = None):
+        if stop is None:
+            stop = len(self)
+        for i in xrange(start, stop):
+            if self[i] == row:
+                return i
+        raise ValueError("row not in model")
+
+    def count(self, row):
+        n = 0
+        for elm in self:
+            if elm == row:
+                n += 1
+        return n
+
+    def column(self, col, start = 0, stop = None):
+        """
+        return a sequence of the values in column col of rows
+        start to stop, with None for rows too short to have one
+        """
+        if stop is None:
+            stop = len(self)
+        values = []
+        for row in self[start:stop]:
+            if col < len(row):
+                values.append(row[col])
+            else:
+                values.append(None)
+        return values
+
+    def take(self, indices):
+        """
+        return a model of the same kind holding the rows at the
+        given indices, in that order
+        """
+        return [self[i] for i in indices]
+
+    def copy(self):
+        """
+        return a copy which does not change along with this model
+        """
+        return self.take(xrange(len(self)))
+
+    def sort(self, sortColumns):
+        """
+        models which can sort themselves (say, by having a database
+        do it) sort by sortColumns, a list of (column, descending)
+        pairs, most significant first, and return True. see
+        TextTable.sortBy()
+        """
+        return False
+
+    def filter(self, conditions):
+        """
+        models which can filter themselves keep only the rows meeting
+        conditions, or all of them again if there are none, and
+        return True. see TextTable.filterBy()
+        """
+        return False
+
+
+class StringColumn(object):
+    """
+    a column of strings stored end to end in one character array,
+    with an array of the offsets at which each begins. unicode
+    strings are stored encoded as UTF-8.
+
+    a string replaced by one of another length is kept aside, in
+    replaced, until the column is next copied, so that replacing a
+    string does not move all those after it.
+    """
+
+    def __init__(self, decode = False, values = ()):
+        self.decode = decode
+        self.data = array('c')
+        self.offsets = array('L', [0])
+        self.replaced = {}
+        self.extend(values)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i in self.replaced:
+            value = self.replaced[i]
+        else:
+            value = self.data[self.offsets[i]:self.offsets[i + 1]].tostring()
+        if self.decode:
+            return value.decode('utf-8')
+        return value
+
+    def __setitem__(self, i, value):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StringColumn index out of range")
+        if self.decode:
+            value = value.encode('utf-8')
+
+        start = self.offsets[i]
+        stop = self.offsets[i + 1]
+        if len(value) == stop - start:
+            self.data[start:stop] = array('c', value)
+            self.replaced.pop(i, None)
+            return
+
+        self.replaced[i] = value
+        if len(self.replaced) > len(self) / 8 + 16:
+            # put them back in place before they take too much room
+            packed = self.take(xrange(len(self)))
+            self.data = packed.data
+            self.offsets = packed.offsets
+            self.replaced = {}
+
+    def slice(self, start, stop):
+        return [self[i] for i in xrange(start, stop)]
+
+    def extend(self, values):
+        data = self.data
+        offsets = self.offsets
+        for value in values:
+            if self.decode:
+                value = value.encode('utf-8')
+            data.fromstring(value)
+            offsets.append(len(data))
+
+    def take(self, indices):
+        column = StringColumn(self.decode)
+        data = self.data
+        offsets = self.offsets
+        replaced = self.replaced
+        for i in indices:
+            if i in replaced:
+                column.data.fromstring(replaced[i])
+            else:
+                column.data.extend(data[offsets[i]:offsets[i + 1]])
+            column.offsets.append(len(column.data))
+        return column
+
+    def copy(self):
+        column = StringColumn(self.decode)
+        column.data = self.data[:]
+        column.offsets = self.offsets[:]
+        column.replaced = self.replaced.copy()
+        return column
+
+    def splice(self, start, stop, values):
+        """
+        replace the strings from start to stop with values
+        """
+        tail = self.take(xrange(stop, len(self)))
+        del self.data[self.offsets[start]:]
+        del self.offsets[start + 1:]
+        for i in [i for i in self.replaced if i >= start]:
+            del self.replaced[i]
+        self.extend(values)
+
+        base = len(self.data)
+        self.data.extend(tail.data)
+        self.offsets.extend(array('L', [base + offset for offset in tail.offsets[1:]]))
+
+    def reverse(self):
+        reversed = self.take(xrange(len(self) - 1, -1, -1))
+        self.data = reversed.data
+        self.offsets = reversed.offsets
+        self.replaced = {}
+
+
+class ColumnStore(RowModel):
+    """
+    ColumnStore holds rows column by column: each column of numbers
+    is an array.array of the typecode given for it, and each column
+    of strings ('str' or 'unicode') is a StringColumn. this takes a
+    small fraction of the memory that a list of tuples would, and
+    lets operations on a column work on the column as a whole (see
+    column()). rows are read and written as tuples, with one value
+    for each column.
+
+    appending or replacing rows is cheap; inserting or removing
+    rows anywhere but the end copies the columns after them, as it
+    would for a list.
+    """
+
+    # rows are split into columns this many at a time
+    chunkSize = 10000
+
+    def __init__(self, types, rows = ()):
+        self.types = tuple(types)
+        self.columns = [self._newColumn(t) for t in self.types]
+        self._size = 0
+        self.extend(rows)
+
+    def _newColumn(self, t, values = ()):
+        if t == 'str':
+            return StringColumn(False, values)
+        elif t == 'unicode':
+            return StringColumn(True, values)
+        return array(t, values)
+
+    def __len__(self):
+        return self._size
+
+    def _index(self, i):
+        if i < 0:
+            i += self._size
+        if i < 0 or i >= self._size:
+            raise IndexError("ColumnStore index out of range")
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self._size))]
+        i = self._index(i)
+        return tuple([column[i] for column in self.columns])
+
+    def __setitem__(self, i, rows):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self._size)
+            if step != 1:
+                raise ValueError("ColumnStore does not support extended slices")
+            self._splice(start, max(start, stop), list(rows))
+        else:
+            # replaced in place, column by column
+            i = self._index(i)
+            if len(rows) != len(self.types):
+                raise ValueError("rows must have %d values" % len(self.types))
+            for (column, value) in zip(self.columns, rows):
+                column[i] = value
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            self[i] = []
+        else:
+            i = self._index(i)
+            self._splice(i, i + 1, [])
+
+    def _split(self, rows):
+        """
+        return the values of each column of rows
+        """
+        width = len(self.types)
+        for row in rows:
+            if len(row) != width:
+                raise ValueError("rows must have %d values" % width)
+        if not rows:
+            return [[] for t in self.types]
+        return zip(*rows)
+
+    def _splice(self, start, stop, rows):
+        """
+        replace rows start to stop with rows
+        """
+        for (column, values) in zip(self.columns, self._split(rows)):
+            if isinstance(column, StringColumn):
+                column.splice(start, stop, values)
+            else:
+                column[start:stop] = array(column.typecode, values)
+        self._size += len(rows) - (stop - start)
+
+    def append(self, row):
+        self.extend([row])
+
+    def extend(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunkSize:
+                self._extend(chunk)
+                chunk = []
+        self._extend(chunk)
+
+    def _extend(self, rows):
+        if not rows:
+            return
+        for (column, values) in zip(self.columns, self._split(rows)):
+            column.extend(values)
+        self._size += len(rows)
+
+    def insert(self, i, row):
+        # normalize the index the way list.insert does
+        if i < 0:
+            i = max(0, i + self._size)
+        elif i > self._size:
+            i = self._size
+        self._splice(i, i, [row])
+
+    def pop(self, i = -1):
+        i = self._index(i)
+        row = self[i]
+        self._splice(i, i + 1, [])
+        return row
+
+    def remove(self, row):
+        del self[self.index(row)]
+
+    def reverse(self):
+        for column in self.columns:
+            column.reverse()
+
+    def column(self, col, start = 0, stop = None):
+        """
+        return the values of column col of rows start to stop. for
+        a column of numbers this is an array.array
+        """
+        if stop is None:
+            stop = self._size
+        column = self.columns[col]
+        if isinstance(column, StringColumn):
+            return column.slice(start, stop)
+        return column[start:stop]
+
+    def take(self, indices):
+        indices = list(indices)
+        out = ColumnStore(self.types)
+        out.columns = []
+        for column in self.columns:
+            if isinstance(column, StringColumn):
+                out.columns.append(column.take(indices))
+            else:
+                out.columns.append(array(column.typecode, [column[i] for i in indices]))
+        out._size = len(indices)
+        return out
+
+    def copy(self):
+        out = ColumnStore(self.types)
+        out.columns = []
+        for column in self.columns:
+            if isinstance(column, StringColumn):
+                out.columns.append(column.copy())
+            else:
+                out.columns.append(column[:])
+        out._size = self._size
+        return out
+
+    def where(self, col, predicate):
+        """
+        return the indices of the rows whose value in column col
+        satisfies predicate, looking only at that column
+        """
+        return [i for (i, value) in enumerate(self.column(col)) if predicate(value)]
+
+
+class SQLiteModel(RowModel):
+    """
+    SQLiteModel shows the rows of an SQLite table (or view) without
+    loading them all: rows are fetched a page at a time as they are
+    needed, and the pages next to the one last fetched are fetched
+    ahead on a background thread. the most recently used pages are
+    kept, and the number of rows is counted once and kept until the
+    query changes.
+
+    sorting and filtering (see TextTable.sortBy() and filterBy())
+    are done by the database, with ORDER BY and WHERE. pages which
+    follow one already fetched are found from its last row (keyset
+    pagination), so scrolling on through a large table does not get
+    slower the further it goes; other pages use OFFSET.
+
+    the model is read only. call refresh() after the table changes,
+    and close() when done with it.
+    """
+
+    def __init__(self, database, table, columns, where = None, params = (),
+                 pageSize = 200, cachePages = 50, prefetch = True, scalar = False):
+        """
+        database is the path of the database file, or an open
+        sqlite3 connection, which must have been opened with
+        check_same_thread=False if prefetch is True. columns are the
+        names of the columns shown, and where, if given, is an SQL
+        condition (with params for its placeholders) which every row
+        shown must meet. scalar makes the rows of a model of a
+        single column be its values rather than 1-tuples, which is
+        better suited to a ListBox.
+        """
+        # a database given by path is opened by the model, and
+        # separately by the prefetching thread
+        self.path = None
+        if isinstance(database, basestring):
+            import sqlite3
+            self.path = database
+            database = sqlite3.connect(database, check_same_thread = False)
+
+        self.connection = database
+        self.table = table
+        self.columns = list(columns)
+        self.where = where
+        self.params = tuple(params)
+        self.pageSize = pageSize
+        self.scalar = scalar and len(self.columns) == 1
+
+        # the conditions of the current filter, as SQL and params,
+        # and the current order, as (column, descending) pairs
+        self._filter = []
+        self._order = []
+
+        # any change to the query starts a new generation, so that
+        # pages being fetched for the old one are thrown away
+        self._generation = 0
+        self._pages = LRUCache(cachePages)
+        self._count = None
+        self._lock = threading.RLock()
+
+        self._queue = None
+        self._thread = None
+        if prefetch:
+            self._queue = Queue.Queue()
+            self._thread = threading.Thread(target = self._prefetchWorker)
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def _quote(self, name):
+        return '"%s"' % name.replace('"', '""')
+
+    def _conditions(self):
+        """
+        the WHERE conditions of the query, and their params
+        """
+        conditions = []
+        params = []
+        if self.where:
+            conditions.append('(%s)' % self.where)
+            params.extend(self.params)
+        for (sql, values) in self._filter:
+            conditions.append(sql)
+            params.extend(values)
+        return conditions, params
+
+    def __len__(self):
+        self._lock.acquire()
+        try:
+            if self._count is None:
+                conditions, params = self._conditions()
+                sql = 'SELECT COUNT(*) FROM %s' % self._quote(self.table)
+                if conditions:
+                    sql += ' WHERE ' + ' AND '.join(conditions)
+                self._count = self.connection.execute(sql, params).fetchone()[0]
+            return self._count
+        finally:
+            self._lock.release()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self)))]
+
+        size = len(self)
+        if i < 0:
+            i += size
+        if i < 0 or i >= size:
+            raise IndexError("SQLiteModel index out of range")
+
+        page = self._page(i / self.pageSize)
+        row = page[i % self.pageSize][:len(self.columns)]
+        if self.scalar:
+            return row[0]
+        return row
+
+    def _page(self, number):
+        """
+        return the rows of the given page, fetching it if need be,
+        and ask for the pages on either side to be fetched ahead
+        """
+        self._lock.acquire()
+        try:
+            rows = self._pages.get(number)
+            generation = self._generation
+            if rows is None:
+                sql, params = self._query(number)
+        finally:
+            self._lock.release()
+
+        if rows is None:
+            rows = self.connection.execute(sql, params).fetchall()
+            self._publish(number, generation, rows)
+
+        if self._queue is not None:
+            for neighbour in (number + 1, number - 1):
+                if neighbour >= 0 and neighbour * self.pageSize < len(self) and \
+                       neighbour not in self._pages:
+                    self._queue.put((neighbour, generation))
+
+        return rows
+
+    def _query(self, number):
+        """
+        return the query for the given page, as SQL and params,
+        which is run without holding the lock. rows come back with
+        their rowid after the columns shown.
+        """
+        conditions, params = self._conditions()
+
+        order = [(self._quote(self.columns[col]), descending)
+                 for (col, descending) in self._order]
+        directions = set([descending for (name, descending) in order])
+        uniform = len(directions) <= 1
+        descending = directions and directions.pop() or False
+        order.append(('rowid', descending))
+
+        # start after the last row of the page before, if we have it
+        # and can compare rows in a single direction
+        previous = self._pages.get(number - 1)
+        offset = number * self.pageSize
+        if previous and uniform:
+            last = previous[-1]
+            keys = [last[col] for (col, d) in self._order] + [last[-1]]
+        if previous and uniform and None not in keys:
+            names = [name for (name, d) in order]
+            after = ['(%s) %s (%s)' % (', '.join(names), descending and '<' or '>',
+                                       ', '.join(['?'] * len(keys)))]
+            params.extend(keys)
+            if descending:
+                # NULL sorts first, so comes last in descending order,
+                # but compares as neither less nor greater
+                for i in xrange(len(names) - 1):
+                    after.append('(%s)' % ' AND '.join(['%s = ?' % name for name in names[:i]] +
+                                                       ['%s IS NULL' % names[i]]))
+                    params.extend(keys[:i])
+            conditions.append('(%s)' % ' OR '.join(after))
+            offset = 0
+
+        sql = 'SELECT %s, rowid FROM %s' % (', '.join(map(self._quote, self.columns)),
+                                            self._quote(self.table))
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY ' + ', '.join(['%s %s' % (name, d and 'DESC' or 'ASC')
+                                        for (name, d) in order])
+        sql += ' LIMIT ? OFFSET ?'
+        params.extend([self.pageSize, offset])
+
+        return sql, params
+
+    def _publish(self, number, generation, rows):
+        """
+        keep the rows fetched for a page, unless the query changed
+        while they were
+        """
+        self._lock.acquire()
+        try:
+            if generation == self._generation:
+                self._pages.put(number, rows)
+        finally:
+            self._lock.release()
+
+    def _prefetchWorker(self):
+        """
+        body of the thread which fetches pages ahead of need. the
+        lock is held only to find the query and keep its rows, so
+        the model can be used while the query runs.
+        """
+        queue = self._queue
+        connection = self.connection
+        if self.path is not None:
+            import sqlite3
+            connection = sqlite3.connect(self.path)
+
+        while True:
+            request = queue.get()
+            try:
+                if request is None:
+                    break
+
+                number, generation = request
+                self._lock.acquire()
+                try:
+                    if generation != self._generation or number in self._pages:
+                        continue
+                    sql, params = self._query(number)
+                finally:
+                    self._lock.release()
+
+                rows = connection.execute(sql, params).fetchall()
+                self._publish(number, generation, rows)
+            finally:
+                queue.task_done()
+
+        if connection is not self.connection:
+            connection.close()
+
+    def refresh(self):
+        """
+        forget the cached pages and count, after the table changed
+        """
+        self._lock.acquire()
+        try:
+            self._generation += 1
+            self._pages.clear()
+            self._count = None
+        finally:
+            self._lock.release()
+
+    def close(self):
+        """
+        stop fetching ahead, and close the connection if the model
+        opened it; the model may not be used after
+        """
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = None
+            self._thread = None
+        if self.path is not None:
+            self.connection.close()
+
+    def sort(self, sortColumns):
+        self._order = list(sortColumns)
+        self.refresh()
+        return True
+
+    def filter(self, conditions):
+        """
+        turn TextTable.filterBy() conditions into SQL. 'contains'
+        conditions match the stored value, rather than the text a
+        formatter makes of it.
+        """
+        sqlConditions = []
+        for (col, op, value) in conditions:
+            name = self._quote(self.columns[col])
+            if op == '==':
+                sqlConditions.append(('%s = ?' % name, [value]))
+            elif op == 'in':
+                value = list(value)
+                sqlConditions.append(('%s IN (%s)' % (name, ', '.join(['?'] * len(value))),
+                                      value))
+            elif op == 'range':
+                low, high = value
+                if low is not None:
+                    sqlConditions.append(('%s >= ?' % name, [low]))
+                if high is not None:
+                    sqlConditions.append(('%s < ?' % name, [high]))
+            else:
+                pattern = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                sqlConditions.append(("lower(%s) LIKE ? ESCAPE '\\'" % name,
+                                      ['%' + pattern + '%']))
+
+        self._filter = sqlConditions
+        self.refresh()
+        return True
+
+
+class CSVModel(RowModel):
+    """
+    CSVModel shows the rows of a CSV or TSV file without reading it
+    in: the file is memory mapped, and a background thread scans it
+    in chunks, noting where every blockSize'th row starts. a row is
+    parsed only when it is asked for, along with the rest of its
+    block, and the most recently used blocks are kept, so memory
+    use is bounded by cacheBlocks rather than the size of the file.
+
+    rows become available as they are scanned, but len() counts
+    only those made available by update(), so that the length seen
+    by a widget changes only when it is told about it; see
+    TextTable.loadCSV(). the progress attribute is the fraction of
+    the file scanned, and done is True once it all has been.
+
+    quoted fields may span lines. the model is read only.
+    """
+
+    blockSize = 64
+    chunkSize = 1 << 20
+
+    def __init__(self, path, delimiter = None, header = False, cacheBlocks = 200):
+        """
+        delimiter defaults to a tab for files named .tsv or .tab,
+        and a comma otherwise. if header is True, the first row
+        holds the names of the columns, which are kept in the
+        header attribute rather than shown as a row.
+        """
+        if delimiter is None:
+            if os.path.splitext(path)[1].lower() in ('.tsv', '.tab'):
+                delimiter = '\t'
+            else:
+                delimiter = ','
+
+        self.path = path
+        self.delimiter = delimiter
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self.map = ''
+
+        # the first row is parsed straight away, for the header or
+        # at least the number of columns
+        end = self.map.find('\n')
+        if end < 0:
+            end = self.size
+        first = self._parse(0, end + 1)
+        first = first and list(first[0]) or []
+        self.width = len(first)
+        self.header = None
+        start = 0
+        if header:
+            self.header = first
+            start = min(end + 1, self.size)
+
+        # where each block of rows starts, and the (rows, offset)
+        # scanned so far, updated as a pair by the scanning thread
+        self._blocks = array('L', [start])
+        self._scanned = (0, start)
+        self._rows = 0
+        self._end = start
+        self._cache = LRUCache(cacheBlocks)
+        self.progress = self.size and float(start) / self.size or 1.0
+        self.done = False
+
+        self._thread = threading.Thread(target = self._scanWorker, args = (start,))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _scanWorker(self, pos):
+        """
+        body of the thread which finds where the rows start. lines
+        are counted a chunk at a time; only chunks containing quotes
+        are looked at line by line, since a quoted field may hold a
+        line break which does not end the row.
+        """
+        data = self.map
+        size = self.size
+        blockSize = self.blockSize
+        blocks = self._blocks
+        rows = 0
+        end = pos
+        quoted = False
+        chunkSize = self.chunkSize
+
+        while pos < size:
+            chunk = data[pos:pos + chunkSize]
+            if pos + len(chunk) < size:
+                cut = chunk.rfind('\n') + 1
+                if not cut:
+                    # a line longer than a chunk
+                    chunkSize *= 2
+                    continue
+                chunk = chunk[:cut]
+            lines = chunk.split('\n')
+            if chunk.endswith('\n'):
+                lines.pop()
+
+            if not quoted and '"' not in chunk:
+                i = 0
+                p = pos
+                while i + blockSize - rows % blockSize <= len(lines):
+                    need = blockSize - rows % blockSize
+                    p += sum(map(len, lines[i:i + need])) + need
+                    i += need
+                    rows += need
+                    blocks.append(min(p, size))
+                rows += len(lines) - i
+                end = pos + len(chunk)
+            else:
+                p = pos
+                for line in lines:
+                    if line.count('"') % 2:
+                        quoted = not quoted
+                    p += len(line) + 1
+                    if not quoted:
+                        rows += 1
+                        end = min(p, size)
+                        if rows % blockSize == 0:
+                            blocks.append(end)
+
+            pos += len(chunk)
+            chunkSize = self.chunkSize
+            self._scanned = (rows, end)
+            self.progress = float(pos) / size
+
+        self.done = True
+
+    def update(self):
+        """
+        make the rows scanned since the last call available, and
+        return how many there were
+        """
+        rows, end = self._scanned
+        added = rows - self._rows
+        self._rows = rows
+        self._end = end
+        return added
+
+    def _parse(self, start, end):
+        return [tuple(row) for row in
+                csv.reader(StringIO(self.map[start:end]), delimiter = self.delimiter)]
+
+    def _block(self, number):
+        rows = self._cache.get(number)
+        if rows is None or len(rows) < min(self.blockSize, self._rows - number * self.blockSize):
+            if number + 1 < len(self._blocks):
+                end = self._blocks[number + 1]
+            else:
+                end = self._end
+            rows = self._parse(self._blocks[number], end)
+            self._cache.put(number, rows)
+        return rows
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(len(self)))]
+
+        if i < 0:
+            i += self._rows
+        if i < 0 or i >= self._rows:
+            raise IndexError("CSVModel index out of range")
+
+        rows = self._block(i / self.blockSize)
+        if i % self.blockSize < len(rows):
+            return rows[i % self.blockSize]
+        # quoting too broken to parse the way it was scanned
+        return ()
+
+    def close(self):
+        """
+        unmap and close the file; the model may not be used after
+        """
+        if self.size:
+            self.map.close()
+        self.file.close()
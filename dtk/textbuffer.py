@@ -0,0 +1,1111 @@
+# DTK, a curses "GUI" toolkit for Python programs.
+#
+# Copyright (C) 2006-2007 Dan Crosta
+# Copyright (C) 2006-2007 Ethan Jucovy
+#
+# DTK is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Lesser General Public License as published by the
+# Free Software Foundation, either version 3 of the License, or (at your
+# option) any later version.
+#
+# DTK is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU Lesser General Public
+# License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with Foobar. If not, see <http://www.gnu.org/licenses/>.
+
+__all__ = ['BlockList', 'LazyBlock', 'LineBuffer', 'MappedFile', 'WrapIndex', 'SearchIndex', 'UndoLog', 'GapBuffer']
+
+import os
+import mmap
+import threading
+from array import array
+from bisect import bisect_right
+from collections import deque
+
+import util
+
+
+class LazyBlock(object):
+    """
+    LazyBlock is a block of a BlockList whose items are only made,
+    by calling load(), when they are first needed. its length and
+    size are given up front, so the BlockList can be indexed without
+    loading it. if a cache (a util.LRUCache) is given, loaded items
+    are kept only in it, and so may be loaded again later; the
+    block keeps its own copy of them once they are changed.
+
+    text, if given, is a callable which returns the items as text
+    with a line break after each without loading them.
+    """
+
+    def __init__(self, count, size, load, cache = None, text = None):
+        self.count = count
+        self.size = size
+        self._load = load
+        self._cache = cache
+        self._text = text
+        self._items = None
+
+    def changed(self):
+        """
+        return whether the block holds its own, changed items
+        """
+        return self._items is not None and self._cache is not None
+
+    def _get(self):
+        if self._items is not None:
+            return self._items
+        if self._cache is None:
+            self._items = self._load()
+            return self._items
+        items = self._cache.get(self)
+        if items is None:
+            items = self._load()
+            self._cache.put(self, items)
+        return items
+
+    def _own(self):
+        if self._items is None:
+            self._items = list(self._get())
+            if self._cache is not None:
+                self._cache.discard(self)
+        return self._items
+
+    def text(self):
+        if self._text is not None and not self.changed():
+            return self._text()
+        return '\n'.join(self._get()) + '\n'
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return self.count
+
+    def __getitem__(self, i):
+        return self._get()[i]
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __setitem__(self, i, item):
+        self._own()[i] = item
+
+    def __delitem__(self, i):
+        del self._own()[i]
+
+    def extend(self, items):
+        self._own().extend(items)
+
+
+class BlockList(object):
+    """
+    BlockList is a list kept as a shallow rope: a list of blocks of
+    at most 2 * blockSize items each, along with the index of the
+    first item of each block and the total size of the items before
+    it, where the size of some items is given by _size(). finding an
+    item by index or by the size before it is a binary search over
+    the blocks; inserting or removing items copies only the block
+    they are in, and splits or drops blocks as they grow and shrink.
+
+    a BlockList always has at least one item; when the last is
+    removed, it is replaced by blank.
+    """
+
+    blockSize = 512
+    blank = None
+
+    def __init__(self, items = ()):
+        self.setItems(items)
+
+    def setItems(self, items):
+        """
+        replace all the items with the given ones
+        """
+        items = list(items) or [self.blank]
+        size = self.blockSize
+        self.setBlocks([items[i:i + size] for i in xrange(0, len(items), size)])
+
+    def setBlocks(self, blocks):
+        """
+        replace all the items with the given blocks of them, which
+        may be lists or LazyBlocks
+        """
+        self._blocks = list(blocks) or [[self.blank]]
+        self._sizes = [self._measure(block) for block in self._blocks]
+
+        # the first item and offset of each block, which are right
+        # for the first _valid blocks (see _index)
+        self._starts = [0]
+        self._offsets = [0]
+        self._valid = 1
+
+    def _size(self, items):
+        """
+        the total size of items
+        """
+        return len(items)
+
+    def _measure(self, block):
+        """
+        the total size of the items of block, without loading it
+        """
+        if isinstance(block, LazyBlock):
+            return block.size
+        return self._size(block)
+
+    def appendBlocks(self, blocks):
+        """
+        add the given blocks of items to the end
+        """
+        for block in blocks:
+            self._blocks.append(block)
+            self._sizes.append(self._measure(block))
+
+    def _dirty(self, block):
+        """
+        note that the sizes of block and those after it changed
+        """
+        self._valid = min(self._valid, block + 1)
+
+    def _index(self):
+        """
+        bring the starting item and offset of every block up to date
+        """
+        if len(self._starts) == self._valid == len(self._blocks):
+            return
+        del self._starts[self._valid:]
+        del self._offsets[self._valid:]
+        item = self._starts[-1]
+        offset = self._offsets[-1]
+        for b in xrange(self._valid - 1, len(self._blocks) - 1):
+            item += len(self._blocks[b])
+            offset += self._sizes[b]
+            self._starts.append(item)
+            self._offsets.append(offset)
+        self._valid = len(self._blocks)
+
+    def _find(self, i):
+        """
+        return (block, index within it) of item i
+        """
+        self._index()
+        b = bisect_right(self._starts, i) - 1
+        return b, i - self._starts[b]
+
+    def __len__(self):
+        self._index()
+        return self._starts[-1] + len(self._blocks[-1])
+
+    def _item(self, i):
+        size = len(self)
+        if i < 0:
+            i += size
+        if i < 0 or i >= size:
+            raise IndexError("%s index out of range" % self.__class__.__name__)
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in xrange(start, stop, step)]
+            return self.items(start, stop)
+        b, j = self._find(self._item(i))
+        return self._blocks[b][j]
+
+    def __setitem__(self, i, item):
+        b, j = self._find(self._item(i))
+        block = self._blocks[b]
+        self._sizes[b] += self._size([item]) - self._size([block[j]])
+        block[j] = item
+        self._dirty(b)
+
+    def __iter__(self):
+        for block in self._blocks:
+            for item in block:
+                yield item
+
+    def items(self, start = 0, stop = None):
+        """
+        return the list of items start to stop
+        """
+        if stop is None:
+            stop = len(self)
+        out = []
+        if start >= stop:
+            return out
+        b, j = self._find(start)
+        while len(out) < stop - start and b < len(self._blocks):
+            out.extend(self._blocks[b][j:j + stop - start - len(out)])
+            b += 1
+            j = 0
+        return out
+
+    def total(self):
+        """
+        return the total size of all the items
+        """
+        self._index()
+        return self._offsets[-1] + self._sizes[-1]
+
+    def before(self, i):
+        """
+        return the total size of the items before item i
+        """
+        b, j = self._find(i)
+        return self._offsets[b] + self._size(self._blocks[b][:j])
+
+    def locate(self, offset):
+        """
+        return the index of the item which holds the given offset,
+        and the offset within it
+        """
+        self._index()
+        b = bisect_right(self._offsets, offset) - 1
+        offset -= self._offsets[b]
+        i = self._starts[b]
+        for item in self._blocks[b]:
+            size = self._size([item])
+            if offset < size:
+                break
+            offset -= size
+            i += 1
+        return i, offset
+
+    def insertItems(self, i, items):
+        """
+        insert items before item i
+        """
+        items = list(items)
+        if not items:
+            return
+        if i >= len(self):
+            b = len(self._blocks) - 1
+            j = len(self._blocks[b])
+        else:
+            b, j = self._find(i)
+        block = self._blocks[b]
+        block[j:j] = items
+        self._sizes[b] += self._size(items)
+        self._split(b)
+
+    def deleteItems(self, start, stop):
+        """
+        remove items start to stop, leaving at least one item
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return
+        b, j = self._find(start)
+        first = b
+        count = stop - start
+        while count:
+            block = self._blocks[b]
+            removed = block[j:j + count]
+            del block[j:j + count]
+            self._sizes[b] -= self._size(removed)
+            count -= len(removed)
+            if block:
+                b += 1
+            else:
+                del self._blocks[b]
+                del self._sizes[b]
+            j = 0
+        if not self._blocks:
+            self._blocks = [[self.blank]]
+            self._sizes = [self._size([self.blank])]
+
+        # join what is left of the blocks on either side
+        blocks = self._blocks
+        first = min(first, len(blocks) - 1)
+        if first + 1 < len(blocks) and \
+               len(blocks[first]) + len(blocks[first + 1]) <= self.blockSize:
+            blocks[first].extend(blocks.pop(first + 1))
+            self._sizes[first] += self._sizes.pop(first + 1)
+        self._valid = min(self._valid, first + 1, len(blocks))
+
+    def replaceItems(self, start, stop, items):
+        """
+        replace items start to stop with the given items
+        """
+        common = min(stop - start, len(items))
+        for i in xrange(common):
+            self[start + i] = items[i]
+        self.deleteItems(start + common, stop)
+        self.insertItems(start + common, items[common:])
+
+    def _split(self, b):
+        """
+        split block b into pieces of blockSize items if it has grown
+        too large
+        """
+        block = self._blocks[b]
+        size = self.blockSize
+        if len(block) > 2 * size:
+            pieces = [block[i:i + size] for i in xrange(0, len(block), size)]
+            self._blocks[b:b + 1] = pieces
+            self._sizes[b:b + 1] = [self._size(piece) for piece in pieces]
+        self._dirty(b)
+
+
+class LineBuffer(BlockList):
+    """
+    LineBuffer holds the lines of a document in a BlockList, where
+    the size of a line is its length counting the line break after
+    it, so that the offset of a line in the text is found as quickly
+    as the line itself.
+
+    a LineBuffer reads like a list of lines (without their line
+    breaks), and always has at least one line. text is changed with
+    insert() and delete(), which take and give (line, column)
+    positions.
+    """
+
+    blank = ''
+
+    def __init__(self, lines = ('',)):
+        BlockList.__init__(self, lines)
+
+    setLines = BlockList.setItems
+    lines = BlockList.items
+    insertLines = BlockList.insertItems
+    deleteLines = BlockList.deleteItems
+
+    def _size(self, lines):
+        """
+        the length of lines, counting a line break after each
+        """
+        return sum(map(len, lines)) + len(lines)
+
+    def text(self):
+        """
+        return the whole text, with lines joined by line breaks
+        """
+        return '\n'.join(self)
+
+    def chars(self):
+        """
+        return the length of the whole text
+        """
+        return self.total() - 1
+
+    def offset(self, line, col):
+        """
+        return the offset in the text of the given position
+        """
+        return self.before(line) + col
+
+    def position(self, offset):
+        """
+        return the (line, column) position of the given offset
+        """
+        return self.locate(offset)
+
+    def write(self, file):
+        """
+        write the whole text to file a block at a time, copying
+        blocks of a MappedFile which have not changed straight from
+        it
+        """
+        last = len(self._blocks) - 1
+        for b, block in enumerate(self._blocks):
+            if isinstance(block, LazyBlock):
+                text = block.text()
+            else:
+                text = '\n'.join(block) + '\n'
+            if b == last:
+                text = text[:-1]
+            file.write(text)
+
+    def insert(self, line, col, text):
+        """
+        insert text, which may hold line breaks, at the given
+        position, and return the position at the end of it
+        """
+        current = self[line]
+        if '\n' not in text:
+            self[line] = current[:col] + text + current[col:]
+            return line, col + len(text)
+
+        new = text.split('\n')
+        end = (line + len(new) - 1, len(new[-1]))
+        new[-1] += current[col:]
+        self[line] = current[:col] + new[0]
+        self.insertLines(line + 1, new[1:])
+        return end
+
+    def get(self, line, col, endLine, endCol):
+        """
+        return the text between the given positions
+        """
+        if line == endLine:
+            return self[line][col:endCol]
+        lines = self.lines(line, endLine + 1)
+        lines[0] = lines[0][col:]
+        lines[-1] = lines[-1][:endCol]
+        return '\n'.join(lines)
+
+    def delete(self, line, col, endLine, endCol):
+        """
+        remove the text between the given positions, and return it
+        """
+        removed = self.get(line, col, endLine, endCol)
+        if line == endLine:
+            current = self[line]
+            self[line] = current[:col] + current[endCol:]
+        else:
+            self[line] = self[line][:col] + self[endLine][endCol:]
+            self.deleteLines(line + 1, endLine + 1)
+        return removed
+
+
+class MappedFile(object):
+    """
+    MappedFile shows a text file as LazyBlocks of lines for a
+    LineBuffer without reading it in: the file is memory mapped, and
+    a background thread scans it a chunk at a time, noting where
+    every blockSize'th line starts. the lines of a block are split
+    out of the mapping only when they are asked for, and the most
+    recently used blocks are kept, so memory use is bounded by
+    cacheBlocks (plus the blocks which have been edited) rather than
+    the size of the file.
+
+    update() returns the blocks scanned since it was last called.
+    the progress attribute is the fraction of the file scanned, and
+    done is True once it all has been.
+    """
+
+    chunkSize = 1 << 20
+
+    def __init__(self, path, blockSize = 512, cacheBlocks = 64):
+        self.path = path
+        self.blockSize = blockSize
+        self.file = open(path, 'rb')
+        self.size = os.fstat(self.file.fileno()).st_size
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        else:
+            self.map = ''
+        self._cache = util.LRUCache(cacheBlocks)
+
+        # where each block of lines starts, appended to by the
+        # scanning thread, and how many have been given out
+        self._starts = array('L', [0])
+        self._given = 0
+        self.progress = 0.0
+        self.done = False
+        self.closed = False
+
+        # the first block is found straight away, so that there is
+        # something to show
+        pos = 0
+        lines = 0
+        while len(self._starts) == 1 and pos < self.size:
+            pos, lines = self._scan(pos, lines)
+        if pos >= self.size:
+            self.progress = 1.0
+            self.done = True
+        else:
+            self._thread = threading.Thread(target = self._scanWorker, args = (pos, lines))
+            self._thread.setDaemon(True)
+            self._thread.start()
+
+    def _scan(self, pos, lines):
+        """
+        scan the chunk at pos, given the number of lines before it,
+        and return the position and number of lines after it
+        """
+        chunk = self.map[pos:pos + self.chunkSize]
+        if pos + len(chunk) < self.size:
+            cut = chunk.rfind('\n') + 1
+            if not cut:
+                # a line longer than a chunk
+                chunk = self.map[pos:self.map.find('\n', pos) + 1 or self.size]
+            else:
+                chunk = chunk[:cut]
+
+        blockSize = self.blockSize
+        i = 0
+        p = pos
+        found = chunk.split('\n')
+        found.pop()
+        while i + blockSize - lines % blockSize <= len(found):
+            need = blockSize - lines % blockSize
+            p += sum(map(len, found[i:i + need])) + need
+            i += need
+            lines += need
+            self._starts.append(p)
+        lines += len(found) - i
+
+        pos += len(chunk)
+        self.progress = float(pos) / self.size
+        return pos, lines
+
+    def _scanWorker(self, pos, lines):
+        """
+        body of the thread which finds where the blocks start
+        """
+        while pos < self.size and not self.closed:
+            pos, lines = self._scan(pos, lines)
+        self.done = True
+
+    def _block(self, number):
+        """
+        return the LazyBlock for block number; the last one runs
+        to the end of the file
+        """
+        start = self._starts[number]
+        if number + 1 < len(self._starts):
+            end = self._starts[number + 1]
+            count = self.blockSize
+            load = lambda: self.map[start:end - 1].split('\n')
+            text = lambda: self.map[start:end]
+            size = end - start
+        else:
+            end = self.size
+            count = self.map[start:end].count('\n') + 1
+            load = lambda: self.map[start:end].split('\n')
+            text = lambda: self.map[start:end] + '\n'
+            size = end - start + 1
+        return LazyBlock(count, size, load, self._cache, text)
+
+    def update(self):
+        """
+        return the blocks scanned since the last call, including
+        the last block of the file once it has all been scanned
+        """
+        done = self.done
+        count = len(self._starts) - 1
+        if done:
+            count += 1
+        blocks = [self._block(b) for b in xrange(self._given, count)]
+        self._given = count
+        return blocks
+
+    def finish(self):
+        """
+        wait until the whole file has been scanned
+        """
+        if not self.done:
+            self._thread.join()
+
+    def close(self):
+        """
+        stop scanning, and unmap and close the file; blocks from it
+        which have not been changed may not be used after
+        """
+        self.closed = True
+        if not self.done:
+            self._thread.join()
+        if self.size:
+            self.map.close()
+        self.file.close()
+
+
+class WrapIndex(BlockList):
+    """
+    WrapIndex keeps track of how the lines of a LineBuffer wrap to a
+    given width. it holds the number of rows each line wraps to in a
+    BlockList, so that the first row of a line, or the line shown on
+    a row, is found with a binary search. the rows a line wraps to
+    are cached by its text and the width, so only lines which have
+    changed are wrapped again.
+
+    a line is taken to wrap to one row until it is first wrapped,
+    so that a long text (or one which is not all loaded, see
+    MappedFile) is not wrapped all at once; the rows of lines which
+    have not been shown are only estimates. the owner of the buffer
+    must call update() whenever it changes lines of the buffer, and
+    extend() when it adds lines to the end.
+    """
+
+    blank = 1
+
+    def __init__(self, buffer, width = 80, cacheSize = 256):
+        self.buffer = buffer
+        self.width = max(1, width)
+        self._cache = util.LRUCache(cacheSize)
+        self._counted = False
+        BlockList.__init__(self)
+
+    def _size(self, counts):
+        return sum(counts)
+
+    def setWidth(self, width):
+        """
+        wrap to a new width, counting the rows of every line again
+        when next needed
+        """
+        width = max(1, width)
+        if width != self.width:
+            self.width = width
+            self.reset()
+
+    def reset(self):
+        """
+        forget the row counts of every line, after the whole text
+        of the buffer has changed
+        """
+        self._counted = False
+
+    def _unwrapped(self, count):
+        """
+        return blocks for count lines which have not been wrapped
+        """
+        size = self.blockSize
+        return [LazyBlock(min(size, count - i), min(size, count - i),
+                          lambda n = min(size, count - i): [1] * n)
+                for i in xrange(0, count, size)]
+
+    def _count(self):
+        if not self._counted:
+            self.setBlocks(self._unwrapped(len(self.buffer)))
+            self._counted = True
+
+    def extend(self, count):
+        """
+        note that count lines were added to the end of the buffer
+        """
+        if self._counted:
+            self.appendBlocks(self._unwrapped(count))
+
+    def _wrap(self, line):
+        """
+        return the columns at which the rows of the wrapped line
+        start, and the rows themselves
+        """
+        rows = util.wrap(line, self.width)
+
+        # each row is the part of line which follows the whitespace
+        # dropped between it and the row before
+        starts = []
+        col = 0
+        for row in rows:
+            col = line.find(row, col)
+            starts.append(col)
+            col += len(row)
+        return starts, rows
+
+    def wrap(self, line):
+        """
+        return the columns at which the rows of line number line
+        start, and the rows themselves
+        """
+        text = self.buffer[line]
+        key = (text, self.width)
+        wrapped = self._cache.get(key)
+        if wrapped is None:
+            wrapped = self._wrap(text)
+            self._cache.put(key, wrapped)
+        if self._counted and self[line] != len(wrapped[0]):
+            self[line] = len(wrapped[0])
+        return wrapped
+
+    def update(self, start, stop, count):
+        """
+        note that lines start to stop of the buffer were replaced by
+        count lines
+        """
+        if not self._counted:
+            return
+        self.replaceItems(start, stop, [len(self._wrap(line)[0])
+                                        for line in self.buffer.lines(start, start + count)])
+
+    def rows(self):
+        """
+        return the number of rows the whole buffer wraps to
+        """
+        self._count()
+        return self.total()
+
+    def rowOf(self, line):
+        """
+        return the first row of the given line
+        """
+        self._count()
+        return self.before(line)
+
+    def lineAt(self, row):
+        """
+        return the line shown on the given row, and which of its
+        rows it is
+        """
+        self._count()
+        row = max(0, min(row, self.total() - 1))
+        return self.locate(row)
+
+    def visual(self, line, col):
+        """
+        return the (row, column) on screen of the given position in
+        the buffer
+        """
+        starts = self.wrap(line)[0]
+        r = bisect_right(starts, col) - 1
+        return self.rowOf(line) + r, col - starts[r]
+
+
+class SearchIndex(BlockList):
+    """
+    SearchIndex holds the matches of a regular expression in the
+    lines of a LineBuffer. it keeps the (start, end) columns of the
+    matches in each line in a BlockList, where the size of a line is
+    its number of matches, so that the n'th match, or the number of
+    matches before a line, is found with a binary search. matches do
+    not span lines, and empty matches are left out.
+
+    lines are searched a few at a time by step(), so that a long
+    text can be searched without holding up the main loop; lines
+    not yet searched have no matches. the owner of the buffer must
+    call update() whenever it changes lines of the buffer, and
+    extend() when it adds lines to the end, as for WrapIndex.
+    """
+
+    blank = ()
+
+    def __init__(self, buffer, regex):
+        self.buffer = buffer
+        self.regex = regex
+        self.searched = 0
+        BlockList.__init__(self)
+        self.setBlocks(self._unsearched(len(buffer)))
+
+    def _size(self, matches):
+        return sum(map(len, matches))
+
+    def _unsearched(self, count):
+        """
+        return blocks for count lines which have not been searched
+        """
+        size = self.blockSize
+        return [LazyBlock(min(size, count - i), 0,
+                          lambda n = min(size, count - i): [()] * n)
+                for i in xrange(0, count, size)]
+
+    def _match(self, line):
+        return tuple([m.span() for m in self.regex.finditer(line) if m.end() > m.start()])
+
+    def done(self):
+        """
+        return whether every line has been searched
+        """
+        return self.searched >= len(self.buffer)
+
+    def progress(self):
+        """
+        return the fraction of the lines searched
+        """
+        return float(self.searched) / len(self.buffer)
+
+    def step(self, count):
+        """
+        search the next count lines, and return whether every line
+        has now been searched
+        """
+        start = self.searched
+        stop = min(start + count, len(self.buffer))
+        for i, line in enumerate(self.buffer.lines(start, stop)):
+            matches = self._match(line)
+            if matches:
+                self[start + i] = matches
+        self.searched = stop
+        return self.done()
+
+    def finish(self):
+        """
+        search all the lines which have not been searched
+        """
+        self.step(len(self.buffer))
+
+    def update(self, start, stop, count):
+        """
+        note that lines start to stop of the buffer were replaced by
+        count lines; they are searched again if they had been
+        """
+        if start < self.searched:
+            matches = map(self._match, self.buffer.lines(start, start + count))
+        else:
+            matches = [()] * count
+        self.replaceItems(start, stop, matches)
+
+        if stop <= self.searched:
+            self.searched += count - (stop - start)
+        elif start < self.searched:
+            self.searched = start + count
+
+    def extend(self, count):
+        """
+        note that count lines were added to the end of the buffer
+        """
+        self.appendBlocks(self._unsearched(count))
+
+    def count(self):
+        """
+        return the number of matches found so far
+        """
+        return self.total()
+
+    def nth(self, n):
+        """
+        return the n'th match as (line, start, end)
+        """
+        line, i = self.locate(n)
+        return (line,) + self[line][i]
+
+    def next(self, line, col):
+        """
+        return the first match starting after the given position,
+        going around to the first match if there is none, as (line,
+        start, end); or None if no match has been found
+        """
+        if not self.count():
+            return None
+        n = self.before(line) + len([s for s, e in self[line] if s <= col])
+        return self.nth(n % self.count())
+
+    def previous(self, line, col):
+        """
+        return the last match starting before the given position,
+        going around to the last match if there is none, as (line,
+        start, end); or None if no match has been found
+        """
+        if not self.count():
+            return None
+        n = self.before(line) + len([s for s, e in self[line] if s < col]) - 1
+        return self.nth(n % self.count())
+
+    def at(self, line, col):
+        """
+        return the end of the match starting at the given position,
+        or None if no match starts there
+        """
+        for s, e in self[line]:
+            if s == col:
+                return e
+        return None
+
+    def inRow(self, line, start, length):
+        """
+        return the parts of the matches in line which fall in the
+        length columns from start, as (start, end) relative to it
+        """
+        stop = start + length
+        return [(max(s, start) - start, min(e, stop) - start)
+                for s, e in self[line] if s < stop and e > start]
+
+
+class UndoLog(object):
+    """
+    UndoLog records the edits made to a text, so that they can be
+    undone and redone. each edit is a small record of the offset at
+    which text was changed, the text removed there, and the text
+    inserted in its place, rather than a copy of the whole text.
+
+    a run of typing, or of deleting, at one place is merged into a
+    single record as it is made, up to the end of a line; seal()
+    ends the current run. the records hold about maxChars characters
+    between them, each counting for recordSize more, and the oldest
+    are dropped to keep under that.
+    """
+
+    recordSize = 16
+
+    def __init__(self, maxChars = 1 << 20):
+        self.maxChars = maxChars
+        self.clear()
+
+    def clear(self):
+        """
+        forget every edit
+        """
+        self._undo = deque()
+        self._redo = []
+        self._chars = 0
+        self._open = False
+
+    def _size(self, record):
+        return self.recordSize + len(record[1]) + len(record[2])
+
+    def seal(self):
+        """
+        end the current run of edits, so that the next edit is
+        undone on its own
+        """
+        self._open = False
+
+    def _merge(self, position, removed, inserted):
+        """
+        add the edit to the last record if it continues it, and
+        return whether it did
+        """
+        if not self._open or not self._undo:
+            return False
+        last = self._undo[-1]
+        pos, rem, ins = last
+        if '\n' in removed or '\n' in inserted or '\n' in rem or '\n' in ins:
+            return False
+
+        if inserted and not removed and not rem and position == pos + len(ins):
+            # typing
+            last[2] = ins + inserted
+        elif removed and not inserted and not ins and position + len(removed) == pos:
+            # backspacing
+            last[0] = position
+            last[1] = removed + rem
+        elif removed and not inserted and not ins and position == pos:
+            # deleting forwards
+            last[1] = rem + removed
+        else:
+            return False
+        return True
+
+    def record(self, position, removed, inserted):
+        """
+        record that the text removed at position was replaced by
+        inserted. this forgets any edits which were undone
+        """
+        for record in self._redo:
+            self._chars -= self._size(record)
+        self._redo = []
+
+        if self._merge(position, removed, inserted):
+            self._chars += len(removed) + len(inserted)
+        else:
+            record = [position, removed, inserted]
+            self._undo.append(record)
+            self._chars += self._size(record)
+        self._open = True
+
+        while self._chars > self.maxChars and self._undo:
+            self._chars -= self._size(self._undo.popleft())
+
+    def undo(self):
+        """
+        return the last edit as (position, removed, inserted), to be
+        undone by replacing inserted with removed, or None if there
+        is none
+        """
+        self._open = False
+        if not self._undo:
+            return None
+        record = self._undo.pop()
+        self._redo.append(record)
+        return tuple(record)
+
+    def redo(self):
+        """
+        return the last edit undone as (position, removed, inserted),
+        to be redone by replacing removed with inserted, or None if
+        there is none
+        """
+        self._open = False
+        if not self._redo:
+            return None
+        record = self._redo.pop()
+        self._undo.append(record)
+        return tuple(record)
+
+
+class GapBuffer(object):
+    """
+    GapBuffer holds a single run of text as a list of characters
+    with a gap of free slots at the place last edited. inserting or
+    deleting there only moves the edges of the gap, and moving to
+    another place copies just the characters between, so that edits
+    at a cursor cost about the same however long the text is. the
+    gap is grown by doubling when it fills.
+    """
+
+    minGap = 64
+
+    def __init__(self, text = ''):
+        self.setText(text)
+
+    def setText(self, text):
+        """
+        replace the whole text, leaving the gap at its end
+        """
+        gap = max(self.minGap, len(text))
+        self._chars = list(text) + [None] * gap
+        self._start = len(text)
+        self._end = len(self._chars)
+
+    def __len__(self):
+        return len(self._chars) - (self._end - self._start)
+
+    def _moveGap(self, position):
+        chars = self._chars
+        if position < self._start:
+            count = self._start - position
+            chars[self._end - count:self._end] = chars[position:self._start]
+            self._start -= count
+            self._end -= count
+        elif position > self._start:
+            count = position - self._start
+            chars[self._start:self._start + count] = chars[self._end:self._end + count]
+            self._start += count
+            self._end += count
+
+    def _grow(self, needed):
+        gap = max(needed, len(self._chars))
+        self._chars[self._end:self._end] = [None] * gap
+        self._end += gap
+
+    def insert(self, position, text):
+        """
+        insert text before the character at position
+        """
+        self._moveGap(position)
+        if len(text) > self._end - self._start:
+            self._grow(len(text))
+        self._chars[self._start:self._start + len(text)] = list(text)
+        self._start += len(text)
+
+    def delete(self, position, length):
+        """
+        delete up to length characters from position, and return
+        the text deleted
+        """
+        length = max(0, min(length, len(self) - position))
+        self._moveGap(position)
+        removed = self._chars[self._end:self._end + length]
+        self._chars[self._end:self._end + length] = [None] * length
+        self._end += length
+        return ''.join(removed)
+
+    def get(self, start, stop):
+        """
+        return the text from start up to stop
+        """
+        size = len(self)
+        start = max(0, min(start, size))
+        stop = max(start, min(stop, size))
+        gap = self._end - self._start
+        if stop <= self._start:
+            return ''.join(self._chars[start:stop])
+        if start >= self._start:
+            return ''.join(self._chars[start + gap:stop + gap])
+        return ''.join(self._chars[start:self._start] +
+                       self._chars[self._end:stop + gap])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return self.get(start, stop)
+            return ''.join([self[i] for i in xrange(start, stop, step)])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        if index >= self._start:
+            index += self._end - self._start
+        return self._chars[index]
+
+    def text(self):
+        """
+        return the whole text
+        """
+        return self.get(0, len(self))
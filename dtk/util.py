@@ -134,3 +134,83 @@ def wrap(line, width):
 
     return outlines
 
+
+def fuzzyScore(query, text):
+    """
+    Score how well text matches query, where the characters of
+    query must all appear in text, in order, but not necessarily
+    next to each other. Characters which follow the previous match
+    directly, or which begin a word, score extra; skipped characters
+    cost a little.
+
+    @param query: the characters to look for
+    @type  query: string
+
+    @param text: the text to look in
+    @type  text: string
+
+    @return: None if text does not match, otherwise a score which is
+        higher for better matches
+    @rtype: int
+    """
+    score = 0
+    pos = 0
+    last = -2
+    find = text.find
+
+    for ch in query:
+        i = find(ch, pos)
+        if i < 0:
+            return None
+
+        if i == last + 1:
+            score += 5
+        if i == 0 or not text[i - 1].isalnum():
+            score += 3
+        score -= min(i - pos, 5)
+
+        last = i
+        pos = i + 1
+
+    return score
+
+
+class LRUCache(object):
+    """
+    A mapping which holds at most maxsize entries, discarding the
+    least recently used entry to make room for a new one. meant for
+    small caches (of pages of rows, say), since finding the entry to
+    discard takes time in proportion to the size.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = {}
+        self.clock = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default = None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        self.clock += 1
+        entry[1] = self.clock
+        return entry[0]
+
+    def put(self, key, value):
+        if key not in self.entries and len(self.entries) >= self.maxsize:
+            oldest = min(self.entries.items(), key = lambda item: item[1][1])[0]
+            del self.entries[oldest]
+        self.clock += 1
+        self.entries[key] = [value, self.clock]
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries = {}
@@ -274,9 +274,8 @@ class Screen:
         return ''.join([y[x].at(time) for y in self._screen[y:e]])
 
     def set_input(self, *args):
-        printre = re.compile('\w')
         for elm in args:
-            if len(elm) == 1 and printre.match(elm):
+            if len(elm) == 1:
                 self._input_buf.append(ord(elm))
             else:
                 self._input_buf.append(elm)
@@ -5,6 +5,8 @@ ESC = 'esc'
 TAB = 'tab'
 NL = 'enter'
 DEL = 'backspace'
+SUB = 'ctrl z'
+EM = 'ctrl y'
 
 
 def isprint(ch):
@@ -13,3 +15,5 @@ def isprint(ch):
 
     if len(ch) > 1:
         return False
+
+    return isprint(ord(ch))
@@ -0,0 +1,200 @@
+"""
+test cases for the ListBox widget
+"""
+
+import dtk
+import dtktest
+
+
+class ListBoxTests(dtktest.DtkTestCase):
+
+    hosts = ['db01', 'web02', 'app01', 'web01', 'db02']
+
+    def testJumpSearch(self):
+        self.scr.set_input('w', 'e', 'esc')
+
+        e = dtk.Engine()
+        lb = dtk.ListBox(search='jump')
+        lb.setItems(self.hosts)
+        e.setRoot(lb)
+
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # matches are visited in sorted order
+        self.assertEquals('web01', lb.getHighlightedItem())
+
+        lb.jumpNext()
+        self.assertEquals('web02', lb.getHighlightedItem())
+        lb.jumpNext()
+        self.assertEquals('web01', lb.getHighlightedItem())
+
+    def testFilterSearch(self):
+        self.scr.set_input('d', 'b', 'esc')
+
+        e = dtk.Engine()
+        lb = dtk.ListBox(search='filter')
+        lb.setItems(self.hosts)
+        e.setRoot(lb)
+
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertEquals(2, lb._rowCount())
+        self.assertTextAt(0, 0, 'db01 ', 3)
+        self.assertTextAt(1, 0, 'db02 ', 3)
+
+    def testFilterFollowsMutators(self):
+        lb = dtk.ListBox()
+        lb.setItems(self.hosts)
+        lb.setFilter('web')
+        self.assertEquals([1, 3], lb.view)
+
+        lb.insert(0, 'web03')
+        lb.append('web04')
+        lb.remove('web02')
+        self.assertEquals(['web03', 'web01', 'web04'],
+                          [lb.items[i] for i in lb.view])
+
+
+        # only the new items are tested against the filter
+        lb._refilter = None
+        lb.extend(['db09', 'web05'])
+        lb.insertMany(1, ['web06', 'db10'])
+        self.assertEquals(['web03', 'web06', 'web01', 'web04', 'web05'],
+                          [lb.items[i] for i in lb.view])
+        del lb._refilter
+
+        lb.setFilter('web0')
+        self.assertEquals(5, lb._rowCount())
+        lb.clearFilter()
+        self.assertEquals(len(lb.items), lb._rowCount())
+
+    def testFuzzyFilter(self):
+        e = dtk.Engine()
+        lb = dtk.ListBox()
+        lb.fuzzyChunkSize = 2
+        lb.setItems(['web-east-01', 'db-west-01', 'web-west-02', 'backup'])
+
+        lb.setFuzzyFilter('we')
+        lb._fuzzyThread.join()
+        e.processEvents()
+
+        # consecutive and word-start matches rank first
+        self.assertEquals([0, 2, 1], lb.view)
+        self.assertEquals('web-east-01', lb.getHighlightedItem())
+
+        # a longer query only rescores the previous matches
+        self.assertEquals(('we', [0, 1, 2]), lb._fuzzyMatches)
+        lb.setFuzzyFilter('we0')
+        lb._fuzzyThread.join()
+        e.processEvents()
+        self.assertEquals(3, len(lb.view))
+
+        # results of a superseded run are ignored
+        stale = lb._fuzzyGeneration
+        lb.setFuzzyFilter('bk')
+        lb._fuzzyThread.join()
+        e.enqueueEvent(dtk.FilterResults(lb, 'we', stale, [0], True))
+        e.processEvents()
+        self.assertEquals([3], lb.view)
+
+    def testFollow(self):
+        import Queue
+
+        q = Queue.Queue()
+        for i in range(30):
+            q.put('line %d' % i)
+
+        self.scr.set_input('up', 'esc')
+
+        e = dtk.Engine()
+        lb = dtk.ListBox()
+        lb.follow(q, maxItems=25, batchSize=30)
+        e.setRoot(lb)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # the oldest items were dropped
+        self.assertEquals(25, len(lb))
+        self.assertEquals('line 5', lb[0])
+        self.assertEquals('line 28', lb.getHighlightedItem())
+
+        # no longer at the end, so the highlight stays put
+        lb._streamed(['line 30'])
+        self.assertEquals('line 6', lb[0])
+        self.assertEquals('line 28', lb.getHighlightedItem())
+
+        lb.moveToBottom()
+        lb._streamed(['line 31', 'line 32'])
+        self.assertEquals('line 32', lb.getHighlightedItem())
+        self.assertEquals('line 8', lb[0])
+
+    def testRowDamage(self):
+        self.scr.set_input('down', ' ', 'esc')
+
+        e = dtk.Engine()
+        lb = dtk.ListBox()
+        lb.setItems(['item %d' % i for i in range(50)])
+        e.setRoot(lb)
+
+        drawn = []
+        def draw(str, row, col, **kwargs):
+            drawn.append(row)
+        lb.draw = draw
+
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # a full screen, then just the two rows the highlight moved
+        # between, then the row whose selection was toggled
+        self.assertEquals(range(24) + [0, 1] + [1], drawn)
+
+    def testBulkMutators(self):
+        lb = dtk.ListBox()
+        lb.setItems(['item %d' % i for i in range(10)], highlighted = 5)
+        lb.toggleSelect()
+
+        lb.insertMany(0, ['new 0', 'new 1'])
+        self.assertEquals('item 5', lb.getHighlightedItem())
+        self.assertEquals(['item 5'], lb.getSelectedItems())
+
+        removed = lb.removeMany(predicate = lambda item: item.endswith('1'))
+        self.assertEquals(['new 1', 'item 1'], removed)
+        self.assertEquals([], lb.removeMany(indices = []))
+        self.assertEquals(['item 5'], lb.getSelectedItems())
+
+        lb.replaceRange(0, 3, ['a', 'b'])
+        self.assertEquals(['a', 'b', 'item 3', 'item 4', 'item 5'], lb[:5])
+        self.assertEquals('item 5', lb.getHighlightedItem())
+
+        lb.setFilter('item')
+        lb.replaceMany({0: 'item a', 3: 'c', -1: 'item z'})
+        self.assertEquals(['item a', 'b', 'item 3', 'c', 'item 5'], lb[:5])
+        self.assertEquals(['item a', 'item 3', 'item 5'], [lb[i] for i in lb.view[:3]])
+        self.assertEquals('item z', lb[lb.view[-1]])
+        self.assertEquals('item 5', lb.getHighlightedItem())
+        self.assertRaises(IndexError, lb.replaceMany, [(100, 'x')])
+
+        self.assertRaises(ValueError, lb.removeMany)
+
+    def testBatch(self):
+        lb = dtk.ListBox()
+        lb.setItems(['item %d' % i for i in range(10)], highlighted = 5)
+        lb.toggleSelect()
+        lb.setFilter('item')
+
+        batch = lb.batch()
+        batch.__enter__()
+        lb.pop(0)
+        lb.removeMany(indices = [0, 1])
+        lb.insert(0, 'item 10')
+        lb.append('other')
+
+        # nothing is remapped until the batch ends
+        self.assertEquals(range(10), lb.view)
+        batch.__exit__(None, None, None)
+
+        self.assertEquals('item 5', lb.getHighlightedItem())
+        self.assertEquals(['item 5'], lb.getSelectedItems())
+        self.assertEquals(8, lb._rowCount())
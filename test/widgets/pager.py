@@ -0,0 +1,38 @@
+"""
+test cases for the Pager widget
+"""
+
+import dtk
+import dtktest
+
+
+class PagerTests(dtktest.DtkTestCase):
+
+    def testSearch(self):
+        self.scr.set_input('n', 'n', 'N', 'esc')
+
+        e = dtk.Engine()
+        p = dtk.Pager(vimlike = True)
+        p.setText('\n'.join(['line %d' % i for i in range(100)]))
+        e.setRoot(p)
+        e.bindKey('esc', e.quit)
+
+        p.find('5$')
+        e.mainLoop()
+
+        self.assertEquals(10, p.search.count())
+        self.assertEquals((5, 5, 6), p.match)
+        self.assertEquals(0, p.firstVisible)
+        self.assertTextAt(5, 0, 'line 5', 1)
+        self.assertEquals([(5, 6)], p.search.inRow(5, 0, 6))
+
+        p.match = None
+        p.firstVisible = 30
+        self.assert_(p.findNext())
+        self.assertEquals((35, 6, 7), p.match)
+        self.assertEquals(30, p.firstVisible)
+        self.assert_(p.findNext())
+        self.assertEquals(30, p.firstVisible)
+        self.assert_(p.findNext())
+        self.assertEquals((55, 6, 7), p.match)
+        self.assertEquals(55, p.firstVisible)
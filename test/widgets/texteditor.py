@@ -0,0 +1,408 @@
+"""
+test cases for the TextEditor widget
+"""
+
+import dtk
+import dtktest
+
+from dtk.textbuffer import LineBuffer, WrapIndex, SearchIndex, UndoLog, MappedFile
+
+
+class TextEditorTests(dtktest.DtkTestCase):
+
+    def testLineBuffer(self):
+        class SmallBuffer(LineBuffer):
+            blockSize = 2
+
+        b = SmallBuffer(['line %d' % i for i in range(10)])
+        self.assertEquals(5, len(b._blocks))
+        self.assertEquals('line 7', b[7])
+
+        self.assertEquals((6, 1), b.insert(3, 2, 'a\nb\n\nc'))
+        self.assertEquals(['line 3'[:2] + 'a', 'b', '', 'c' + 'ne 3', 'line 4'], b[3:8])
+        self.assertEquals(b.text().index('c'), b.offset(6, 0))
+        self.assertEquals((6, 1), b.position(b.offset(6, 1)))
+
+        self.assertEquals('a\nb\n\nc', b.delete(3, 2, 6, 1))
+        self.assertEquals('\n'.join(['line %d' % i for i in range(10)]), b.text())
+        self.assertEquals(len(b.text()), b.chars())
+
+        b.deleteLines(0, len(b))
+        self.assertEquals([''], list(b))
+
+    def testEditing(self):
+        self.scr.set_input('right', 'x', 'enter', 'y', 'backspace', 'backspace',
+                           'end', 'delete', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText('abc\ndef')
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertEquals(['axbcdef'], t.getText())
+        self.assertEquals((0, 4), (t.cy, t.cx))
+
+    def testTextChanged(self):
+        self.scr.set_input('right', 'x', 'enter', 'backspace', 'end', 'delete', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText('abc\ndef')
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+
+        changes = []
+        def onchange(event):
+            changes.append((event.position, event.removed, event.inserted))
+        t.bindEvent(dtk.TextChanged, onchange)
+        texts = []
+        t.bindEvent(dtk.TextChanged, lambda event: texts.append(event.text))
+        e.mainLoop()
+
+        self.assertEquals([(0, 0, 'abc\ndef'), (1, 0, 'x'), (2, 0, '\n'), (2, 1, ''), (4, 1, '')], changes)
+        self.assertEquals('axbcdef', texts[-1])
+
+        # the text is only built when asked for
+        calls = []
+        def getText():
+            calls.append(1)
+            return 'abc'
+        event = dtk.TextChanged(t, position = 0, removed = 0, inserted = 'abc', getText = getText)
+        self.assertEquals([], calls)
+        self.assertEquals('abc', event.text)
+        self.assertEquals('abc', event.text)
+        self.assertEquals([1], calls)
+
+    def testWrapIndex(self):
+        b = LineBuffer(['one two three', '', 'four five'] * 3)
+        w = WrapIndex(b, 8)
+        self.assertEquals([0, 8], w.wrap(0)[0])
+        self.assertEquals(['one two', 'three'], w.wrap(0)[1])
+
+        # lines count for one row until they are wrapped
+        self.assertEquals(9, w.rows())
+        for i in range(len(b)):
+            w.wrap(i)
+        self.assertEquals(15, w.rows())
+        self.assertEquals(3, w.rowOf(2))
+        self.assertEquals((2, 1), w.lineAt(4))
+        self.assertEquals((4, 1), w.visual(2, 6))
+
+        b.insert(1, 0, 'a b c d e f g h')
+        w.update(1, 2, 1)
+        self.assertEquals(16, w.rows())
+        self.assertEquals((5, 1), w.visual(2, 6))
+
+        b.delete(0, 3, 2, 0)
+        w.update(0, 3, 1)
+        self.assertEquals(12, w.rows())
+        self.assertEquals(['onefour', 'five'], w.wrap(0)[1])
+        self.assertEquals([2, 2, 1, 2], [len(w.wrap(i)[0]) for i in range(4)])
+
+        w.setWidth(80)
+        self.assertEquals(7, w.rows())
+
+    def testWrappedCursor(self):
+        self.scr.set_input('end', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText(['x' * 100, 'y'])
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertEquals((1, 20), e.cursorpos)
+        self.assertTextAt(2, 0, 'y', 1)
+
+    def testViewport(self):
+        self.scr.set_input('page down', 'down', 'x', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText(['line %d' % i for i in range(50)])
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+
+        drawn = []
+        draw = t.draw
+        def counting(text, row, col, **kwargs):
+            drawn.append(text)
+            return draw(text, row, col, **kwargs)
+        t.draw = counting
+        e.mainLoop()
+
+        self.assertEquals(25, t.cy)
+        self.assertEquals(2, t.firstVisible)
+        self.assertEquals((23, 1), e.cursorpos)
+        self.assertTextAt(0, 0, 'line 2 ', 3)
+        self.assertTextAt(23, 0, 'xline 25', 4)
+        self.assertEquals(0, len([text for text in drawn if text.strip() == 'line 49']))
+
+    def testUndoLog(self):
+        log = UndoLog()
+        for i, c in enumerate('abc'):
+            log.record(i, '', c)
+        log.record(3, '', '\n')
+        log.record(3, '\n', '')
+        log.record(2, 'c', '')
+        self.assertEquals((2, 'c', ''), log.undo())
+        self.assertEquals((3, '\n', ''), log.undo())
+        self.assertEquals((3, '', '\n'), log.undo())
+        self.assertEquals((0, '', 'abc'), log.undo())
+        self.assertEquals(None, log.undo())
+        self.assertEquals((0, '', 'abc'), log.redo())
+
+        # editing forgets what was undone
+        log.record(3, '', 'd')
+        self.assertEquals(None, log.redo())
+
+        small = UndoLog(3 * UndoLog.recordSize)
+        for i in range(10):
+            small.seal()
+            small.record(i, '', 'x')
+        self.assertEquals(2, len(small._undo))
+
+    def testUndo(self):
+        self.scr.set_input('a', 'b', 'enter', 'c', 'left', 'backspace', 'ctrl z',
+                           'ctrl z', 'ctrl y', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        f = dtk.TextField()
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertEquals(['ab', 'c'], t.getText())
+        self.assertEquals((1, 1), (t.cy, t.cx))
+
+        f.setText('hello')
+        f.moveToEnd()
+        f.typing('!')
+        f.typing('!')
+        f.backspace()
+        f.undo()
+        self.assertEquals('hello!!', f.getText())
+        f.undo()
+        self.assertEquals('hello', f.getText())
+        f.redo()
+        self.assertEquals('hello!!', f.getText())
+
+    def testLoadFile(self):
+        import os
+        import tempfile
+        import threading
+
+        lines = ['line %d' % i for i in range(2000)]
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        out = os.fdopen(fd, 'w')
+        out.write('\n'.join(lines) + '\n')
+        out.close()
+
+        chunkSize = MappedFile.chunkSize
+        MappedFile.chunkSize = 4096
+        try:
+            e = dtk.Engine()
+            t = dtk.TextEditor()
+            mapped = t.loadFile(path, cacheBlocks = 2)
+
+            # the first block is there straight away
+            self.assert_(len(t.buffer) >= 512)
+            self.assertEquals('line 0', t.buffer[0])
+
+            progress = []
+            t.bindEvent(dtk.LoadProgress, lambda event: progress.append(event.rows))
+            mapped._thread.join()
+            e.runTasks()
+            e.processEvents()
+            self.assertEquals([2001], progress)
+            self.assertEquals(lines + [''], t.getText())
+            self.assert_(len(mapped._cache) <= 2)
+
+            # only the edited block is held in memory
+            t.cy = 1000
+            t.typing('x')
+            self.assertEquals([False, True, False, False],
+                              [block.changed() for block in t.buffer._blocks])
+
+            t.saveFile()
+            lines[1000] = 'x' + lines[1000]
+            self.assertEquals('\n'.join(lines) + '\n', open(path).read())
+
+            t.setText('')
+            self.assertEquals(None, t.mapped)
+            self.assert_(mapped.closed)
+            self.assertRaises(ValueError, t.saveFile)
+
+            # saving while still loading writes the whole file, and
+            # keeps its mode; the scan is held back until the first
+            # block has been shown
+            os.chmod(path, 0640)
+            progress = []
+            started = threading.Event()
+            scan = MappedFile._scanWorker
+            def held(mapped, *args):
+                started.wait()
+                scan(mapped, *args)
+            MappedFile._scanWorker = held
+            try:
+                t.loadFile(path)
+            finally:
+                MappedFile._scanWorker = scan
+            self.assert_(len(t.buffer) < 2001)
+            started.set()
+            t.saveFile()
+            self.assertEquals('\n'.join(lines) + '\n', open(path).read())
+            self.assertEquals(0640, os.stat(path).st_mode & 0777)
+            self.assertEquals([], e.tasks)
+            e.processEvents()
+            self.assertEquals([2001], progress)
+        finally:
+            MappedFile.chunkSize = chunkSize
+            os.remove(path)
+
+    def testSearchIndex(self):
+        import re
+
+        b = LineBuffer(['a cat', 'dog', 'cat cat', 'bird'])
+        s = SearchIndex(b, re.compile('cat'))
+        self.assertEquals(None, s.next(0, 0))
+        self.failIf(s.step(2))
+        self.assertEquals(1, s.count())
+        self.assert_(s.step(2))
+        self.assertEquals(3, s.count())
+
+        self.assertEquals((2, 0, 3), s.next(0, 2))
+        self.assertEquals((2, 4, 7), s.next(2, 0))
+        self.assertEquals((0, 2, 5), s.next(2, 4))
+        self.assertEquals((2, 4, 7), s.previous(0, 2))
+        self.assertEquals([(1, 4)], s.inRow(2, 3, 10))
+
+        # only the changed lines are searched again
+        b.insert(1, 3, '\ncat')
+        s.update(1, 2, 2)
+        self.assertEquals(4, s.count())
+        self.assertEquals((2, 0, 3), s.nth(1))
+        b.delete(0, 0, 2, 0)
+        s.update(0, 3, 1)
+        self.assertEquals([((0, 3),), ((0, 3), (4, 7)), ()], list(s))
+
+    def testFindReplace(self):
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText(['line %d' % i for i in range(100)])
+        progress = []
+        t.bindEvent(dtk.SearchProgress, lambda event: progress.append(event.matches))
+
+        t.searchChunk = 40
+        t.find(r'line (\d)5')
+        e.runTasks()
+        self.assertEquals(3, t.search.count())
+        self.assert_(t.findNext())
+        self.assertEquals((15, 0), (t.cy, t.cx))
+        e.runTasks()
+        e.runTasks()
+        e.processEvents()
+        self.assertEquals([3, 7, 9], progress)
+        self.assertEquals([], e.tasks)
+
+        self.assert_(t.findPrevious())
+        self.assertEquals((95, 0), (t.cy, t.cx))
+        self.assert_(t.replaceMatch(r'\1 five'))
+        self.assertEquals('9 five', t.buffer[95])
+        self.assertEquals(8, t.search.count())
+
+        self.assertEquals(8, t.replaceAll(r'\1 five'))
+        self.assertEquals('1 five', t.buffer[15])
+        self.assertEquals(0, t.search.count())
+        t.undo()
+        self.assertEquals('line 15', t.buffer[15])
+        self.assertEquals('line 85', t.buffer[85])
+        self.assertEquals('9 five', t.buffer[95])
+
+        # replacing a match must not disturb the others, even where
+        # they look ahead or behind it
+        t.setText(['ab ab ab', 'x ab', 'ab ab'])
+        t.find(r'ab(?= ab)')
+        e.runTasks()
+        self.assertEquals(3, t.replaceAll('X'))
+        self.assertEquals(['X X ab', 'x ab', 'X ab'], t.getText())
+        t.find(r'(?<=X )ab')
+        e.runTasks()
+        self.assertEquals(2, t.replaceAll('Y'))
+        self.assertEquals(['X X Y', 'x ab', 'X Y'], t.getText())
+        t.undo()
+        self.assertEquals(['X X ab', 'x ab', 'X ab'], t.getText())
+        t.undo()
+        self.assertEquals(['ab ab ab', 'x ab', 'ab ab'], t.getText())
+
+    def testHighlightStates(self):
+        from dtk.highlight import StateIndex, rowRuns
+
+        h = dtk.jsonHighlighter()
+        runs, state = h.highlight('{"a": 1, /* x', 'root')
+        self.assertEquals([(1, 4), (6, 7), (9, 11), (11, 13)], [run[:2] for run in runs])
+        self.assertEquals('comment', state)
+        self.assertEquals(([(0, 3, h.rules['comment'][0][1])], 'root'), h.highlight('y*/', 'comment'))
+
+        class Counting(dtk.RegexHighlighter):
+            lexed = 0
+            def highlight(self, line, state):
+                self.lexed += 1
+                return dtk.RegexHighlighter.highlight(self, line, state)
+
+        h = Counting({})
+        h.rules = dtk.jsonHighlighter().rules
+        b = LineBuffer(['"line %d": %d,' % (i, i) for i in range(100)])
+        s = StateIndex(b, h)
+        self.assert_(s.advance(50))
+        self.assertEquals(50, h.lexed)
+
+        # an edit which leaves the state as it was is lexed on its own
+        b[10] = '"changed": 1,'
+        s.update(10, 11, 1)
+        h.lexed = 0
+        s.advance(50)
+        self.assertEquals(2, h.lexed)
+        self.assertEquals(50, s.valid)
+
+        # one which opens a comment goes on until it is closed
+        b[10] = '/* open'
+        s.update(10, 11, 1)
+        b[20] = 'close */'
+        s.update(20, 21, 1)
+        h.lexed = 0
+        self.failIf(s.advance(30, 5))
+        self.assertEquals(15, s.valid)
+        s.advance(30)
+        self.assertEquals(12, h.lexed)
+        self.assertEquals('root', s[20])
+        self.assertEquals('comment', s[19])
+
+        self.assertEquals([(0, 1, {}), (1, 2, 'x'), (2, 3, {})], rowRuns([(3, 4, 'x')], 2, 3))
+        self.assertEquals([(0, 2, 'x'), (2, 3, {})], rowRuns([(0, 4, 'x')], 2, 3))
+
+    def testHighlightedEditor(self):
+        self.scr.set_input('x', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextEditor()
+        t.setText('{"a": 1}')
+        t.setHighlighter(dtk.jsonHighlighter())
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+
+        drawn = []
+        draw = t.draw
+        def recording(text, row, col, **kwargs):
+            drawn.append((text, col, kwargs))
+            return draw(text, row, col, **kwargs)
+        t.draw = recording
+        e.mainLoop()
+
+        self.assert_(('"a"', 2, dict(bold=True)) in drawn)
+        self.assert_(('1', 7, dict(fg='cyan')) in drawn)
+        self.assertTextAt(0, 0, 'x{"a": 1}', 2)
@@ -0,0 +1,95 @@
+"""
+test cases for the TextField widget
+"""
+
+import dtk
+import dtktest
+
+from dtk.textbuffer import GapBuffer
+from dtk.index import CompletionIndex, PrefixSearch
+
+
+class TextFieldTests(dtktest.DtkTestCase):
+
+    def testGapBuffer(self):
+        b = GapBuffer('hello world')
+        self.assertEquals(11, len(b))
+
+        b.insert(5, ',')
+        self.assertEquals('hello, world', b.text())
+        b.insert(0, '>> ')
+        self.assertEquals('>> hello, world', b.text())
+        self.assertEquals(',', b.delete(8, 1))
+        self.assertEquals('>> ', b.delete(0, 5)[:3])
+        self.assertEquals('llo world', b.text())
+        self.assertEquals('', b.delete(9, 3))
+
+        self.assertEquals('o wo', b.get(2, 6))
+        self.assertEquals('o wo', b[2:6])
+        self.assertEquals('d', b[-1])
+        self.assertEquals('lowrd', b[::2])
+        self.assertEquals('llo world', b.text())
+
+        # more than the gap holds at once
+        b.insert(3, 'x' * 1000)
+        self.assertEquals(1009, len(b))
+        self.assertEquals('llo' + 'x' * 1000 + ' world', b.text())
+
+    def testEditing(self):
+        self.scr.set_input('a', 'b', 'c', 'left', 'left', 'x', 'delete',
+                           'end', 'backspace', 'home', 'y', 'esc')
+
+        e = dtk.Engine()
+        f = dtk.TextField()
+        f.setText('0123456789' * 100)
+        e.setRoot(f)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertEquals('yaxc' + ('0123456789' * 100)[:-1], f.getText())
+        self.assertEquals(1, f.cursor)
+        self.assertTextAt(0, 0, 'yaxc0123456', 12)
+
+    def testCompletionIndex(self):
+        words = ['apple', 'apply', 'apricot', 'banana', 'band', 'bandana', 'apple']
+        index = CompletionIndex(words)
+        self.assertEquals(6, len(index))
+        self.assertEquals((0, 3), index.range('ap'))
+        self.assertEquals(['apple', 'apply'], index.top(0, 3, 2))
+
+        weights = [1, 5, 3, 2, 4, 0, 9]
+        index = CompletionIndex(words, weights)
+        self.assertEquals(['apple', 'apply', 'apricot'], index.top(0, 3, 5))
+        lo, hi = index.range('ban')
+        self.assertEquals(['band', 'banana'], index.top(lo, hi, 2))
+        lo, hi = index.range('c')
+        self.assertEquals([], index.top(lo, hi, 3))
+
+        search = PrefixSearch(index)
+        self.assertEquals((3, 6), search.search('ban'))
+        self.assertEquals((4, 6), search.search('band'))
+        self.assertEquals(3, len(search._ranges))
+        self.assertEquals((0, 3), search.search('a'))
+        self.assertEquals(['apricot'], search.top('apr', 2))
+        self.assertEquals(['apple', 'apply'], search.top('ap', 2))
+
+    def testCompletions(self):
+        self.scr.set_input('b', 'a', 'n', 'down', 'tab', 'esc')
+
+        e = dtk.Engine()
+        f = dtk.TextField()
+        f.setCompletions(['band', 'banana', 'bandana', 'apple'], count = 3)
+        e.setRoot(f)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        self.assertTextAt(1, 0, 'banana ', 3)
+        self.assertTextAt(2, 0, 'band ', 3)
+        self.assertTextAt(3, 0, 'bandana ', 3)
+        self.assertEquals('band', f.getText())
+        self.assertEquals(4, f.cursor)
+        self.assertEquals([], f.suggestions)
+        self.assertEquals([], e.overlays)
+
+        f.undo()
+        self.assertEquals('ban', f.getText())
@@ -0,0 +1,518 @@
+"""
+test cases for the TextTable widget
+"""
+
+import dtk
+import dtktest
+
+
+class TextTableTests(dtktest.DtkTestCase):
+
+    def makeTable(self, rows):
+        t = dtk.TextTable()
+        t.addColumn(name='host')
+        t.addColumn(fixedsize=6, name='status')
+        t.setItems(rows)
+        return t
+
+    def testRowDamage(self):
+        self.scr.set_input('down', 'down', 'esc')
+
+        e = dtk.Engine()
+        t = self.makeTable([('host%02d' % i, 'up') for i in range(60)])
+        e.setRoot(t)
+
+        drawn = []
+        def draw(str, row, col, **kwargs):
+            drawn.append(row)
+        t.draw = draw
+
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # header and 22 rows, then two rows for each move
+        self.assertEquals([0] + range(2, 24) + [2, 3] + [3, 4], drawn)
+
+    def testSort(self):
+        t = self.makeTable([('db01', 'up'), ('web01', 'down'),
+                            ('app01', 'up'), ('web02', 'down')])
+        t.move(1)
+        t.toggleSelect()
+
+        t.sortBy([1, (0, True)])
+        self.assertEquals(['web02', 'web01', 'db01', 'app01'],
+                          [row[0] for row in t.items])
+        self.assertEquals(('web01', 'down'), t.getHighlightedItem())
+        self.assertEquals([('web01', 'down')], t.getSelectedItems())
+
+        # sorting again by the same column reverses it, and the
+        # previous order breaks ties
+        t.toggleSort(1)
+        self.assertEquals([(1, True), (0, True)], t.sortColumns)
+        self.assertEquals(['db01', 'app01', 'web02', 'web01'],
+                          [row[0] for row in t.items])
+
+        # the cached keys follow changes to the items
+        t.append(('cache01', 'up'))
+        self.assertEquals(['up', 'up', 'down', 'down', 'up'], t._sortKeys[1])
+
+    def testBackgroundSort(self):
+        e = dtk.Engine()
+        t = self.makeTable([('host%d' % i, str(i % 3)) for i in range(20)])
+        t.sortThreshold = 10
+        t.move(5)
+
+        t.sortBy([1])
+        t._sortThread.join()
+
+        # nothing changes until the results are delivered
+        self.assertEquals('host0', t[0][0])
+        e.processEvents()
+        self.assertEquals(['host0', 'host3', 'host6'], [row[0] for row in t[:3]])
+        self.assertEquals(('host5', '2'), t.getHighlightedItem())
+
+        # a sort of items which have since changed is done again
+        t.sortBy([(0, True)])
+        t._sortThread.join()
+        t.append(('host99', '0'))
+        e.processEvents()
+        t._sortThread.join()
+        e.processEvents()
+        self.assertEquals('host99', t[0][0])
+
+    def testFormatters(self):
+        t = dtk.TextTable()
+        t.addColumn(fixedsize=8, ellipsis=True)
+        t.addColumn(fixedsize=12, alignment='right',
+                    formatter=dtk.numberFormatter(2, grouping=True))
+        t.setItems([('a long hostname', 1234567.891), ('short',)])
+        t.setSize(0, 0, 5, 21)
+        t.render()
+
+        self.assertEquals('a lon... 1,234,567.89', t._cells[0][0] + ' ' + t._cells[0][1])
+        self.assertEquals('short   ', t._cells[1][0])
+        self.assertEquals(' ' * 12, t._cells[1][1])
+
+        # changed cells are formatted again
+        t[1] = ('short', -1000)
+        self.assertFalse(1 in t._cells)
+        t.render()
+        self.assertEquals('   -1,000.00', t._cells[1][1])
+        self.assertEquals('a lon...', t._cells[0][0])
+
+    def testColumnStore(self):
+        store = dtk.ColumnStore(['str', 'i', 'd'])
+        store.extend([('web01', 3, 0.5), ('db01', 1, 0.25), ('app01', 2, 1.0)])
+        store.insert(1, ('cache01', 4, 0.0))
+        self.assertEquals(('cache01', 4, 0.0), store[1])
+        self.assertEquals([3, 4, 1, 2], list(store.column(1)))
+
+        # a row replaced in place leaves the others where they are
+        data = store.columns[0].data
+        store[0] = ('web02', 5, 0.5)
+        store[2] = ('db', 1, 0.25)
+        self.assert_(store.columns[0].data is data)
+        self.assertEquals([('web02', 5, 0.5), ('cache01', 4, 0.0), ('db', 1, 0.25)],
+                          store[:3])
+        store[2] = ('db01', 1, 0.25)
+        self.assertEquals({}, store.columns[0].replaced)
+        self.assertEquals(('db01', 1, 0.25), store.copy()[2])
+        store[0] = ('web01', 3, 0.5)
+
+        t = dtk.TextTable()
+        t.addColumn()
+        t.addColumn(fixedsize=4)
+        t.addColumn(fixedsize=6)
+        t.setItems(store)
+        self.assert_(t.items is store)
+
+        t.setSize(0, 0, 10, 30)
+        t.render()
+        self.assertEquals('db01', t._cells[2][0].strip())
+        self.assertEquals('0.25', t._cells[2][2].strip())
+        self.assertEquals(12, sum(map(len, t._cells.values())))
+
+        t.sortBy([1])
+        self.assert_(isinstance(t.items, dtk.ColumnStore))
+        self.assertEquals(['db01', 'app01', 'web01', 'cache01'],
+                          list(t.items.column(0)))
+
+        t.pop(0)
+        t.removeMany(predicate = lambda row: row[2] > 0.75)
+        self.assertEquals([('web01', 3, 0.5), ('cache01', 4, 0.0)], list(t.items))
+
+        # only the min and max keep the values, sorted
+        t.setAggregates({1: 'sum', 2: 'max'})
+        self.assertEquals({1: 7, 2: 0.5}, t.getAggregates())
+        self.assertEquals([], t._summaries[1].values)
+        self.assertEquals([0.0, 0.5], t._summaries[2].values)
+
+    def testAutoWidth(self):
+        t = dtk.TextTable()
+        t.addColumn(fixedsize='auto', name='host')
+        t.addColumn(name='status')
+        t.autoSampleSize = 30
+        t.setItems([('h%d' % i, 'up') for i in range(1000)] + [('longer-host', 'up')])
+        t.setSize(0, 0, 10, 40)
+        t._layout()
+
+        # the last row is always measured
+        self.assertEquals(11, t.cols[0].width)
+        self.assertEquals(40 - 11 - 1, t.cols[1].width)
+
+        # columns widen as wider rows arrive, but never narrow
+        t.append(('the-longest-host', 'up'))
+        self.assertEquals(None, t._fitters)
+        t._layout()
+        self.assertEquals(16, t.cols[0].width)
+        t.pop()
+        self.assertEquals(16, t.cols[0].measured)
+
+    def testHorizontalScroll(self):
+        self.scr.set_input('right', 'right', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextTable(frozenColumns=1)
+        for i in range(30):
+            t.addColumn(fixedsize=6)
+        t.setItems([tuple(['r%dc%d' % (r, c) for c in range(30)]) for r in range(5)])
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # the first column stays put; only columns in view are formatted
+        self.assertEquals(3, t.firstColumn)
+        self.assertEquals([0] + range(3, 14), t._visibleCols)
+        self.assertEquals(set([0] + range(3, 14)),
+                          set([col for cells in t._cells.values() for col in cells]))
+        self.assertTextAt(0, 0, 'r0c0   r0c3   r0c4', 3)
+
+        # scrolling stops once the last column is in full view
+        for i in range(30):
+            t.scrollRight()
+        t._layout()
+        self.assertEquals([0] + range(20, 30), t._visibleCols)
+        self.assertEquals(False, t._clipped)
+
+    def testUnicodeSearch(self):
+        t = self.makeTable([(u'caf\xe9', 'up', 1), (u'na\xefve', 'down', 2),
+                            ('r\xc3\xa9sum\xc3\xa9', u'\xfcp', 3)])
+        t.setFilter(u'NA\xcf')
+        self.assertEquals([1], t.view)
+        t.clearFilter()
+        self.assert_(t.jumpTo(u'caf\xe9 up'))
+        self.assertEquals(0, t.highlighted)
+        self.assertEquals(u'r\xe9sum\xe9 \xfcp 3', t._get_repr(t[2]))
+
+    def testFilterBy(self):
+        t = self.makeTable([('host%02d' % i, ('up', 'down')[i % 3 == 0], i)
+                            for i in range(30)])
+        t.addColumn(fixedsize=4, name='load')
+        t.move(4)
+        t.filterBy((1, '==', 'up'), (2, 'range', (5, 20)))
+        self.assertEquals([5, 7, 8, 10, 11, 13, 14, 16, 17, 19], t.view)
+        self.assert_((1, 'hash') in t._colIndexes)
+
+        # narrowing the filter only checks the rows already shown
+        t.filterBy((1, '==', 'up'), (2, 'range', (5, 20)), (0, 'contains', 'HOST1'))
+        self.assertEquals([10, 11, 13, 14, 16, 17, 19], t.view)
+
+        # the indexes follow changes to the rows
+        t.move(2)
+        t.insert(0, ('host1x', 'up', 12))
+        t.pop(11)
+        self.assertEquals([0, 11, 13, 14, 16, 17, 19], t.view)
+        self.assertEquals(('host13', 'up', 13), t.getHighlightedItem())
+
+        t.filterBy((2, 'in', [0, 3]))
+        self.assertEquals([('host00', 'down', 0), ('host03', 'down', 3)],
+                          [t[i] for i in t.view])
+        t.filterBy()
+        self.assertEquals(None, t.view)
+
+    def testUpsert(self):
+        self.scr.set_input('x', 'x', 'esc')
+
+        e = dtk.Engine()
+        t = self.makeTable([('host%02d' % i, 'up') for i in range(40)])
+        t.setKey(0)
+        e.setRoot(t)
+
+        drawn = []
+        def draw(str, row, col, **kwargs):
+            drawn.append(row)
+
+        def refresh():
+            del drawn[:]
+            t.draw = draw
+            t.upsert([('host05', 'down'), ('host02', 'down'), ('host40', 'up')])
+        e.bindKey('x', refresh)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # only the rows which changed are redrawn
+        self.assertEquals([4, 7], drawn)
+        self.assertEquals(('host00', 'up'), t.getHighlightedItem())
+        self.assertEquals(41, len(t))
+
+        t.filterBy((1, '==', 'down'))
+        self.assertEquals([2, 5], t.view)
+        t.upsert([('host03', 'down')])
+        self.assertEquals([2, 3, 5], t.view)
+        t.extend([('host41', 'down'), ('host42', 'up')])
+        self.assertEquals([2, 3, 5, 41], t.view)
+
+        # keyed updates are made in one batch, not row by row
+        t._spliced = None
+        t.upsert([('host06', 'down'), ('host07', 'down'), ('host03', 'up')])
+        del t._spliced
+        self.assertEquals([2, 5, 6, 7, 41], t.view)
+
+        self.assertEquals([('host02', 'down'), ('host05', 'down')],
+                          t.delete(['host02', 'host05', 'nosuchhost']))
+        self.assertEquals(3, t.indexOfKey('host04'))
+        self.assertEquals(38, t.indexOfKey('host40'))
+
+        # rows replaced by key stay selected, in a batch or not
+        t.clearFilter()
+        t.moveToTop()
+        t.toggleSelect()
+        t.upsert([('host00', 'down')])
+        self.assertEquals([('host00', 'down')], t.getSelectedItems())
+        batch = t.batch()
+        batch.__enter__()
+        t.upsert([('host00', 'up'), ('host01', 'down')])
+        batch.__exit__(None, None, None)
+        self.assertEquals([('host00', 'up')], t.getSelectedItems())
+        t.delete(['host00'])
+        self.assertEquals([], t.getSelectedItems())
+
+    def testAggregates(self):
+        t = self.makeTable([('host%02d' % i, ('up', 'down')[i % 2], i) for i in range(10)])
+        t.addColumn(fixedsize=6, name='load')
+        t.setAggregates({0: 'count', 2: 'sum'})
+        self.assertEquals({0: 10, 2: 45}, t.getAggregates())
+
+        t.filterBy((1, '==', 'up'))
+        self.assertEquals({0: 5, 2: 20}, t.getAggregates())
+
+        # rows changing in place, coming and going all update the totals
+        t.setKey(0)
+        t.upsert([('host02', 'up', 12), ('host03', 'up', 3), ('host10', 'down', 100)])
+        self.assertEquals({0: 6, 2: 33}, t.getAggregates())
+
+        # rows coming and going under the filter are merged into the
+        # summaries of the view, rather than summarizing it again
+        summaries = t._viewSummaries
+        t.extend([('host11', 'up', 7), ('host12', 'down', 50)])
+        self.assertEquals({0: 7, 2: 40}, t.getAggregates())
+        t.delete(['host11', 'host12'])
+        self.assertEquals({0: 6, 2: 33}, t.getAggregates())
+        self.assert_(t._viewSummaries is summaries)
+        t.clearFilter()
+        t.delete(['host04', 'host05'])
+        self.assertEquals({0: 9, 2: 146}, t.getAggregates())
+
+        t.setAggregates({2: 'max'})
+        self.assertEquals({2: 100}, t.getAggregates())
+        t.pop()
+        self.assertEquals({2: 12}, t.getAggregates())
+
+        # small batches are put in place, large ones sorted in
+        t.setAggregates({2: 'min'})
+        t.upsert([('host01', 'down', -1), ('host20', 'up', -2)])
+        self.assertEquals({2: -2}, t.getAggregates())
+        t.extend([('big%03d' % i, 'up', 100 - i) for i in range(100)])
+        self.assertEquals({2: -2}, t.getAggregates())
+        t.delete(['host20'])
+        self.assertEquals({2: -1}, t.getAggregates())
+        values = t._summaries[2].values
+        self.assertEquals(sorted(values), values)
+
+    def testFooterRedraw(self):
+        self.scr.set_input('u', 'a', 'esc')
+
+        e = dtk.Engine()
+        t = dtk.TextTable()
+        t.addColumn(fixedsize=8, name='host')
+        t.addColumn(fixedsize=8, name='load')
+        t.setItems([('h%02d' % i, i) for i in range(30)])
+        t.setKey(0)
+        t.setAggregates({1: 'sum'})
+        e.setRoot(t)
+        e.bindKey('u', lambda: t.upsert([('h25', 1000)]))
+        e.bindKey('a', lambda: t.append(('h99', 5)))
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # the rows changed are off screen, the footer still follows
+        self.assertTextAt(23, 9, '435     ', 1)
+        self.assertTextAt(23, 9, '1410    ', 2)
+        self.assertTextAt(23, 9, '1415    ', 3)
+
+    def testFormattedFooter(self):
+        self.scr.set_input('esc')
+
+        e = dtk.Engine()
+        t = dtk.TextTable()
+        t.addColumn(fixedsize=8, name='host', formatter=lambda name: name.upper())
+        t.addColumn(fixedsize=8, name='since', formatter=dtk.dateFormatter('%Y'))
+        t.addColumn(fixedsize=8, name='when', formatter=dtk.dateFormatter('%Y'))
+        t.setItems([('a', 0, 10), ('b', 86400 * 366, 20), ('c', 86400 * 800, 30)])
+        t.setAggregates({0: 'count', 1: 'max', 2: 'mean'})
+        e.setRoot(t)
+        e.bindKey('esc', e.quit)
+        e.mainLoop()
+
+        # counts and means are numbers, whatever the column shows
+        self.assertTextAt(23, 0, '3        1972     20      ', 1)
+
+        t.setItems([('a', 0, 10), ('b', 0, 15)])
+        self.assertEquals('12.50', t._aggregateText(t.getAggregates()[2]))
+
+    def testSQLiteModel(self):
+        import sqlite3
+
+        db = sqlite3.connect(':memory:', check_same_thread=False)
+        db.execute('CREATE TABLE hosts (name TEXT, status TEXT, load REAL)')
+        db.executemany('INSERT INTO hosts VALUES (?, ?, ?)',
+                       [('host%03d' % i, ('up', 'down')[i % 4 == 0], i / 10.0)
+                        for i in range(500)])
+
+        model = dtk.SQLiteModel(db, 'hosts', ['name', 'status', 'load'], pageSize=20)
+        t = self.makeTable([])
+        t.addColumn(fixedsize=6, name='load')
+        t.setItems(model)
+
+        self.assertEquals(500, len(t))
+        self.assertEquals((u'host042', u'up', 4.2), t[42])
+
+        # the pages either side are fetched ahead
+        model._queue.join()
+        self.assert_(1 in model._pages and 3 in model._pages)
+        self.assertEquals((u'host060', u'down', 6.0), t[60])
+
+        t.filterBy((1, '==', 'down'), (2, 'range', (10, None)))
+        self.assertEquals(100, len(t))
+        self.assertEquals(None, t.view)
+        t.sortBy([(0, True)])
+        self.assertEquals([u'host496', u'host492'], [row[0] for row in t[:2]])
+
+        # later pages follow on from the last row of the page before
+        model.pageSize = 10
+        model.refresh()
+        self.assertEquals([u'host416', u'host412'], [row[0] for row in t[20:22]])
+        thread = model._thread
+        model.close()
+        self.failIf(thread.isAlive())
+
+        # rows with NULLs, which come last in descending order, are
+        # not skipped when paging on from a row without
+        db.execute('CREATE TABLE jobs (name TEXT, prio INTEGER)')
+        db.executemany('INSERT INTO jobs VALUES (?, ?)',
+                       [('job%02d' % i, (i % 3 and i % 5 or None)) for i in range(40)])
+        model = dtk.SQLiteModel(db, 'jobs', ['name', 'prio'], pageSize=4, prefetch=False)
+        for order in ([(1, True)], [(1, True), (0, True)], [(1, False)]):
+            model.sort(order)
+            terms = ['%s %s' % (('name', 'prio', 'rowid')[col], ('ASC', 'DESC')[d])
+                     for (col, d) in order + [(2, order[0][1])]]
+            sql = 'SELECT name, prio FROM jobs ORDER BY ' + ', '.join(terms)
+            expected = [tuple(row) for row in db.execute(sql)]
+            self.assertEquals(expected, [model[i] for i in range(len(model))])
+
+    def testCSVModel(self):
+        import os
+        import tempfile
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        out = os.fdopen(fd, 'w')
+        out.write('name,status,note\n')
+        for i in range(100):
+            if i == 50:
+                out.write('host050,up,"two\nlines, quoted"\n')
+            else:
+                out.write('host%03d,%s,\n' % (i, ('up', 'down')[i % 4 == 0]))
+        out.close()
+
+        class SmallModel(dtk.CSVModel):
+            blockSize = 8
+            chunkSize = 64
+
+        try:
+            model = SmallModel(path, header=True, cacheBlocks=2)
+            self.assertEquals(['name', 'status', 'note'], model.header)
+
+            # nothing is shown until update() says so
+            model._thread.join()
+            self.assertEquals(0, len(model))
+            self.assertEquals(100, model.update())
+            self.assertEquals(100, len(model))
+            self.assert_(model.done)
+
+            self.assertEquals(('host050', 'up', 'two\nlines, quoted'), model[50])
+            self.assertEquals(('host099', 'up', ''), model[-1])
+            self.assertEquals(('host008', 'down', ''), model[8])
+            self.assertEquals(2, len(model._cache))
+            model.close()
+
+            e = dtk.Engine()
+            t = dtk.TextTable()
+            model = t.loadCSV(path)
+            self.assertEquals(['name', 'status', 'note'], t.colnames)
+
+            progress = []
+            t.bindEvent(dtk.LoadProgress, lambda event: progress.append(event.rows))
+
+            # a sort waits for the whole file, and nothing can be
+            # removed until then
+            t.sortBy([(0, True)])
+            self.assert_(t.items is model)
+            self.assertRaises(ValueError, t.removeMany, [0])
+
+            model._thread.join()
+            e.runTasks()
+            e.processEvents()
+            self.assertEquals([100], progress)
+            self.assertEquals(100, len(t))
+            self.assertEquals([], e.tasks)
+            self.assertEquals('host099', t[0][0])
+
+            t.filterBy((1, '==', 'down'))
+            self.assertEquals(25, len(t.view))
+            model.close()
+        finally:
+            os.remove(path)
+
+    def testRaggedCSV(self):
+        import os
+        import tempfile
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        out = os.fdopen(fd, 'w')
+        out.write('a,b,c\n1,2,3\n\n4,5\n6,7,8\n')
+        out.close()
+
+        self.scr.set_input('esc')
+        try:
+            e = dtk.Engine()
+            t = dtk.TextTable()
+            model = t.loadCSV(path)
+            model._thread.join()
+            e.runTasks()
+            e.bindKey('esc', e.quit)
+            e.setRoot(t)
+            e.mainLoop()
+
+            # blank and short rows have nothing in their missing cells
+            self.assertEquals(4, len(t))
+            self.assertEquals(['2', None, '5'], model.column(1, 0, 3))
+            self.assertEquals(['3', None, None, '8'], model.column(2))
+
+            t.filterBy((2, '==', '8'))
+            self.assertEquals([3], t.view)
+            t.clearFilter()
+            t.sortBy([2])
+            self.assertEquals([(), ('4', '5'), ('1', '2', '3'), ('6', '7', '8')], t[:])
+            model.close()
+        finally:
+            os.remove(path)